@@ -1,18 +1,19 @@
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from pkg_resources import resource_filename
-import re
+import sys
 from textwrap import dedent, fill
 
-from cookiecutter.main import cookiecutter
-from git import Repo
-from pre_commit.commands.install_uninstall import install
-from pre_commit.constants import HOOK_TYPES
-from pre_commit.store import Store
+try:
+    from importlib.resources import files
+except ImportError:
+    # Python < 3.9
+    from importlib_resources import files
 
+from cookiecutter_qtim.batch import load_answers, resolve_projects, run_batch
 from cookiecutter_qtim.dependencies import (
-    get_package_version,
-    get_package_versions,
+    PackageVersionPrefetcher,
+    PYPI_CACHE_TTL,
     PACKAGES_REQUIRED,
     PACKAGES_DEV_REQUIRED,
     PACKAGES_OPTIONAL,
@@ -22,11 +23,27 @@ from cookiecutter_qtim.docker import (
     find_docker_image_python_version,
     get_latest_nvidia_cuda_image
 )
+from cookiecutter_qtim.hooks import install_hook_environments
+from cookiecutter_qtim.project import (
+    build_extra_context,
+    create_project,
+    FALLBACK_DOCKER_IMAGE,
+    GIT_URL,
+    validate_directory,
+    validate_docker_image,
+    validate_github_path,
+    validate_project_name,
+    validate_python_version,
+)
+from cookiecutter_qtim.update import (
+    CONFLICT,
+    format_update_results,
+    update_project,
+)
 
 
 GIT_HOST = "github.com"
 DOCKER_HOST = "DOCKER_HOST_PLACEHOLDER"
-GIT_URL = "https://github.com"
 
 
 START_MESSAGE = f"""\
@@ -65,7 +82,21 @@ Here are the next steps:
 """
 
 
-FALLBACK_DOCKER_IMAGE = 'nvidia/cuda:11.7.1-cudnn8-runtime-ubuntu22.04'
+# Names of the arguments holding answers for non-interactive mode
+ANSWER_ARGUMENTS = [
+    "project_name",
+    "dataset_dir",
+    "project_dir",
+    "repository",
+    "packages",
+    "dev_packages",
+    "docker_image",
+    "python_version",
+    "short_description",
+    "author",
+    "author_email",
+    "enable_type_checking",
+]
 
 
 def prompt_for_package(package: str) -> bool:
@@ -95,21 +126,146 @@ def format_text(msg: str) -> str:
     return fill(dedent(msg))
 
 
-def get_mac_mountpoint(path: str):
-    """Get the directory on a Mac where a Martinos path will be mounted."""
-    return (
-        path
-        .replace("/autofs/cluster", "/Volumes")
-        .replace("/autofs/vast", "/Volumes")
+def prompt(message: str, validator):
+    """Prompt the user for input until a valid value is entered.
+
+    Parameters
+    ----------
+    message: str
+        Message to display when prompting for input.
+    validator: Callable[[str], Any]
+        Function that validates the input, returning the value to use or
+        raising a ValueError whose message is displayed to the user.
+
+    Returns
+    -------
+    Any:
+        Value returned by the validator for the first valid input.
+
+    """
+    while True:
+        try:
+            return validator(input(message))
+        except ValueError as e:
+            print(format_text(str(e)))
+
+
+def add_answer_arguments(parser: ArgumentParser) -> None:
+    """Add arguments for answers used in non-interactive mode to a parser."""
+    group = parser.add_argument_group(
+        "answers",
+        description=(
+            "Answers used in non-interactive mode. When used with --answers, "
+            "these give default values for answers missing from the file."
+        )
+    )
+    group.add_argument("--project-name", dest="project_name")
+    group.add_argument("--dataset-dir", dest="dataset_dir")
+    group.add_argument("--project-dir", dest="project_dir")
+    group.add_argument(
+        "--repository",
+        dest="repository",
+        help=f"Path of the repository on {GIT_URL}, e.g. 'QTIM-Lab/project'."
+    )
+    group.add_argument(
+        "--package",
+        dest="packages",
+        action="append",
+        choices=PACKAGES_OPTIONAL,
+        help="Optional package to include. May be given multiple times."
+    )
+    group.add_argument(
+        "--dev-package",
+        dest="dev_packages",
+        action="append",
+        choices=PACKAGES_DEV_OPTIONAL,
+        help="Optional dev package to include. May be given multiple times."
     )
+    group.add_argument("--docker-image", dest="docker_image")
+    group.add_argument("--python-version", dest="python_version")
+    group.add_argument("--description", dest="short_description")
+    group.add_argument("--author", dest="author")
+    group.add_argument("--author-email", dest="author_email")
+    group.add_argument(
+        "--type-checking",
+        dest="enable_type_checking",
+        action="store_const",
+        const=True,
+        help="Enable type checking with mypy."
+    )
+
+
+def main_non_interactive(args, template_dir: str) -> None:
+    """Create projects without prompting, using answers from file or flags."""
+    flag_answers = {
+        key: getattr(args, key)
+        for key in ANSWER_ARGUMENTS
+        if getattr(args, key) is not None
+    }
+    if args.answers is not None:
+        answers = [
+            {**flag_answers, **project_answers}
+            for project_answers in load_answers(args.answers)
+        ]
+    else:
+        answers = [flag_answers]
+
+    try:
+        contexts = resolve_projects(
+            answers,
+            offline=args.offline,
+            refresh=args.refresh,
+            cache_ttl=args.cache_ttl,
+        )
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+
+    success = run_batch(
+        contexts,
+        template_dir,
+        output_dir=args.output_dir,
+        jobs=args.jobs,
+        install_hooks=args.install_hooks or args.hook_seed is not None,
+        hook_seed=args.hook_seed,
+    )
+    if not success:
+        sys.exit(1)
+
+
+def main_update(args, template_dir: str) -> None:
+    """Apply the current template to existing projects."""
+    success = True
+    for project_dir in args.update:
+        print(f"{project_dir}:")
+        try:
+            results = update_project(
+                project_dir,
+                template_dir,
+                dry_run=args.dry_run,
+            )
+        except (ValueError, RuntimeError) as e:
+            print(f"Failed to update: {e}\n")
+            success = False
+            continue
+        print(format_update_results(results) + "\n")
+        if any(result.action == CONFLICT for result in results):
+            success = False
+
+    if not args.dry_run:
+        print(
+            "Review the changes with 'git diff' and resolve any conflicts "
+            "before committing."
+        )
+    if not success:
+        sys.exit(1)
 
 
 def main():
     # Automatically find the location of the template directory, wherever it
     # was installed on the system
-    template_dir = resource_filename(
-        "cookiecutter_qtim",
-        "cookiecutters/cookiecutter-ml-proj"
+    template_dir = str(
+        files("cookiecutter_qtim") / "cookiecutters" / "cookiecutter-ml-proj"
     )
 
     parser = ArgumentParser("Create a new project directory.")
@@ -120,20 +276,128 @@ def main():
         default=Path('.'),
         help="Parent of output project directory."
     )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help=(
+            "Do not make any network requests. Package versions and docker "
+            "images are found from the local cache only."
+        )
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help=(
+            "Update cached package versions and docker images before using "
+            "them."
+        )
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=PYPI_CACHE_TTL,
+        help=(
+            "Time in seconds for which cached package versions and docker "
+            "images are used without checking for updates."
+        )
+    )
+    parser.add_argument(
+        "--answers",
+        "-a",
+        type=Path,
+        help=(
+            "YAML or JSON file containing answers for one or more projects. "
+            "Projects are created without prompting for input."
+        )
+    )
+    parser.add_argument(
+        "--no-input",
+        action="store_true",
+        help=(
+            "Do not prompt for input. Answers must be given using --answers "
+            "and/or the answer arguments below."
+        )
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        help=(
+            "Number of projects to create in parallel in non-interactive "
+            "mode. Defaults to the number of CPUs."
+        )
+    )
+    parser.add_argument(
+        "--install-hooks",
+        action="store_true",
+        help=(
+            "Build the environments of the project's pre-commit hooks while "
+            "creating it, so that the first commit does not have to. "
+            "Environments are shared between projects using the same hooks."
+        )
+    )
+    parser.add_argument(
+        "--hook-seed",
+        type=Path,
+        metavar="STORE_DIR",
+        help=(
+            "Copy any hook repositories and environments missing from the "
+            "pre-commit store from this pre-commit store directory before "
+            "building the hook environments (implies --install-hooks). This "
+            "allows hooks to be installed without network access."
+        )
+    )
+    parser.add_argument(
+        "--update",
+        "-u",
+        type=Path,
+        nargs="+",
+        metavar="PROJECT_DIR",
+        help=(
+            "Apply the current version of the template to one or more "
+            "existing projects instead of creating a new project."
+        )
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="With --update, list the changes without making them."
+    )
+    add_answer_arguments(parser)
     args = parser.parse_args()
 
+    if args.update is not None:
+        main_update(args, template_dir)
+        return
+
+    if args.answers is not None or args.no_input:
+        main_non_interactive(args, template_dir)
+        return
+
+    # Start looking up the base image and the versions of the packages that
+    # are always needed in the background, while the user answers the prompts
+    cache_ttl = 0 if args.refresh else args.cache_ttl
+    prefetcher = PackageVersionPrefetcher(
+        cache_ttl=cache_ttl,
+        offline=args.offline,
+    )
+    prefetcher.prefetch(
+        PACKAGES_REQUIRED + PACKAGES_DEV_REQUIRED + ["pip", "setuptools"]
+    )
+    docker_executor = ThreadPoolExecutor(max_workers=1)
+    docker_image_future = docker_executor.submit(
+        get_latest_nvidia_cuda_image,
+        refresh=args.refresh,
+        max_age=args.cache_ttl,
+        offline=args.offline,
+    )
+
     print(START_MESSAGE)
     print(
         "Enter a project name consisting of lower case letters, numbers "
         "and hyphens."
     )
-    project_name_exp = re.compile(r"[a-z][a-z0-9\-]*[a-z0-9]")
-    while True:
-        project_name = input("Project Name: ")
-        if project_name_exp.fullmatch(project_name) is not None:
-            break
-        else:
-            print("Invalid name.")
+    project_name = prompt("Project Name: ", validate_project_name)
     project_slug = project_name.replace('-', '_')
     print(
         f"The name of your project is {project_name} and the name of the "
@@ -148,17 +412,7 @@ def main():
         /autofs/cluster/qtim/datasets/public/BraTS2020
     """
     print(format_text(msg))
-    path_exp = re.compile(r"[a-zA-Z0-9_.\-/]+")
-    while True:
-        project_dataset_dir = input(f"Dataset directory: ")
-        if path_exp.fullmatch(project_dataset_dir):
-            if Path(project_dataset_dir).is_absolute():
-                break
-            print("Path must be an absolute path")
-            continue
-        print("Invalid characters found in path.")
-    project_dataset_dir = str(Path(project_dataset_dir))
-    mac_project_dataset_dir = get_mac_mountpoint(project_dataset_dir)
+    project_dataset_dir = prompt("Dataset directory: ", validate_directory)
 
     print()
     msg = f"""\
@@ -168,19 +422,7 @@ def main():
         /autofs/cluster/qtim/projects/brainmets
     """
     print(format_text(msg))
-    path_exp = re.compile(r"[a-zA-Z0-9_.\-/]+")
-    while True:
-        project_dir = input(f"Project directory: ")
-        if path_exp.fullmatch(project_dir):
-            if Path(project_dir).is_absolute():
-                break
-            print("Path must be an absolute path")
-            continue
-        print("Invalid characters found in path.")
-    project_dir = str(Path(project_dir))
-    mac_project_dir = get_mac_mountpoint(project_dir)
-
-    container_path = str(Path(project_dir) / "containers")
+    project_dir = prompt("Project directory: ", validate_directory)
 
     msg = f"""\
         You should now create the repository on {GIT_URL} to host the
@@ -189,18 +431,10 @@ def main():
     """
     print()
     print(format_text(msg))
-    git_url_exp = re.compile(r"[a-zA-Z0-9_.\-/]+")
-    while True:
-        github_path = input(f"Repository URL: {GIT_URL}/")
-        if git_url_exp.fullmatch(github_path):
-            git_url = f"{GIT_URL}/{github_path}"
-            break
-        else:
-            print("Invalid URL.")
-    if git_url.endswith('.git'):
-        git_url = git_url[:-4]
-
-    container_tag = project_name
+    github_path, git_url = prompt(
+        f"Repository URL: {GIT_URL}/",
+        validate_github_path,
+    )
 
     # Query the PyPI API to get most recent versions of listed packages
     msg = """\
@@ -210,10 +444,16 @@ def main():
     """
     print()
     print(format_text(msg))
-    selected_packages = [p for p in PACKAGES_OPTIONAL if prompt_for_package(p)]
-    selected_packages_dev = [
-        p for p in PACKAGES_DEV_OPTIONAL if prompt_for_package(p)
-    ]
+    selected_packages = []
+    for package in PACKAGES_OPTIONAL:
+        if prompt_for_package(package):
+            selected_packages.append(package)
+            prefetcher.prefetch([package])
+    selected_packages_dev = []
+    for package in PACKAGES_DEV_OPTIONAL:
+        if prompt_for_package(package):
+            selected_packages_dev.append(package)
+            prefetcher.prefetch([package])
 
     msg = """\
         You will now choose a base image to use for your project's docker
@@ -226,7 +466,7 @@ def main():
     print()
     print(format_text(msg))
     try:
-        recommended_docker_image = get_latest_nvidia_cuda_image()
+        recommended_docker_image = docker_image_future.result()
     except Exception as e:
         print(e)
         msg = f"""\
@@ -244,31 +484,15 @@ def main():
         print()
         print(format_text(msg))
 
-    docker_image_exp = re.compile(r'[a-zA-Z0-9-_:\./]+')
-    while True:
-        selected_docker_image = input(
-            f"Select a Docker base image [{recommended_docker_image}]: "
-        )
-        if selected_docker_image == '':
-            selected_docker_image = recommended_docker_image
-            break
-        if docker_image_exp.fullmatch(selected_docker_image) is None:
-            msg = f"""
-                '{selected_docker_image}' is not a valid docker image name.
-            """
-            print(format_text(msg))
-            continue
-        if (
-            ':' in selected_docker_image and
-            ':latest' not in selected_docker_image
-        ):
-            break
-        else:
-            msg = """"
-                The selected docker image must include a full tag (not just
-                ':latest').
-            """
-            print(format_text(msg))
+    def _validate_docker_image_or_default(docker_image: str) -> str:
+        if docker_image == '':
+            return recommended_docker_image
+        return validate_docker_image(docker_image)
+
+    selected_docker_image = prompt(
+        f"Select a Docker base image [{recommended_docker_image}]: ",
+        _validate_docker_image_or_default,
+    )
 
     # Try to deduce the python version from the docker image
     msg = """\
@@ -279,7 +503,8 @@ def main():
     print()
     print(format_text(msg))
     recommended_python_version = find_docker_image_python_version(
-        selected_docker_image
+        selected_docker_image,
+        offline=args.offline,
     )
     if recommended_python_version is not None:
         msg = f"""\
@@ -291,58 +516,55 @@ def main():
         msg = "Could not automatically deduce Python version."
     print()
     print(format_text(msg))
-    python_version_exp = re.compile(r'3\.[1-9][0-9]*')
-    while True:
-        if recommended_python_version is not None:
-            selected_python_version = input(
-                f"Select a Python version [{recommended_python_version}]: "
-            )
-            if selected_python_version == '':
-                selected_python_version = recommended_python_version
-        else:
-            selected_python_version = input(
-                "Select a Python version: "
-            )
-        if python_version_exp.fullmatch(selected_python_version) is not None:
-            break
-        else:
-            print(
-                f"{selected_python_version} is not a valid Python 3 version."
-            )
 
-    extra_context = {
-        "__project_name": project_name,
-        "__project_slug": project_slug,
-        "__repository_url": git_url,
-        "__package_versions": get_package_versions(
-            PACKAGES_REQUIRED + selected_packages
-        ),
-        "__package_versions_dev": get_package_versions(
-            PACKAGES_DEV_REQUIRED + selected_packages_dev
-        ),
-        "__pip_version": get_package_version("pip"),
-        "__setuptools_version": get_package_version("setuptools"),
-        "__docker_base_image": selected_docker_image,
-        "__python_version": selected_python_version,
-        "__github_project_path": github_path,
-        "__project_path": project_dir,
-        "__data_path": project_dataset_dir,
-        "__container_path": container_path,
-        "__mac_project_path": mac_project_dir,
-        "__mac_data_path": mac_project_dataset_dir,
-        "__project_slug": project_slug,
-        "__container_tag": container_tag,
-    }
+    def _validate_python_version_or_default(python_version: str) -> str:
+        if python_version == '' and recommended_python_version is not None:
+            return recommended_python_version
+        return validate_python_version(python_version)
+
+    if recommended_python_version is not None:
+        python_version_message = (
+            f"Select a Python version [{recommended_python_version}]: "
+        )
+    else:
+        python_version_message = "Select a Python version: "
+    selected_python_version = prompt(
+        python_version_message,
+        _validate_python_version_or_default,
+    )
+
+    # Collect the package versions, waiting for any lookups still outstanding
+    runtime_packages = PACKAGES_REQUIRED + selected_packages
+    dev_packages = PACKAGES_DEV_REQUIRED + selected_packages_dev
+    versions = prefetcher.get(
+        runtime_packages + dev_packages + ["pip", "setuptools"]
+    )
+    prefetcher.shutdown()
+    docker_executor.shutdown(wait=False)
+
+    extra_context = build_extra_context(
+        project_name=project_name,
+        project_dir=project_dir,
+        project_dataset_dir=project_dataset_dir,
+        github_path=github_path,
+        git_url=git_url,
+        docker_image=selected_docker_image,
+        python_version=selected_python_version,
+        package_versions={p: versions[p] for p in runtime_packages},
+        package_versions_dev={p: versions[p] for p in dev_packages},
+        pip_version=versions["pip"],
+        setuptools_version=versions["setuptools"],
+    )
 
     print()
     print(
         "You will now be prompted for some basic information about the "
         "project."
     )
-    repo_dir = cookiecutter(
+    repo_dir = create_project(
         template_dir,
         output_dir=args.output_dir,
-        extra_context=extra_context
+        extra_context=extra_context,
     )
 
     print()
@@ -350,24 +572,29 @@ def main():
         "Your project repository was successfully created at "
         f"{repo_dir}!"
     )
-
-    # Initialize git in repository and add all files
-    repo = Repo.init(repo_dir, initial_branch="main")
-    repo.create_remote("origin", git_url)
-    repo.git.add(all=True)
-
     print(f"Git repository initialized in {repo_dir}.")
     print(f"Remote 'origin' added at {git_url}.")
     print("All files added to git repository, but not committed.")
-
-    print()
-    print("Installing pre-commit hooks...")
-    install(
-        config_file=Path(repo_dir) / ".pre-commit-config.yaml",
-        store=Store(),
-        hook_types=HOOK_TYPES,
-        git_dir=Path(repo_dir) / '.git',
-    )
+    print("Pre-commit hooks installed.")
+
+    if args.install_hooks or args.hook_seed is not None:
+        print("Building pre-commit hook environments...")
+        try:
+            n_built, elapsed = install_hook_environments(
+                [Path(repo_dir) / ".pre-commit-config.yaml"],
+                seed_dir=args.hook_seed,
+            )
+        except (ValueError, RuntimeError) as e:
+            print(e)
+            print(
+                "The remaining environments will be built on the first "
+                "commit."
+            )
+        else:
+            print(
+                f"Built {n_built} pre-commit hook environment(s) in "
+                f"{elapsed:.1f}s."
+            )
 
     print()
     print(
@@ -375,3 +602,7 @@ def main():
             selected_python_version=selected_python_version
         )
     )
+
+
+if __name__ == "__main__":
+    main()
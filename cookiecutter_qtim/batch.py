@@ -0,0 +1,511 @@
+"""Non-interactive creation of projects from an answers file."""
+from concurrent.futures import as_completed, ProcessPoolExecutor
+import os
+from pathlib import Path
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from cookiecutter_qtim.dependencies import (
+    get_package_versions,
+    PACKAGES_REQUIRED,
+    PACKAGES_DEV_REQUIRED,
+    PACKAGES_OPTIONAL,
+    PACKAGES_DEV_OPTIONAL,
+    PYPI_CACHE_TTL,
+)
+from cookiecutter_qtim.docker import (
+    find_docker_image_python_version,
+    get_latest_nvidia_cuda_image,
+)
+from cookiecutter_qtim.hooks import install_hook_environments
+from cookiecutter_qtim.project import (
+    build_extra_context,
+    create_project,
+    FALLBACK_DOCKER_IMAGE,
+    validate_directory,
+    validate_docker_image,
+    validate_github_path,
+    validate_project_name,
+    validate_python_version,
+)
+
+
+# Answers that must be given for every project
+REQUIRED_ANSWERS = [
+    'project_name',
+    'dataset_dir',
+    'project_dir',
+    'repository',
+    'short_description',
+    'author',
+    'author_email',
+]
+
+# Answers that may be omitted, and their default values
+OPTIONAL_ANSWERS = {
+    'packages': [],
+    'dev_packages': [],
+    'docker_image': None,
+    'python_version': None,
+    'enable_type_checking': False,
+}
+
+
+def load_answers(path: Path) -> List[Dict[str, Any]]:
+    """Load answers for one or more projects from a YAML or JSON file.
+
+    The file may contain either a mapping of answers for a single project, or
+    a mapping with a ``projects`` item containing a list of such mappings,
+    and optionally a ``defaults`` item containing answers shared by all
+    projects.
+
+    The answers for each project are ``project_name``, ``dataset_dir``,
+    ``project_dir``, ``repository`` (path of the github repository, e.g.
+    'QTIM-Lab/project'), ``short_description``, ``author`` and
+    ``author_email`` (all required), and ``packages`` and ``dev_packages``
+    (lists of optional packages to include), ``docker_image``,
+    ``python_version`` and ``enable_type_checking`` (all optional).
+
+    Parameters
+    ----------
+    path: pathlib.Path
+        Path to the answers file. Since JSON is a subset of YAML, either
+        format may be used.
+
+    Returns
+    -------
+    List[Dict[str, Any]]:
+        List of answers for each project.
+
+    """
+    import yaml
+
+    with Path(path).open("r") as f:
+        obj = yaml.safe_load(f)
+
+    if not isinstance(obj, dict):
+        raise ValueError(f"Answers file {path} must contain a mapping.")
+
+    if 'projects' not in obj:
+        return [obj]
+
+    defaults = obj.get('defaults', {})
+    projects = obj['projects']
+    if not isinstance(defaults, dict) or not isinstance(projects, list):
+        raise ValueError(
+            f"In answers file {path}, 'defaults' must be a mapping and "
+            "'projects' must be a list."
+        )
+    for project in projects:
+        if not isinstance(project, dict):
+            raise ValueError(
+                f"In answers file {path}, each item of 'projects' must be a "
+                "mapping."
+            )
+    return [{**defaults, **project} for project in projects]
+
+
+def _validate_answers(answers: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate the answers for a single project.
+
+    All errors are collected and reported together in a single ValueError.
+    The returned answers have had default values filled in.
+
+    """
+    errors = []
+
+    unknown = set(answers) - set(REQUIRED_ANSWERS) - set(OPTIONAL_ANSWERS)
+    for key in sorted(unknown):
+        errors.append(f"Unknown answer '{key}'.")
+    missing = [key for key in REQUIRED_ANSWERS if answers.get(key) is None]
+    for key in missing:
+        errors.append(f"Missing required answer '{key}'.")
+    if len(missing) > 0:
+        raise ValueError(" ".join(errors))
+
+    validated = {**OPTIONAL_ANSWERS, **answers}
+
+    def _check(key, validator):
+        value = validated[key]
+        if value is None:
+            return
+        # YAML parses unquoted values such as 3.10 as numbers, which would
+        # otherwise be silently converted to a different string (3.1)
+        if not isinstance(value, str):
+            errors.append(
+                f"{key}: {value!r} must be a string, quote it in the answers "
+                "file."
+            )
+            return
+        try:
+            validated[key] = validator(value)
+        except ValueError as e:
+            errors.append(f"{key}: {e}")
+
+    _check('project_name', validate_project_name)
+    _check('dataset_dir', validate_directory)
+    _check('project_dir', validate_directory)
+    _check('docker_image', validate_docker_image)
+    _check('python_version', validate_python_version)
+    try:
+        validated['github_path'], validated['git_url'] = validate_github_path(
+            str(validated['repository'])
+        )
+    except ValueError as e:
+        errors.append(f"repository: {e}")
+
+    for key, allowed in [
+        ('packages', PACKAGES_OPTIONAL),
+        ('dev_packages', PACKAGES_DEV_OPTIONAL),
+    ]:
+        for package in validated[key]:
+            if package not in allowed:
+                errors.append(
+                    f"{key}: '{package}' is not one of the optional "
+                    f"packages ({', '.join(allowed)})."
+                )
+
+    type_checking = validated['enable_type_checking']
+    if isinstance(type_checking, str):
+        type_checking = type_checking.lower() in ['y', 'yes', 'true']
+    validated['enable_type_checking'] = 'y' if type_checking else 'n'
+
+    if len(errors) > 0:
+        raise ValueError(" ".join(errors))
+    return validated
+
+
+def resolve_projects(
+    answers: Sequence[Dict[str, Any]],
+    offline: bool = False,
+    refresh: bool = False,
+    cache_ttl: float = PYPI_CACHE_TTL,
+) -> List[Dict[str, Any]]:
+    """Validate answers for a batch of projects and build their contexts.
+
+    All projects are validated before any lookups are made. The latest base
+    image and the versions of the packages used by any of the projects are
+    then looked up once for the whole batch.
+
+    Parameters
+    ----------
+    answers: Sequence[Dict[str, Any]]
+        Answers for each project. See :func:`load_answers`.
+    offline: bool
+        Use cached package versions and docker images only.
+    refresh: bool
+        Update cached package versions and docker images before use.
+    cache_ttl: float
+        Time in seconds for which cached results are used without checking
+        for updates.
+
+    Returns
+    -------
+    List[Dict[str, Any]]:
+        Extra context to render the template with for each project.
+
+    Raises
+    ------
+    ValueError:
+        If the answers for any of the projects are invalid. The message lists
+        all problems found.
+
+    """
+    validated = []
+    errors = []
+    for i, project_answers in enumerate(answers):
+        label = project_answers.get('project_name') or f"#{i + 1}"
+        try:
+            validated.append(_validate_answers(project_answers))
+        except ValueError as e:
+            errors.append(f"  Project {label}: {e}")
+
+    names = [v['project_name'] for v in validated]
+    for name in sorted(set(names)):
+        if names.count(name) > 1:
+            errors.append(f"  Project {name}: name is used more than once.")
+
+    if len(errors) > 0:
+        raise ValueError(
+            "Invalid answers for {} project(s):\n{}".format(
+                len(errors),
+                "\n".join(errors),
+            )
+        )
+
+    # Look up the latest base image only if it is needed
+    recommended_docker_image = None
+    if any(v['docker_image'] is None for v in validated):
+        try:
+            recommended_docker_image = get_latest_nvidia_cuda_image(
+                refresh=refresh,
+                max_age=cache_ttl,
+                offline=offline,
+            )
+        except Exception as e:
+            print(
+                f"Failed to find a suitable image on Dockerhub ({e}), "
+                f"using '{FALLBACK_DOCKER_IMAGE}'."
+            )
+            recommended_docker_image = FALLBACK_DOCKER_IMAGE
+
+    python_versions: Dict[str, Optional[str]] = {}
+    for v in validated:
+        if v['docker_image'] is None:
+            v['docker_image'] = recommended_docker_image
+        if v['python_version'] is None:
+            image = v['docker_image']
+            if image not in python_versions:
+                python_versions[image] = find_docker_image_python_version(
+                    image,
+                    offline=offline,
+                )
+            if python_versions[image] is None:
+                errors.append(
+                    f"  Project {v['project_name']}: could not deduce the "
+                    f"Python version of '{image}', 'python_version' must be "
+                    "given."
+                )
+            v['python_version'] = python_versions[image]
+
+    if len(errors) > 0:
+        raise ValueError(
+            "Invalid answers for {} project(s):\n{}".format(
+                len(errors),
+                "\n".join(errors),
+            )
+        )
+
+    # Query the PyPI API for all packages of all projects in a single batch
+    all_packages = (
+        PACKAGES_REQUIRED +
+        PACKAGES_DEV_REQUIRED +
+        ["pip", "setuptools"] +
+        [p for v in validated for p in v['packages'] + v['dev_packages']]
+    )
+    versions = get_package_versions(
+        all_packages,
+        cache_ttl=0 if refresh else cache_ttl,
+        offline=offline,
+    )
+
+    contexts = []
+    for v in validated:
+        runtime_packages = PACKAGES_REQUIRED + v['packages']
+        dev_packages = PACKAGES_DEV_REQUIRED + v['dev_packages']
+        context = build_extra_context(
+            project_name=v['project_name'],
+            project_dir=v['project_dir'],
+            project_dataset_dir=v['dataset_dir'],
+            github_path=v['github_path'],
+            git_url=v['git_url'],
+            docker_image=v['docker_image'],
+            python_version=v['python_version'],
+            package_versions={p: versions[p] for p in runtime_packages},
+            package_versions_dev={p: versions[p] for p in dev_packages},
+            pip_version=versions["pip"],
+            setuptools_version=versions["setuptools"],
+        )
+        context.update(
+            {
+                "short_description": str(v['short_description']),
+                "author": str(v['author']),
+                "author_email": str(v['author_email']),
+                "enable_type_checking": v['enable_type_checking'],
+            }
+        )
+        contexts.append(context)
+
+    return contexts
+
+
+class ProjectResult(NamedTuple):
+    """Outcome of creating a single project in a batch."""
+
+    project_name: str
+    repo_dir: Optional[str]
+    error: Optional[str]
+    elapsed: float
+
+
+def _silence_worker_output() -> None:
+    """Discard the standard output of a worker process.
+
+    Output from each project (e.g. from pre-commit) would otherwise be
+    interleaved with that of other workers. This redirects the file
+    descriptor itself, since some libraries write to it directly.
+
+    """
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+
+
+def _create_project_timed(
+    template_dir: str,
+    output_dir: Path,
+    context: Dict[str, Any],
+) -> ProjectResult:
+    """Create a project, capturing any error and the time taken.
+
+    This runs within worker processes, so must not raise.
+
+    """
+    start = time.perf_counter()
+    try:
+        repo_dir = create_project(
+            template_dir,
+            output_dir=output_dir,
+            extra_context=context,
+            no_input=True,
+        )
+    except Exception as e:
+        return ProjectResult(
+            project_name=context["__project_name"],
+            repo_dir=None,
+            error=f"{type(e).__name__}: {e}",
+            elapsed=time.perf_counter() - start,
+        )
+    return ProjectResult(
+        project_name=context["__project_name"],
+        repo_dir=str(repo_dir),
+        error=None,
+        elapsed=time.perf_counter() - start,
+    )
+
+
+def format_results_table(results: Sequence[ProjectResult]) -> str:
+    """Format the results of a batch as a table.
+
+    Parameters
+    ----------
+    results: Sequence[ProjectResult]
+        Results for each project.
+
+    Returns
+    -------
+    str:
+        Table listing the status and time taken for each project, along with
+        its location or the error that occurred.
+
+    """
+    name_width = max([len("Project")] + [len(r.project_name) for r in results])
+    lines = [
+        f"{'Project':<{name_width}}  Status  Time (s)  Location / Error",
+    ]
+    for r in results:
+        status = "OK" if r.error is None else "FAILED"
+        detail = r.repo_dir if r.error is None else r.error
+        lines.append(
+            f"{r.project_name:<{name_width}}  {status:<6}  "
+            f"{r.elapsed:>8.1f}  {detail}"
+        )
+    return "\n".join(lines)
+
+
+def run_batch(
+    contexts: Sequence[Dict[str, Any]],
+    template_dir: str,
+    output_dir: Path,
+    jobs: Optional[int] = None,
+    install_hooks: bool = False,
+    hook_seed: Optional[Path] = None,
+) -> bool:
+    """Create a batch of projects without prompting for input.
+
+    Projects are created in parallel in a pool of worker processes. A failure
+    to create one project is reported and does not prevent the others from
+    being created. A table summarizing the results is printed at the end.
+    Optionally, the pre-commit hook environments of the created projects are
+    then built, once for all projects that share them.
+
+    Parameters
+    ----------
+    contexts: Sequence[Dict[str, Any]]
+        Extra context for each project. See :func:`resolve_projects`.
+    template_dir: str
+        Path to the cookiecutter template.
+    output_dir: pathlib.Path
+        Parent of the output project directories.
+    jobs: Optional[int]
+        Number of projects to create in parallel. By default, the number of
+        CPUs is used. If 1, projects are created one after the other within
+        the current process.
+    install_hooks: bool
+        Build the pre-commit hook environments of the created projects.
+    hook_seed: Optional[pathlib.Path]
+        Directory of a pre-commit store to seed the store from before
+        building the hook environments.
+
+    Returns
+    -------
+    bool:
+        True if all projects were created successfully.
+
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(contexts)))
+
+    start = time.perf_counter()
+    results = {}
+    if jobs == 1:
+        for context in contexts:
+            result = _create_project_timed(template_dir, output_dir, context)
+            results[result.project_name] = result
+    else:
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_silence_worker_output,
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _create_project_timed,
+                    template_dir,
+                    output_dir,
+                    context,
+                )
+                for context in contexts
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results[result.project_name] = result
+                status = "created" if result.error is None else "FAILED"
+                print(
+                    f"[{len(results)}/{len(contexts)}] "
+                    f"{result.project_name}: {status}"
+                )
+    elapsed = time.perf_counter() - start
+
+    # Report in the original order of the projects
+    ordered_results = [results[c["__project_name"]] for c in contexts]
+    n_failed = sum(r.error is not None for r in ordered_results)
+    print()
+    print(format_results_table(ordered_results))
+    print()
+    print(
+        f"Created {len(contexts) - n_failed} of {len(contexts)} project(s) "
+        f"in {elapsed:.1f}s using {jobs} process(es)."
+    )
+
+    created = [r for r in ordered_results if r.error is None]
+    if install_hooks and len(created) > 0:
+        print("Building pre-commit hook environments...")
+        try:
+            n_built, hooks_elapsed = install_hook_environments(
+                [
+                    Path(r.repo_dir) / ".pre-commit-config.yaml"
+                    for r in created
+                ],
+                seed_dir=hook_seed,
+                max_workers=jobs,
+            )
+        except (ValueError, RuntimeError) as e:
+            print(e)
+            return False
+        print(
+            f"Built {n_built} pre-commit hook environment(s) in "
+            f"{hooks_elapsed:.1f}s."
+        )
+
+    return n_failed == 0
@@ -0,0 +1,99 @@
+"""Utilities for caching the results of network lookups on the local disk."""
+import json
+import os
+from pathlib import Path
+import tempfile
+from typing import Any, Dict, Optional
+
+
+# Environment variable that may be used to override the cache location
+CACHE_DIR_ENV_VAR = "COOKIECUTTER_QTIM_CACHE_DIR"
+
+
+def get_cache_dir(*subdirs: str) -> Path:
+    """Get a directory in the user's cache directory for this package.
+
+    The location is taken from the COOKIECUTTER_QTIM_CACHE_DIR environment
+    variable if it is set, else it is placed within the XDG cache directory
+    ($XDG_CACHE_HOME, or ~/.cache by default). The directory is not created
+    here, but when an entry is first written to it, so that looking up the
+    path never fails.
+
+    Parameters
+    ----------
+    *subdirs: str
+        Sub-directories within the cache directory.
+
+    Returns
+    -------
+    pathlib.Path:
+        Path to the requested cache directory.
+
+    """
+    if CACHE_DIR_ENV_VAR in os.environ:
+        root = Path(os.environ[CACHE_DIR_ENV_VAR])
+    else:
+        xdg_cache_home = os.environ.get("XDG_CACHE_HOME")
+        if xdg_cache_home:
+            root = Path(xdg_cache_home) / "cookiecutter-qtim"
+        else:
+            root = Path.home() / ".cache" / "cookiecutter-qtim"
+    return root.joinpath(*subdirs)
+
+
+def read_json_cache(path: Path) -> Optional[Dict[str, Any]]:
+    """Read a cache entry stored as a JSON file.
+
+    Parameters
+    ----------
+    path: pathlib.Path
+        Path to the cache entry.
+
+    Returns
+    -------
+    Optional[Dict[str, Any]]:
+        Contents of the cache entry, or None if the entry does not exist or
+        could not be read.
+
+    """
+    try:
+        with path.open("r") as jf:
+            obj = json.load(jf)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(obj, dict):
+        return None
+    return obj
+
+
+def write_json_cache(path: Path, obj: Dict[str, Any]) -> None:
+    """Write a cache entry to a JSON file.
+
+    The file is written to a temporary location and then moved into place, so
+    that concurrent readers never see a partially written entry. Failures to
+    write are ignored, since the cache is only an optimization.
+
+    Parameters
+    ----------
+    path: pathlib.Path
+        Path to the cache entry.
+    obj: Dict[str, Any]
+        JSON-serializable contents of the cache entry.
+
+    """
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(
+            dir=path.parent,
+            prefix=f".{path.name}.",
+            suffix=".tmp",
+        )
+        try:
+            with os.fdopen(fd, "w") as jf:
+                json.dump(obj, jf)
+            os.replace(tmp_name, path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+    except OSError:
+        pass
@@ -2,8 +2,14 @@
 # This script is used to build the project docker image, and push it to gitlab
 set -e
 
+# The image's dependencies are installed from the poetry lock file
+if [[ ! -f poetry.lock ]]; then
+    echo "poetry.lock not found, run 'poetry lock' to create it" >&2
+    exit 1
+fi
+
 echo "Building image"
-sudo docker build \
+sudo DOCKER_BUILDKIT=1 docker build \
     -t {{ cookiecutter.__container_tag }} \
     --build-arg BUILD_COMMIT_HASH=`git rev-parse HEAD` \
     .
@@ -1,12 +1,39 @@
 #!/usr/bin/env bash
+# This script builds the singularity image from the project docker image, which
+# must first be built with build_docker.sh. The build is skipped if the docker
+# image has not changed since the singularity image was last built from it,
+# unless the --force option is given.
+set -e
 
-# Export poetry as requirements.txt
-poetry export -o requirements.txt --with dev --without-hashes
-
-# Build the singularity image
+IMAGE_TAG="{{ cookiecutter.__container_tag }}"
 OUTPUT_FILE="{{ cookiecutter.__container_path }}/singularity.sif"
-singularity build --fakeroot $OUTPUT_FILE singularity.recipe
-echo "Built image at $OUTPUT_FILE"
+# Records the ID (a digest of the contents) of the docker image the singularity
+# image was built from
+DIGEST_FILE="${OUTPUT_FILE}.digest"
+
+IMAGE_ID=$(sudo docker images --no-trunc --quiet "$IMAGE_TAG" | head -n 1)
+if [[ -z $IMAGE_ID ]]; then
+    echo "Docker image ${IMAGE_TAG} not found, build it with build_docker.sh first" >&2
+    exit 1
+fi
 
-# Cleanup
-rm requirements.txt
+if [[ $1 != "--force" && -f $OUTPUT_FILE && $(cat "$DIGEST_FILE" 2>/dev/null) == "$IMAGE_ID" ]]; then
+    echo "Image at $OUTPUT_FILE is up to date with docker image ${IMAGE_TAG} (${IMAGE_ID})"
+    exit 0
+fi
+
+# Export the docker image to an archive and build from it, rather than
+# installing everything again, so that both images have the same environment
+WORK_DIR=$(mktemp -d)
+TMP_FILE="${OUTPUT_FILE}.tmp.$$"
+trap 'rm -rf "$WORK_DIR" "$TMP_FILE"' EXIT
+echo "Exporting docker image ${IMAGE_TAG} (${IMAGE_ID})"
+sudo docker save "$IMAGE_TAG" > "${WORK_DIR}/image.tar"
+
+# Build to a temporary file and move it into place, so that a failed build
+# leaves any existing image intact
+mkdir -p "$(dirname "$OUTPUT_FILE")"
+singularity build --fakeroot --force "$TMP_FILE" "docker-archive://${WORK_DIR}/image.tar"
+mv "$TMP_FILE" "$OUTPUT_FILE"
+echo "$IMAGE_ID" > "$DIGEST_FILE"
+echo "Built image at $OUTPUT_FILE"
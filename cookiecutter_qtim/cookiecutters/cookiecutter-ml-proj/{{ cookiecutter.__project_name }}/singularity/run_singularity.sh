@@ -1,6 +1,6 @@
 #!/usr/bin/env bash¬
 
-SIF_FILE="{{ cookiecutter.__project_path }}/singularity.sif"
+SIF_FILE="{{ cookiecutter.__container_path }}/singularity.sif"
 singularity shell \
     --nv \
     --writable-tmpfs \
@@ -1,20 +1,117 @@
 #!/bin/bash
-set -e
+set -eo pipefail
 
-# Clone the main project repo and install the python package
-cd {{ cookiecutter.__project_slug }}/
+START_TIME=$EPOCHREALTIME
+REPO_DIR=$(readlink -f {{ cookiecutter.__project_slug }}/)
 
-# Check out a specific commit according to the environment variable ENTRYPOINT_COMMIT
+# The project package is built once per commit into this directory, and
+# every job using that commit runs it from there, rather than each job
+# installing the package into the shared home directory
+BUILD_CACHE_DIR=${ENTRYPOINT_BUILD_CACHE:-{{ cookiecutter.__container_path }}/builds}
+
+# Maximum time in seconds to wait for another job building the same commit
+BUILD_WAIT=600
+
+log() {
+	echo "[slurm_entrypoint] $*" >&2
+}
+
+# Build the package at a commit into a directory, without modifying the
+# repository's working tree (which other jobs may be using). Each step is
+# checked explicitly, since set -e has no effect within a function whose
+# result is tested. The temporary build directory is stored in BUILD_TMP_DIR,
+# so that it can be removed if the job is killed.
+build_commit() {
+	local commit=$1 dest=$2
+	local tmp_dir
+	tmp_dir=$(mktemp -d "${BUILD_CACHE_DIR}/.${commit}.XXXXXX") || return 1
+	BUILD_TMP_DIR=$tmp_dir
+	# Make the build readable by other users of the cache, and check that the
+	# package was built before publishing it
+	if ! {
+		chmod 755 "$tmp_dir" &&
+			git -C "$REPO_DIR" archive --format=tar "$commit" | tar -x -C "$tmp_dir" --one-top-level=src &&
+			pip wheel --quiet --no-deps --wheel-dir "$tmp_dir/wheel" "$tmp_dir/src" &&
+			python -m zipfile -e "$tmp_dir"/wheel/*.whl "$tmp_dir/site" &&
+			[[ -d $tmp_dir/site/{{ cookiecutter.__project_slug }} ]]
+	}; then
+		log "Failed to build ${commit}"
+		rm -rf "$tmp_dir"
+		return 1
+	fi
+	rm -rf "$tmp_dir/src" "$tmp_dir/wheel"
+	# Remove any incomplete build left at the destination
+	if [[ -e $dest && ! -d $dest/site/{{ cookiecutter.__project_slug }} ]]; then
+		rm -rf "$dest"
+	fi
+	# Renaming the directory is atomic, so other jobs never see a partial
+	# build. If another job finished first, its build is used instead.
+	if ! mv -T "$tmp_dir" "$dest" 2>/dev/null; then
+		rm -rf "$tmp_dir"
+	fi
+}
+
+# Use the commit given by the environment variable ENTRYPOINT_COMMIT, or the
+# commit currently checked out
 if [[ -v ENTRYPOINT_COMMIT ]]; then
-	git checkout $ENTRYPOINT_COMMIT
+	COMMIT=$(git -C "$REPO_DIR" rev-parse "${ENTRYPOINT_COMMIT}^{commit}")
+else
+	COMMIT=$(git -C "$REPO_DIR" rev-parse HEAD)
 fi
 
-# Add the user console script install location to the path
-export PATH=${HOME}/.local/bin/:${PATH}
+if [[ ! -v ENTRYPOINT_COMMIT && -n $(git -C "$REPO_DIR" status --porcelain --untracked-files=no) ]]; then
+	# Run the working tree as it is, so that uncommitted changes are included
+	log "Uncommitted changes in ${REPO_DIR}, running it without the build cache"
+	SITE_DIR=$REPO_DIR
+	SOURCE="working tree"
+else
+	BUILD_DIR=${BUILD_CACHE_DIR}/${COMMIT}
+	SITE_DIR=${BUILD_DIR}/site
+	# A build is complete once it contains the package
+	PACKAGE_DIR=${SITE_DIR}/{{ cookiecutter.__project_slug }}
+	SOURCE="cached build of ${COMMIT}"
+	if [[ ! -d $PACKAGE_DIR ]]; then
+		mkdir -p "$BUILD_CACHE_DIR"
+		# Creating a directory is atomic, so only one job holds the lock and
+		# builds the commit while others wait. If that job is killed, its lock
+		# is released and a waiting job takes over the build, but if the build
+		# fails, the waiting jobs fail too rather than repeating it.
+		waited=0
+		while [[ ! -d $PACKAGE_DIR ]]; do
+			if [[ $waited -gt 0 && -e ${BUILD_DIR}.failed && ! -d ${BUILD_DIR}.lock ]]; then
+				log "Another job failed to build ${COMMIT}"
+				exit 1
+			elif mkdir "${BUILD_DIR}.lock" 2>/dev/null; then
+				# Release the lock however the job ends, including when it is
+				# cancelled or preempted, so that other jobs stop waiting for it
+				trap 'rm -rf "${BUILD_TMP_DIR:-}"; rmdir "${BUILD_DIR}.lock" 2>/dev/null' EXIT
+				trap 'exit 1' TERM INT
+				rm -f "${BUILD_DIR}.failed"
+				log "Building ${COMMIT} into ${BUILD_DIR}"
+				if ! build_commit "$COMMIT" "$BUILD_DIR"; then
+					# Tell the jobs waiting for this build that it failed
+					touch "${BUILD_DIR}.failed"
+					exit 1
+				fi
+				rmdir "${BUILD_DIR}.lock"
+				trap - EXIT TERM INT
+				SOURCE="new build of ${COMMIT}"
+			elif [[ $waited -ge $BUILD_WAIT ]]; then
+				log "Timed out waiting for ${BUILD_DIR}.lock, building ${COMMIT}"
+				build_commit "$COMMIT" "$BUILD_DIR" || exit 1
+			else
+				if [[ $waited -eq 0 ]]; then
+					log "Waiting for another job to build ${COMMIT}"
+				fi
+				sleep 2
+				waited=$((waited + 2))
+			fi
+		done
+	fi
+fi
 
-# Install the project's python package
-pip install --no-dependencies --user -e .
-cd ..
+export PYTHONPATH=${SITE_DIR}${PYTHONPATH:+:$PYTHONPATH}
+log "Startup took $(awk "BEGIN {printf \"%.2f\", $EPOCHREALTIME - $START_TIME}")s using the ${SOURCE}"
 
 # Kick off the main python entrypoint
-{{ cookiecutter.__project_name }} "$@"
+exec python -m {{ cookiecutter.__project_slug }} "$@"
@@ -0,0 +1,34 @@
+"""Tests for the rendering of quality control images."""
+from pathlib import Path
+
+import numpy as np
+
+from {{ cookiecutter.__project_slug }}.visualization.qc import (
+    RenderParams,
+    downsample,
+    render_images,
+)
+
+
+def test_downsample_nearest_matches_mean() -> None:
+    """Label maps are downsampled to the same shape as images."""
+    image = np.zeros((300, 260))
+    for size in (64, 86, 100, 128):
+        assert downsample(image, size, nearest=True).shape == (
+            downsample(image, size).shape
+        )
+
+
+def test_render_overlay_uneven_shape(tmp_path: Path) -> None:
+    """Overlays render on volumes whose shape is not a multiple of the factor."""
+    rng = np.random.default_rng(0)
+    image_file = tmp_path / "image.npy"
+    label_file = tmp_path / "label.npy"
+    np.save(image_file, rng.normal(size=(40, 300, 260)).astype(np.float32))
+    np.save(label_file, rng.integers(0, 3, size=(40, 300, 260), dtype=np.uint8))
+
+    params = RenderParams(thumbnail_size=128, slice_size=192)
+    thumbnail, montage = render_images(image_file, label_file, params)
+    assert thumbnail.ndim == 3 and thumbnail.dtype == np.uint8
+    assert max(thumbnail.shape[:2]) <= params.thumbnail_size
+    assert montage.shape[2] == 3
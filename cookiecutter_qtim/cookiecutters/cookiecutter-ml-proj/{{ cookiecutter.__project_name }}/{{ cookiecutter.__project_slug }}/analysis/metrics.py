@@ -0,0 +1,283 @@
+"""Metrics comparing segmentations with their ground truth.
+
+All metrics are computed with vectorized NumPy operations on whole arrays,
+without loops over voxels. Overlap metrics for every label are computed from
+a confusion matrix, which takes a single pass over the arrays. Surface
+distance metrics use a Euclidean distance transform, from scipy if it is
+installed and otherwise computed with NumPy, of each label cropped to the
+region containing it.
+
+Conventions for empty segmentations: if a label is absent from both the
+prediction and the ground truth, its Dice and IoU are 1. If it is absent from
+only one, surface distances are infinite, and if absent from both they are
+NaN.
+
+"""
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Percentile of surface distances used for the robust Hausdorff distance
+HAUSDORFF_PERCENTILE = 95
+
+# Maximum number of elements of the temporary arrays used to compute distance
+# transforms when scipy is not available
+_DISTANCE_CHUNK_ELEMENTS = 2**22
+
+
+def confusion_matrix(
+    pred: np.ndarray, gt: np.ndarray, labels: Sequence[int]
+) -> np.ndarray:
+    """Count voxels by their label in the ground truth and prediction.
+
+    Parameters
+    ----------
+    pred: np.ndarray
+        Predicted label map.
+    gt: np.ndarray
+        Ground truth label map, with the same shape as the prediction.
+    labels: Sequence[int]
+        Labels to count. Any other value is counted as background.
+
+    Returns
+    -------
+    np.ndarray:
+        Matrix of shape (len(labels) + 1, len(labels) + 1), where element
+        (i, j) is the number of voxels with label i in the ground truth and
+        label j in the prediction. Index 0 is background, and index k is
+        labels[k - 1].
+
+    """
+    if pred.shape != gt.shape:
+        raise ValueError(
+            f"Shapes of the prediction {pred.shape} and ground truth "
+            f"{gt.shape} differ."
+        )
+    n = len(labels) + 1
+    # Map each value to its index with a lookup table over the range of values
+    low = min(int(pred.min()), int(gt.min()), min(labels))
+    high = max(int(pred.max()), int(gt.max()), max(labels))
+    lookup = np.zeros(high - low + 1, dtype=np.intp)
+    lookup[np.asarray(labels) - low] = np.arange(1, n)
+    pred_index = lookup[pred.ravel().astype(np.intp) - low]
+    gt_index = lookup[gt.ravel().astype(np.intp) - low]
+    return np.bincount(gt_index * n + pred_index, minlength=n * n).reshape(n, n)
+
+
+def overlap_metrics(
+    pred: np.ndarray, gt: np.ndarray, labels: Sequence[int]
+) -> Dict[int, Dict[str, float]]:
+    """Compute overlap metrics of each label.
+
+    Parameters
+    ----------
+    pred: np.ndarray
+        Predicted label map.
+    gt: np.ndarray
+        Ground truth label map, with the same shape as the prediction.
+    labels: Sequence[int]
+        Labels to compute metrics of.
+
+    Returns
+    -------
+    Dict[int, Dict[str, float]]:
+        For each label, its Dice coefficient ('dice'), intersection over
+        union ('iou'), and number of voxels in the ground truth ('gt_voxels')
+        and prediction ('pred_voxels').
+
+    """
+    matrix = confusion_matrix(pred, gt, labels)
+    tp = np.diag(matrix)[1:].astype(float)
+    gt_voxels = matrix.sum(axis=1)[1:]
+    pred_voxels = matrix.sum(axis=0)[1:]
+    union = gt_voxels + pred_voxels - tp
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dice = np.where(union > 0, 2 * tp / (gt_voxels + pred_voxels), 1.0)
+        iou = np.where(union > 0, tp / union, 1.0)
+    return {
+        label: {
+            "dice": float(dice[i]),
+            "iou": float(iou[i]),
+            "gt_voxels": int(gt_voxels[i]),
+            "pred_voxels": int(pred_voxels[i]),
+        }
+        for i, label in enumerate(labels)
+    }
+
+
+def surface(mask: np.ndarray) -> np.ndarray:
+    """Find the voxels on the surface of a binary mask.
+
+    A voxel is on the surface if it is in the mask and any of its face
+    neighbours is not (including neighbours outside the array).
+
+    Parameters
+    ----------
+    mask: np.ndarray
+        Binary mask.
+
+    Returns
+    -------
+    np.ndarray:
+        Binary mask of the surface voxels.
+
+    """
+    padded = np.pad(mask, 1, constant_values=False)
+    interior = mask.copy()
+    centre = tuple(slice(1, -1) for _ in range(mask.ndim))
+    for axis in range(mask.ndim):
+        for shift in (-1, 1):
+            neighbour = list(centre)
+            neighbour[axis] = slice(1 + shift, padded.shape[axis] - 1 + shift)
+            interior &= padded[tuple(neighbour)]
+    return mask & ~interior
+
+
+def _crop(*masks: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """Crop masks to the bounding box of their union, with a margin of 1."""
+    union = np.logical_or.reduce(masks)
+    slices = []
+    for axis in range(union.ndim):
+        other_axes = tuple(a for a in range(union.ndim) if a != axis)
+        present = np.flatnonzero(union.any(axis=other_axes))
+        start = max(int(present[0]) - 1, 0)
+        stop = min(int(present[-1]) + 2, union.shape[axis])
+        slices.append(slice(start, stop))
+    return tuple(m[tuple(slices)] for m in masks)
+
+
+def distance_transform(
+    targets: np.ndarray, spacing: Optional[Sequence[float]] = None
+) -> np.ndarray:
+    """Compute the Euclidean distance from each voxel to the nearest target.
+
+    This uses scipy if it is installed. Otherwise, the squared distance is
+    computed exactly with NumPy as the minimum over each line of the array,
+    one axis at a time, which takes time proportional to the number of voxels
+    times the length of each axis.
+
+    Parameters
+    ----------
+    targets: np.ndarray
+        Binary mask of the target voxels.
+    spacing: Optional[Sequence[float]]
+        Spacing of the voxels along each axis. Defaults to 1.
+
+    Returns
+    -------
+    np.ndarray:
+        Distance from each voxel to the nearest target voxel, in the units of
+        the spacing, or infinity if there are no targets.
+
+    """
+    sampling = np.ones(targets.ndim) if spacing is None else np.asarray(spacing, float)
+    try:
+        from scipy.ndimage import distance_transform_edt
+    except ImportError:
+        distance_transform_edt = None
+    if distance_transform_edt is not None:
+        if not targets.any():
+            return np.full(targets.shape, np.inf)
+        return distance_transform_edt(~targets, sampling=sampling)
+
+    squared = np.where(targets, 0.0, np.inf)
+    for axis in range(targets.ndim):
+        n = squared.shape[axis]
+        lines = np.moveaxis(squared, axis, -1)
+        moved_shape = lines.shape
+        lines = lines.reshape(-1, n)
+        positions = np.arange(n) * sampling[axis]
+        offsets = (positions[:, np.newaxis] - positions[np.newaxis]) ** 2
+        result = np.empty_like(lines)
+        chunk = max(1, _DISTANCE_CHUNK_ELEMENTS // (n * n))
+        for start in range(0, len(lines), chunk):
+            block = lines[start : start + chunk]
+            result[start : start + chunk] = (
+                block[:, np.newaxis, :] + offsets[np.newaxis]
+            ).min(axis=2)
+        squared = np.moveaxis(result.reshape(moved_shape), -1, axis)
+    return np.sqrt(squared)
+
+
+def surface_distance_metrics(
+    pred: np.ndarray,
+    gt: np.ndarray,
+    spacing: Optional[Sequence[float]] = None,
+) -> Dict[str, float]:
+    """Compute surface distance metrics of binary masks.
+
+    Parameters
+    ----------
+    pred: np.ndarray
+        Binary mask of the prediction.
+    gt: np.ndarray
+        Binary mask of the ground truth.
+    spacing: Optional[Sequence[float]]
+        Spacing of the voxels along each axis. Defaults to 1.
+
+    Returns
+    -------
+    Dict[str, float]:
+        Hausdorff distance ('hd'), its 95th percentile ('hd95'), and average
+        symmetric surface distance ('assd'), in the units of the spacing.
+
+    """
+    pred = np.asarray(pred, dtype=bool)
+    gt = np.asarray(gt, dtype=bool)
+    pred_empty, gt_empty = not pred.any(), not gt.any()
+    if pred_empty or gt_empty:
+        value = np.nan if pred_empty and gt_empty else np.inf
+        return {"hd": value, "hd95": value, "assd": value}
+
+    pred, gt = _crop(pred, gt)
+    pred_surface, gt_surface = surface(pred), surface(gt)
+    distances = np.concatenate(
+        [
+            distance_transform(gt_surface, spacing)[pred_surface],
+            distance_transform(pred_surface, spacing)[gt_surface],
+        ]
+    )
+    return {
+        "hd": float(distances.max()),
+        "hd95": float(np.percentile(distances, HAUSDORFF_PERCENTILE)),
+        "assd": float(distances.mean()),
+    }
+
+
+def segmentation_metrics(
+    pred: np.ndarray,
+    gt: np.ndarray,
+    labels: Sequence[int],
+    spacing: Optional[Sequence[float]] = None,
+    surface_distances: bool = True,
+) -> Dict[int, Dict[str, float]]:
+    """Compute overlap and surface distance metrics of each label.
+
+    Parameters
+    ----------
+    pred: np.ndarray
+        Predicted label map.
+    gt: np.ndarray
+        Ground truth label map, with the same shape as the prediction.
+    labels: Sequence[int]
+        Labels to compute metrics of.
+    spacing: Optional[Sequence[float]]
+        Spacing of the voxels along each axis. Defaults to 1.
+    surface_distances: bool
+        Compute surface distance metrics, which take longer than the overlap
+        metrics.
+
+    Returns
+    -------
+    Dict[int, Dict[str, float]]:
+        Metrics of each label, see :func:`overlap_metrics` and
+        :func:`surface_distance_metrics`.
+
+    """
+    metrics = overlap_metrics(pred, gt, labels)
+    if surface_distances:
+        for label in labels:
+            metrics[label].update(
+                surface_distance_metrics(pred == label, gt == label, spacing)
+            )
+    return metrics
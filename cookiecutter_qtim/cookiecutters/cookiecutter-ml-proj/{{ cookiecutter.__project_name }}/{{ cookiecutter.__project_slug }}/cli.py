@@ -1,11 +1,16 @@
 """Project command line interface: load commands from commands directory."""
+import ast
+import importlib
+import importlib.util
 import pkgutil
-from typing import Any, List
+from typing import Any, Dict, List, Optional
 
 import click
 
 from {{ cookiecutter.__project_slug }} import commands
 
+COMMANDS_PACKAGE = "{{ cookiecutter.__project_slug }}.commands"
+
 
 class ProjectCLI(click.MultiCommand):
     """Main CLI object for the project.
@@ -16,39 +21,23 @@ class ProjectCLI(click.MultiCommand):
     @click.command) with the same name as the module (with underscores
     replaced by hyphens to conform for conventions).
 
+    Commands are listed using only the names of the modules, and the module
+    of a command is imported only when that command is run. This way, running
+    one command does not import the (possibly slow to import) dependencies of
+    all the others. The help text listed for each command is read from the
+    source of its module without importing it.
+
     """
 
     def __init__(self, *args: Any, **kwargs: Any):
         """Passes through arguments to the base class constructor."""
-        super().__init__(self, *args, **kwargs)  # type: ignore
-
-        self.avail_modules = {}
-        for mod_info in pkgutil.iter_modules(commands.__path__):
-            name = mod_info.name
-            full_name = f"{{ cookiecutter.__project_slug }}.commands.{name}"
-
-            # Note that type hints for pkgutil package seem broken...
-            loader = mod_info.module_finder.find_module(name)  # type: ignore
-            if loader is None:
-                continue
-            mod = loader.load_module()  # type: ignore
-
-            if hasattr(mod, name):
-                cmd = getattr(mod, name)
-                if isinstance(cmd, click.Command):
-                    norm_name = name.replace("_", "-")
-                    self.avail_modules[norm_name] = cmd
-                else:
-                    raise TypeError(
-                        "The function {name} in module {full_name} is not of "
-                        "type click.Command."
-                    )
-            else:
-                raise AttributeError(
-                    "Each module in the commands package is expected to define "
-                    "a function with the same name as the module. Module "
-                    f"{full_name} has no attribute {name}."
-                )
+        super().__init__(*args, **kwargs)
+
+        # Map from command name to module name, found without importing
+        self.avail_modules: Dict[str, str] = {
+            mod_info.name.replace("_", "-"): mod_info.name
+            for mod_info in pkgutil.iter_modules(commands.__path__)
+        }
 
     def list_commands(self, ctx: click.Context) -> List[str]:
         """List all commands available through the CLI.
@@ -66,9 +55,11 @@ class ProjectCLI(click.MultiCommand):
         """
         return sorted(list(self.avail_modules.keys()))
 
-    def get_command(self, ctx: click.Context, name: str) -> click.Command:
+    def get_command(self, ctx: click.Context, name: str) -> Optional[click.Command]:
         """Get a command from the CLI.
 
+        This imports the module defining the command.
+
         Parameters
         ----------
         ctx: click.Context
@@ -79,11 +70,92 @@ class ProjectCLI(click.MultiCommand):
 
         Returns
         ------
-        click.Command:
-            Command object implementing the requested command.
+        Optional[click.Command]:
+            Command object implementing the requested command, or None if
+            there is no such command.
 
         """
-        return self.avail_modules[name]
+        if name not in self.avail_modules:
+            return None
+        module_name = self.avail_modules[name]
+        full_name = f"{COMMANDS_PACKAGE}.{module_name}"
+        mod = importlib.import_module(full_name)
+
+        if not hasattr(mod, module_name):
+            raise AttributeError(
+                "Each module in the commands package is expected to define "
+                "a function with the same name as the module. Module "
+                f"{full_name} has no attribute {module_name}."
+            )
+        cmd = getattr(mod, module_name)
+        if not isinstance(cmd, click.Command):
+            raise TypeError(
+                f"The function {module_name} in module {full_name} is not of "
+                "type click.Command."
+            )
+        return cmd
+
+    def format_commands(
+        self, ctx: click.Context, formatter: click.HelpFormatter
+    ) -> None:
+        """Write the list of commands and their help into the formatter.
+
+        Unlike the base class, this does not import the commands.
+
+        Parameters
+        ----------
+        ctx: click.Context
+            Context object passed from parent.
+        formatter: click.HelpFormatter
+            Formatter to write the list of commands into.
+
+        """
+        names = self.list_commands(ctx)
+        if len(names) == 0:
+            return
+        limit = formatter.width - 6 - max(len(name) for name in names)
+        # Shorten the help text in the same way as click, without importing
+        # the command's module
+        rows = [
+            (
+                name,
+                click.Command(
+                    name, help=read_command_help(self.avail_modules[name])
+                ).get_short_help_str(limit),
+            )
+            for name in names
+        ]
+        with formatter.section("Commands"):
+            formatter.write_dl(rows)
+
+
+def read_command_help(module_name: str) -> str:
+    """Read the help text of a command from the source of its module.
+
+    The help text is the docstring of the function defining the command.
+    The module is parsed, but not imported.
+
+    Parameters
+    ----------
+    module_name: str
+        Name of the module within the commands package.
+
+    Returns
+    -------
+    str:
+        The docstring of the command function, or an empty string if it
+        could not be found.
+
+    """
+    spec = importlib.util.find_spec(f"{COMMANDS_PACKAGE}.{module_name}")
+    if spec is None or spec.origin is None or not spec.has_location:
+        return ""
+    with open(spec.origin, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == module_name:
+            return ast.get_docstring(node) or ""
+    return ""
 
 
 def run_cli() -> None:
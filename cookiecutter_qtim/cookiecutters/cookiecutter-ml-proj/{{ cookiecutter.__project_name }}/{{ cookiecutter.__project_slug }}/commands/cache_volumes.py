@@ -0,0 +1,147 @@
+"""Populate the cache of preprocessed volumes from the project dataset."""
+import time
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import click
+
+from {{ cookiecutter.__project_slug }} import locations
+from {{ cookiecutter.__project_slug }}.preprocess.dicom_index import (
+    get_non_volume_series,
+    get_series_files,
+)
+from {{ cookiecutter.__project_slug }}.preprocess.volume_cache import (
+    DEFAULT_MAX_BYTES,
+    VolumeCache,
+    read_dicom_series,
+)
+
+
+# Cache of a worker process, set by the pool's initializer, so that the size
+# of the cache is tracked across the series cached by the worker
+_worker_cache: Optional[VolumeCache] = None
+
+
+def _init_worker(cache_dir: Path, max_bytes: int) -> None:
+    global _worker_cache
+    _worker_cache = VolumeCache(cache_dir, max_bytes=max_bytes)
+
+
+def _cache_series(
+    series: Tuple[str, List[Path]],
+    params: Dict[str, Any],
+    content_hash: bool,
+) -> Tuple[str, Optional[str]]:
+    """Cache a single series, returning its UID and any error."""
+    assert _worker_cache is not None, "The worker was not initialized."
+    series_uid, files = series
+    try:
+        _worker_cache.get_or_create(
+            files, params, read_dicom_series, content_hash=content_hash
+        )
+    except Exception as e:
+        return series_uid, f"{type(e).__name__}: {e}"
+    return series_uid, None
+
+
+@click.command()
+@click.option(
+    "--series-uid",
+    "-s",
+    "series_uids",
+    multiple=True,
+    help="Instance UID of a series to cache. May be given multiple times. "
+    "Defaults to all series in the dataset index.",
+)
+@click.option(
+    "--window",
+    type=float,
+    nargs=2,
+    help="Range to clip intensities to, e.g. --window -1000 400.",
+)
+@click.option(
+    "--max-gb",
+    type=float,
+    default=DEFAULT_MAX_BYTES / 1024**3,
+    show_default=True,
+    help="Maximum total size of the cache in GiB.",
+)
+@click.option(
+    "--workers",
+    "-j",
+    type=int,
+    help="Number of processes reading series. Defaults to the number of CPUs.",
+)
+@click.option(
+    "--content-hash",
+    is_flag=True,
+    help="Identify series by the contents of their files, rather than their "
+    "paths and modification times, so that copied or touched files are found "
+    "in the cache. This reads every file of every series.",
+)
+def cache_volumes(
+    series_uids: Tuple[str, ...],
+    window: Optional[Tuple[float, float]],
+    max_gb: float,
+    workers: Optional[int],
+    content_hash: bool,
+) -> None:
+    """Decode series of the dataset into the volume cache.
+
+    Reads each series listed in the dataset index (see index-dataset) and
+    stores it in the cache of preprocessed volumes in the project directory,
+    from which training jobs can memory-map it rather than decoding it again.
+    Series already in the cache with the same files (or with --content-hash,
+    the same file contents) and parameters are skipped, as are series that are not volumes, such as segmentations,
+    structure sets and reports.
+
+    """
+    locations.check_locations()
+    index_file = locations.dataset_index_file
+    if not index_file.exists():
+        raise click.ClickException(
+            f"No dataset index found at {index_file}. Run index-dataset first."
+        )
+
+    series = get_series_files(
+        index_file,
+        locations.project_dataset_dir,
+        list(series_uids) if len(series_uids) > 0 else None,
+    )
+    # Skip series that are not volumes, e.g. segmentations or reports
+    non_volumes = get_non_volume_series(index_file)
+    skipped = [uid for uid in series if uid in non_volumes]
+    for series_uid in skipped:
+        del series[series_uid]
+    if len(skipped) > 0:
+        click.echo(f"Skipping {len(skipped)} series that are not volumes.")
+    params = {"window": list(window)} if window else {}
+    cache_series = partial(_cache_series, params=params, content_hash=content_hash)
+    max_bytes = int(max_gb * 1024**3)
+
+    start = time.perf_counter()
+    n_failed = 0
+    with Pool(
+        workers,
+        initializer=_init_worker,
+        initargs=(locations.volume_cache_dir, max_bytes),
+    ) as pool:
+        for series_uid, error in pool.imap_unordered(cache_series, series.items()):
+            if error is not None:
+                n_failed += 1
+                click.echo(f"Failed to cache {series_uid}: {error}", err=True)
+
+    # Each worker only tracks the volumes it stored, so enforce the limit on
+    # the whole cache once all are stored
+    cache = VolumeCache(locations.volume_cache_dir, max_bytes=max_bytes)
+    cache.evict()
+    size = cache.size()
+    click.echo(
+        f"Cached {len(series) - n_failed} of {len(series)} series in "
+        f"{time.perf_counter() - start:.1f}s. The cache holds "
+        f"{size / 1024**3:.2f} GiB."
+    )
+    if n_failed > 0:
+        raise click.ClickException(f"Failed to cache {n_failed} series.")
@@ -0,0 +1,161 @@
+"""Evaluate segmentations against the ground truth."""
+import csv
+import time
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import click
+import numpy as np
+
+from {{ cookiecutter.__project_slug }} import locations
+from {{ cookiecutter.__project_slug }}.analysis.metrics import segmentation_metrics
+
+# Metrics computed for each label, in the order of the columns
+OVERLAP_METRICS = ["dice", "iou", "gt_voxels", "pred_voxels"]
+SURFACE_METRICS = ["hd", "hd95", "assd"]
+
+
+def _evaluate_case(
+    case: Tuple[str, Path, Path],
+    labels: Sequence[int],
+    spacing: Optional[Sequence[float]],
+    surface_distances: bool,
+) -> Dict[str, Any]:
+    """Compute the row of the results for a case, in a worker process."""
+    case_id, pred_file, gt_file = case
+    row: Dict[str, Any] = {"case_id": case_id}
+    try:
+        pred = np.load(pred_file, mmap_mode="r")
+        gt = np.load(gt_file, mmap_mode="r")
+        metrics = segmentation_metrics(
+            pred, gt, labels, spacing=spacing, surface_distances=surface_distances
+        )
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+        return row
+    for label, values in metrics.items():
+        for name, value in values.items():
+            row[f"{name}_{label}"] = value
+    return row
+
+
+@click.command()
+@click.argument(
+    "pred_dir", type=click.Path(exists=True, file_okay=False, path_type=Path)
+)
+@click.argument("gt_dir", type=click.Path(exists=True, file_okay=False, path_type=Path))
+@click.option(
+    "--label",
+    "-l",
+    "labels",
+    type=int,
+    multiple=True,
+    default=[1],
+    show_default=True,
+    help="Label to evaluate. May be given multiple times.",
+)
+@click.option(
+    "--spacing",
+    help="Comma-separated spacing of the voxels along each axis, e.g. "
+    "--spacing 2.5,0.7,0.7. Defaults to 1 along every axis.",
+)
+@click.option(
+    "--no-surface",
+    is_flag=True,
+    help="Skip the surface distance metrics, which are slower to compute.",
+)
+@click.option(
+    "--output-file",
+    "-o",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="CSV file to write the results to. Defaults to a file named after "
+    "the model and split in the analysis directory.",
+)
+@click.option(
+    "--workers",
+    "-j",
+    type=int,
+    help="Number of processes evaluating cases. Defaults to the number of CPUs.",
+)
+def evaluate(
+    pred_dir: Path,
+    gt_dir: Path,
+    labels: Tuple[int, ...],
+    spacing: Optional[str],
+    no_surface: bool,
+    output_file: Optional[Path],
+    workers: Optional[int],
+) -> None:
+    """Evaluate predicted segmentations against the ground truth.
+
+    PRED_DIR is a directory of predicted label maps as .npy files, such as
+    the output of the infer command.
+
+    GT_DIR is a directory of ground truth label maps as .npy files with the
+    same names.
+
+    Computes the Dice coefficient, IoU and voxel counts, and the Hausdorff
+    distance, its 95th percentile and the average symmetric surface distance,
+    of each label. Cases are evaluated in parallel and a row is written to
+    the results file as each case finishes.
+
+    """
+    try:
+        voxel_spacing = [float(s) for s in spacing.split(",")] if spacing else None
+    except ValueError:
+        raise click.BadParameter(f"Invalid spacing '{spacing}'.")
+
+    cases: List[Tuple[str, Path, Path]] = []
+    missing = []
+    for pred_file in sorted(pred_dir.glob("*.npy")):
+        gt_file = gt_dir / pred_file.name
+        if gt_file.exists():
+            cases.append((pred_file.stem, pred_file, gt_file))
+        else:
+            missing.append(pred_file.stem)
+    if len(missing) > 0:
+        click.echo(f"No ground truth for {len(missing)} cases, skipping them.")
+    if len(cases) == 0:
+        raise click.ClickException(f"No cases to evaluate in {pred_dir}.")
+
+    if output_file is None:
+        output_file = (
+            locations.analysis_dir / pred_dir.parent.name / f"{pred_dir.name}.csv"
+        )
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+
+    metric_names = OVERLAP_METRICS + ([] if no_surface else SURFACE_METRICS)
+    columns = (
+        ["case_id"]
+        + [f"{name}_{label}" for label in labels for name in metric_names]
+        + ["error"]
+    )
+    evaluate_case = partial(
+        _evaluate_case,
+        labels=list(labels),
+        spacing=voxel_spacing,
+        surface_distances=not no_surface,
+    )
+
+    start = time.perf_counter()
+    n_failed = 0
+    with output_file.open("w", newline="") as f, Pool(workers) as pool:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        for i, row in enumerate(pool.imap_unordered(evaluate_case, cases), 1):
+            writer.writerow(row)
+            f.flush()
+            if "error" in row:
+                n_failed += 1
+                click.echo(f"Failed case {row['case_id']}: {row['error']}", err=True)
+            if i % 100 == 0:
+                click.echo(f"Evaluated {i} of {len(cases)} cases")
+
+    click.echo(
+        f"Evaluated {len(cases) - n_failed} cases in "
+        f"{time.perf_counter() - start:.1f}s. Results are in {output_file}."
+    )
+    if n_failed > 0:
+        raise click.ClickException(f"Failed to evaluate {n_failed} cases.")
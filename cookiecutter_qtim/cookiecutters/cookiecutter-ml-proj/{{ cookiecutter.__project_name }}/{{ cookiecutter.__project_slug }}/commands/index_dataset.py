@@ -0,0 +1,72 @@
+"""Index the metadata of the DICOM files in the project dataset."""
+from pathlib import Path
+from typing import Optional
+
+import click
+
+from {{ cookiecutter.__project_slug }} import locations
+from {{ cookiecutter.__project_slug }}.preprocess.dicom_index import (
+    DEFAULT_CHUNK_SIZE,
+    update_index,
+)
+
+
+@click.command()
+@click.option(
+    "--dataset-dir",
+    "-d",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+    help="Directory of the dataset. Defaults to the project dataset directory.",
+)
+@click.option(
+    "--index-file",
+    "-i",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="SQLite file to store the index in. Defaults to the project's index file.",
+)
+@click.option(
+    "--workers",
+    "-j",
+    type=int,
+    help="Number of processes reading files. Defaults to the number of CPUs.",
+)
+@click.option(
+    "--chunk-size",
+    type=int,
+    default=DEFAULT_CHUNK_SIZE,
+    show_default=True,
+    help="Number of files read by a process at a time.",
+)
+def index_dataset(
+    dataset_dir: Optional[Path],
+    index_file: Optional[Path],
+    workers: Optional[int],
+    chunk_size: int,
+) -> None:
+    """Index the metadata of the DICOM files in the dataset.
+
+    Reads the headers of all DICOM files in the dataset (without the pixel
+    data) in parallel, and stores the patient, study, series and instance
+    attributes of each in a SQLite database, which also has 'series' and
+    'studies' views. Running this again only reads files that have been added
+    or changed since, and removes files that have been deleted.
+
+    """
+    if dataset_dir is None:
+        locations.check_locations()
+        dataset_dir = locations.project_dataset_dir
+    if index_file is None:
+        index_file = locations.dataset_index_file
+
+    summary = update_index(
+        dataset_dir,
+        index_file,
+        workers=workers,
+        chunk_size=chunk_size,
+    )
+    click.echo(
+        f"Found {summary.n_files} files, read {summary.n_read} new or changed "
+        f"files and removed {summary.n_removed} deleted files in "
+        f"{summary.elapsed:.1f}s."
+    )
+    click.echo(f"{index_file} indexes {summary.n_dicom} DICOM files.")
@@ -0,0 +1,109 @@
+"""Run a trained model on a split of the dataset."""
+from pathlib import Path
+from typing import Optional
+
+import click
+
+from {{ cookiecutter.__project_slug }} import locations
+from {{ cookiecutter.__project_slug }}.enums import DatasetSplit
+from {{ cookiecutter.__project_slug }}.inference.pipeline import (
+    DEFAULT_WRITERS,
+    run_inference,
+)
+from {{ cookiecutter.__project_slug }}.inference.task import ModelInferenceTask
+
+
+@click.command()
+@click.argument(
+    "model_dir", type=click.Path(exists=True, file_okay=False, path_type=Path)
+)
+@click.argument(
+    "split",
+    type=click.Choice([s.value for s in DatasetSplit], case_sensitive=False),
+)
+@click.option(
+    "--output-name",
+    "-o",
+    help="Name of the output directory within the inferences directory. "
+    "Defaults to the name of the model directory.",
+)
+@click.option("--batch-size", "-b", type=int, default=1, show_default=True)
+@click.option(
+    "--workers",
+    "-j",
+    type=int,
+    help="Number of processes loading cases. Defaults to the number of CPUs.",
+)
+@click.option(
+    "--writers",
+    type=int,
+    default=DEFAULT_WRITERS,
+    show_default=True,
+    help="Number of threads writing outputs.",
+)
+@click.option(
+    "--prefetch",
+    type=int,
+    help="Maximum number of cases loaded ahead of the model. Defaults to two "
+    "batches per worker.",
+)
+def infer(
+    model_dir: Path,
+    split: str,
+    output_name: Optional[str],
+    batch_size: int,
+    workers: Optional[int],
+    writers: int,
+    prefetch: Optional[int],
+) -> None:
+    """Run a trained model on a split of the dataset.
+
+    MODEL_DIR is the output directory of the training job of the model.
+
+    SPLIT is the split of the dataset to run the model on.
+
+    Cases are loaded in parallel worker processes and passed to the model in
+    batches, while the outputs of earlier batches are written in the
+    background. Outputs are written to a directory for the model and split in
+    the inferences directory. If this is run again, e.g. after the job was
+    stopped, cases that were already completed are skipped.
+
+    """
+    locations.check_locations()
+    dataset_split = DatasetSplit(split.upper())
+    output_dir = (
+        locations.inferences_dir
+        / (output_name or model_dir.name)
+        / dataset_split.value.lower()
+    )
+
+    task = ModelInferenceTask(model_dir)
+    case_ids = task.list_cases(dataset_split)
+    if len(case_ids) == 0:
+        raise click.ClickException(
+            f"No cases listed in the {split} split. Fill in ModelInferenceTask "
+            "in inference/task.py to list the cases and run the model on them."
+        )
+    summary = run_inference(
+        task,
+        case_ids,
+        output_dir,
+        batch_size=batch_size,
+        workers=workers,
+        writers=writers,
+        prefetch=prefetch,
+    )
+
+    click.echo(
+        f"Completed {summary.n_completed} of {summary.n_cases} cases "
+        f"({summary.n_skipped} already completed) in {summary.elapsed:.1f}s, "
+        f"running the model for {summary.predict_time:.1f}s. Outputs are in "
+        f"{output_dir}."
+    )
+    for case_id, error in summary.failed.items():
+        click.echo(f"Failed case {case_id}:\n{error}", err=True)
+    if len(summary.failed) > 0:
+        raise click.ClickException(
+            f"{len(summary.failed)} cases failed. Run the command again to "
+            "retry them."
+        )
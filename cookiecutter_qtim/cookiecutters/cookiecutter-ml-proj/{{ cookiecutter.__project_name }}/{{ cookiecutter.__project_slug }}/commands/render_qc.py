@@ -0,0 +1,160 @@
+"""Render quality control images of cases and their segmentations."""
+import time
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import click
+
+from {{ cookiecutter.__project_slug }} import locations
+from {{ cookiecutter.__project_slug }}.visualization.qc import (
+    RenderJob,
+    RenderParams,
+    image_paths,
+    render_job,
+    render_key,
+    write_index,
+)
+
+_DEFAULTS = RenderParams()
+
+
+def _parse_overlay(value: str) -> Tuple[str, Path]:
+    """Parse an --overlay option of the form NAME=DIR."""
+    name, sep, directory = value.partition("=")
+    if not sep:
+        name, directory = Path(value).name, value
+    path = Path(directory)
+    if not path.is_dir():
+        raise click.BadParameter(f"Directory '{directory}' does not exist.")
+    return name, path
+
+
+@click.command()
+@click.argument(
+    "image_dir", type=click.Path(exists=True, file_okay=False, path_type=Path)
+)
+@click.option(
+    "--overlay",
+    "-v",
+    "overlays",
+    multiple=True,
+    help="Directory of label maps to overlay, as NAME=DIR, e.g. "
+    "gt=/path/to/labels or the output directory of infer. May be given "
+    "multiple times.",
+)
+@click.option(
+    "--name",
+    "-n",
+    help="Name of the output directory in the visualization directory. "
+    "Defaults to the name of IMAGE_DIR.",
+)
+@click.option("--axis", type=int, default=_DEFAULTS.axis, show_default=True)
+@click.option("--n-slices", type=int, default=_DEFAULTS.n_slices, show_default=True)
+@click.option(
+    "--window",
+    help="Comma-separated intensity range mapped to black and white, e.g. "
+    "-1000,400. Defaults to the 1st and 99th percentiles of each case.",
+)
+@click.option(
+    "--workers",
+    "-j",
+    type=int,
+    help="Number of processes rendering images. Defaults to the number of CPUs.",
+)
+@click.option(
+    "--content-hash",
+    is_flag=True,
+    help="Identify input files by their contents, rather than their paths and "
+    "modification times, so that copied or touched files are not rendered "
+    "again. This reads every input file.",
+)
+def render_qc(
+    image_dir: Path,
+    overlays: Tuple[str, ...],
+    name: Optional[str],
+    axis: int,
+    n_slices: int,
+    window: Optional[str],
+    workers: Optional[int],
+    content_hash: bool,
+) -> None:
+    """Render quality control images of cases and their segmentations.
+
+    IMAGE_DIR is a directory of volumes as .npy files.
+
+    For each volume, and for each volume with each overlay of label maps of
+    the same name, renders a thumbnail of the central slice and a montage of
+    evenly spaced slices, and writes an index.html page showing them all.
+    Images are cached, and only rendered again if the input files or the
+    options have changed since they were last rendered.
+
+    """
+    window_range: Optional[Tuple[float, float]] = None
+    if window:
+        try:
+            low, high = (float(v) for v in window.split(","))
+        except ValueError:
+            raise click.BadParameter(f"Invalid window '{window}'.")
+        window_range = (low, high)
+    params = _DEFAULTS._replace(axis=axis, n_slices=n_slices, window=window_range)
+
+    output_dir = locations.vis_dir / "qc" / (name or image_dir.name)
+    cache_dir = output_dir / "images"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    label_dirs: Dict[str, Path] = dict(_parse_overlay(v) for v in overlays)
+    sources = ["image"] + list(label_dirs)
+    jobs: List[RenderJob] = []
+    for image_file in sorted(image_dir.glob("*.npy")):
+        case_id = image_file.stem
+        candidates = [("image", None)] + [
+            (source, directory / image_file.name)
+            for source, directory in label_dirs.items()
+        ]
+        for source, label_file in candidates:
+            if label_file is not None and not label_file.exists():
+                continue
+            key = render_key(image_file, label_file, params, content_hash)
+            jobs.append(RenderJob(case_id, source, image_file, label_file, key))
+    if len(jobs) == 0:
+        raise click.ClickException(f"No .npy files found in {image_dir}.")
+
+    stale = [
+        job
+        for job in jobs
+        if not all(p.exists() for p in image_paths(cache_dir, job.key))
+    ]
+    click.echo(
+        f"{len(jobs) - len(stale)} of {len(jobs)} image sets are up to date, "
+        f"rendering {len(stale)}."
+    )
+
+    start = time.perf_counter()
+    failed: Dict[str, str] = {}
+    if len(stale) > 0:
+        render = partial(render_job, cache_dir=cache_dir, params=params)
+        with Pool(workers) as pool:
+            for job, error in pool.imap_unordered(render, stale, chunksize=4):
+                if error is not None:
+                    failed[job.key] = error
+                    click.echo(
+                        f"Failed to render {job.case_id} ({job.source}): {error}",
+                        err=True,
+                    )
+
+    # Remove images of earlier renders that are no longer used
+    current = {p.name for j in jobs for p in image_paths(cache_dir, j.key)}
+    for path in cache_dir.glob("*.png"):
+        if path.name not in current:
+            path.unlink()
+
+    index_file = output_dir / "index.html"
+    write_index(index_file, cache_dir, jobs, sources, failed)
+    click.echo(
+        f"Rendered {len(stale) - len(failed)} image sets in "
+        f"{time.perf_counter() - start:.1f}s. Open {index_file} to browse them."
+    )
+    if len(failed) > 0:
+        raise click.ClickException(f"Failed to render {len(failed)} image sets.")
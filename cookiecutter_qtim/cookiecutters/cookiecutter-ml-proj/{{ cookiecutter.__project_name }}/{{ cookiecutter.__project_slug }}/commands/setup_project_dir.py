@@ -1,44 +1,175 @@
 """Process to set up share directories."""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Mapping, Sequence
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence
 
 import click
 
 from {{ cookiecutter.__project_slug }} import locations
 
+# Default number of directories to create concurrently
+DEFAULT_WORKERS = 16
+
+
+class ProvisionResult(NamedTuple):
+    """Outcome of provisioning a single directory."""
+
+    path: Path
+    status: str
+    elapsed: float
+    error: Optional[str] = None
+
+
+def _iter_location_paths(value: object) -> Iterable[Path]:
+    """Yield the paths within a location, which may be a list or dictionary."""
+    if isinstance(value, Path):
+        yield value
+    elif isinstance(value, Mapping):
+        for item in value.values():
+            if isinstance(item, Path):
+                yield item
+    elif isinstance(value, Sequence) and not isinstance(value, str):
+        for item in value:
+            if isinstance(item, Path):
+                yield item
+
+
+def collect_project_dirs(project_dir: Path) -> List[Path]:
+    """Collect the directories within the project directory to provision.
+
+    Every location is collected once. Whether a location is within the project
+    directory is determined from the paths alone, without accessing the
+    filesystem, and the returned paths are relative to the project directory.
+
+    Parameters
+    ----------
+    project_dir: pathlib.Path
+        Root of the project directory.
+
+    Returns
+    -------
+    List[pathlib.Path]:
+        Paths of the directories relative to the project directory, without
+        duplicates, in the order they are defined in locations.py.
+
+    """
+    root = Path(os.path.abspath(project_dir))
+    dirs = []
+    for value in locations.all_locations().values():
+        for path in _iter_location_paths(value):
+            # Assume anything with an extension is intended to be a file
+            if "." in path.name:
+                continue
+            path = Path(os.path.abspath(path))
+            if root not in path.parents:
+                continue
+            rel_path = path.relative_to(root)
+            if rel_path not in dirs:
+                dirs.append(rel_path)
+    return dirs
+
+
+def _provision_dir(path: Path, dry_run: bool) -> ProvisionResult:
+    """Create a single directory, along with any missing parents."""
+    start = time.perf_counter()
+    try:
+        if dry_run:
+            status = "exists" if path.is_dir() else "would create"
+        else:
+            # Attempting to create the directory directly needs one round trip
+            # to the filesystem when it does not exist, rather than two
+            try:
+                path.mkdir(parents=True)
+                status = "created"
+            except FileExistsError:
+                status = "exists"
+    except OSError as e:
+        return ProvisionResult(path, "failed", time.perf_counter() - start, str(e))
+    return ProvisionResult(path, status, time.perf_counter() - start)
+
+
+def provision_dirs(
+    paths: Sequence[Path],
+    dry_run: bool = False,
+    max_workers: int = DEFAULT_WORKERS,
+) -> List[ProvisionResult]:
+    """Create directories concurrently.
+
+    Parameters
+    ----------
+    paths: Sequence[pathlib.Path]
+        Directories to create. Existing directories are not affected.
+    dry_run: bool
+        Only check which directories exist, without creating any.
+    max_workers: int
+        Maximum number of directories to create concurrently.
+
+    Returns
+    -------
+    List[ProvisionResult]:
+        Result for each directory, in the same order as the paths.
+
+    """
+    if len(paths) == 0:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+        return list(executor.map(lambda p: _provision_dir(p, dry_run), paths))
+
 
 @click.command()
-def setup_project_dir() -> None:
+@click.option(
+    "--dry-run",
+    "-n",
+    is_flag=True,
+    help="List the directories that would be created without creating them.",
+)
+@click.option(
+    "--workers",
+    "-w",
+    type=int,
+    default=DEFAULT_WORKERS,
+    show_default=True,
+    help="Maximum number of directories to create concurrently.",
+)
+def setup_project_dir(dry_run: bool, workers: int) -> None:
     """Setup directories in project directory.
 
     Creates all directories contained within the project's locations.py that is
-    a directory on the project directory. Any module-scoped variable that is a
-    pathlib.Path, or an item of a list of dictionary that is pathlib.Path, will
-    be created. If any directory exists, it will not be affected.
+    a directory on the project directory. Any location that is a pathlib.Path,
+    or an item of a list of dictionary that is pathlib.Path, will be created.
+    If any directory exists, it will not be affected. Directories are created
+    concurrently, and the time taken for each is reported.
 
     """
-    if not locations.project_dir.exists():
+    if not locations.exists(locations.project_dir):
         raise RuntimeError(
             "The project data share was not found at "
             f"'{str(locations.project_dir)}.'"
         )
 
-    def _maybe_make_dir(p: Path) -> None:
-        # Assume anything with an extension is intended to be a file
-        if "." not in p.name:
-            if locations.project_dir.resolve() in p.resolve().parents:
-                if p.exists():
-                    print(f'{p}: already exists, not created')
-                else:
-                    print(f'{p}: directory created')
-
-    for var, val in locations.__dict__.items():
-        if isinstance(val, Path):
-            _maybe_make_dir(val)
-        elif isinstance(val, Sequence):
-            for item in val:
-                if isinstance(item, Path):
-                    _maybe_make_dir(item)
-        elif isinstance(val, Mapping):
-                if isinstance(item, Path):
-                    _maybe_make_dir(item)
+    start = time.perf_counter()
+    # The project directory is resolved only once, and the other paths are
+    # placed within the result
+    root = locations.project_dir.resolve()
+    paths = [root / p for p in collect_project_dirs(locations.project_dir)]
+    results = provision_dirs(paths, dry_run=dry_run, max_workers=workers)
+    elapsed = time.perf_counter() - start
+
+    for r in results:
+        line = f"{r.status:<12}  {r.elapsed * 1000:>8.1f} ms  {r.path}"
+        if r.error is not None:
+            line += f" ({r.error})"
+        click.echo(line)
+
+    counts: Dict[str, int] = {}
+    for r in results:
+        counts[r.status] = counts.get(r.status, 0) + 1
+    summary = ", ".join(f"{n} {status}" for status, n in counts.items())
+    click.echo(
+        f"{len(results)} director{'y' if len(results) == 1 else 'ies'} "
+        f"({summary or 'none'}) in {elapsed:.2f}s."
+    )
+    if counts.get("failed", 0) > 0:
+        raise click.ClickException(f"Failed to create {counts['failed']} directories.")
@@ -0,0 +1,80 @@
+"""Summarize the per-step timings of a training run."""
+from pathlib import Path
+
+import click
+import numpy as np
+
+from {{ cookiecutter.__project_slug }}.train.profiling import THROUGHPUT_FILE, read_records
+
+# Percentiles of each timing reported
+PERCENTILES = [50, 90, 99]
+
+# Columns of the summary, and their labels
+_COLUMNS = {
+    "data_s": "data wait (s)",
+    "compute_s": "compute (s)",
+    "step_s": "step (s)",
+    "samples_per_s": "samples/s",
+}
+
+
+@click.command()
+@click.argument("run", type=click.Path(exists=True, path_type=Path))
+@click.option(
+    "--warmup",
+    "-w",
+    type=int,
+    default=5,
+    show_default=True,
+    help="Number of initial steps to exclude.",
+)
+def summarize_run(run: Path, warmup: int) -> None:
+    """Summarize the per-step timings of a training run.
+
+    RUN is the output directory of the model, or the timings file within it.
+
+    Reports percentiles of the time each step spent waiting for data and
+    computing, and of the throughput, along with the peak memory use. A run
+    that spends a large fraction of each step waiting for data is limited by
+    data loading rather than computation.
+
+    """
+    path = run / THROUGHPUT_FILE if run.is_dir() else run
+    if not path.exists():
+        raise click.ClickException(f"No timings found at {path}.")
+    records = list(read_records(path))[warmup:]
+    if len(records) == 0:
+        raise click.ClickException(
+            f"No steps recorded in {path} after the first {warmup}."
+        )
+
+    click.echo(f"{len(records)} steps (excluding {warmup} warmup steps)")
+    header = "".join(f"{'p' + str(p):>10}" for p in PERCENTILES)
+    click.echo(f"{'':<16}{'mean':>10}{header}")
+    for key, label in _COLUMNS.items():
+        values = np.array(
+            [r[key] for r in records if r.get(key) is not None], dtype=float
+        )
+        if len(values) == 0:
+            continue
+        row = "".join(f"{v:>10.4g}" for v in np.percentile(values, PERCENTILES))
+        click.echo(f"{label:<16}{values.mean():>10.4g}{row}")
+
+    total_time = sum(r["step_s"] for r in records)
+    data_time = sum(r["data_s"] for r in records)
+    compute_time = sum(r["compute_s"] for r in records)
+    total_samples = sum(r["samples"] for r in records)
+    click.echo(
+        f"\nOverall {total_samples / total_time:.1f} samples/s. Of the total "
+        f"step time, {100 * data_time / total_time:.1f}% was waiting for data "
+        f"and {100 * compute_time / total_time:.1f}% computing."
+    )
+    click.echo(
+        f"Peak RSS {max(r['peak_rss_mb'] for r in records):.0f} MiB "
+        f"(largest child process "
+        f"{max(r['peak_child_rss_mb'] for r in records):.0f} MiB)."
+    )
+    if data_time > compute_time:
+        click.echo("The run is input-bound: more time is spent waiting for data.")
+    else:
+        click.echo("The run is compute-bound: more time is spent computing.")
@@ -0,0 +1,151 @@
+"""Create a hyperparameter sweep as a Slurm array job."""
+import json
+import subprocess
+from typing import Optional, Tuple
+
+import click
+
+from {{ cookiecutter.__project_slug }} import locations
+from {{ cookiecutter.__project_slug }}.train.sweep import (
+    SlurmOptions,
+    expand_grid,
+    sample_random,
+    write_sweep,
+)
+
+_DEFAULTS = SlurmOptions()
+
+
+def _parse_param(value: str) -> Tuple[str, object]:
+    """Parse a --param option of the form KEY=JSON."""
+    key, sep, spec = value.partition("=")
+    if not sep:
+        raise click.BadParameter(f"Expected KEY=VALUES, got '{value}'.")
+    try:
+        return key, json.loads(spec)
+    except json.JSONDecodeError as e:
+        raise click.BadParameter(f"Values of '{key}' are not valid JSON: {e}.")
+
+
+@click.command()
+@click.argument("config_file")
+@click.argument("sweep_name")
+@click.option(
+    "--param",
+    "-p",
+    "params",
+    multiple=True,
+    required=True,
+    help="Parameter to vary as KEY=VALUES, where KEY is a dot-separated path "
+    "in the config and VALUES is a JSON list of values, e.g. "
+    "-p 'learning_rate=[0.001, 0.0001]'. For a random search, VALUES may "
+    'also be a range, e.g. -p \'learning_rate={"min": 1e-5, "max": 1e-2, '
+    '"log": true}\'. May be given multiple times.',
+)
+@click.option(
+    "--random",
+    "-r",
+    "n_random",
+    type=click.IntRange(min=1),
+    help="Sample this many random combinations of the parameters, rather "
+    "than every combination.",
+)
+@click.option("--seed", "-s", type=int, help="Random seed for a random search.")
+@click.option(
+    "--runs-per-task",
+    "-k",
+    type=click.IntRange(min=1),
+    default=_DEFAULTS.runs_per_task,
+    show_default=True,
+    help="Number of runs to run concurrently within each task of the array job.",
+)
+@click.option(
+    "--cpus-per-run",
+    type=int,
+    default=_DEFAULTS.cpus_per_run,
+    show_default=True,
+)
+@click.option(
+    "--gpus",
+    type=int,
+    default=_DEFAULTS.gpus,
+    show_default=True,
+    help="Number of GPUs for each task, shared between its runs.",
+)
+@click.option("--time", "-t", default=_DEFAULTS.time, show_default=True)
+@click.option("--partition", default=_DEFAULTS.partition, show_default=True)
+@click.option("--account", default=_DEFAULTS.account, show_default=True)
+@click.option(
+    "--max-concurrent",
+    type=int,
+    help="Maximum number of tasks of the array job to run at once.",
+)
+@click.option("--submit", is_flag=True, help="Submit the job with sbatch.")
+def sweep(
+    config_file: str,
+    sweep_name: str,
+    params: Tuple[str, ...],
+    n_random: Optional[int],
+    seed: Optional[int],
+    runs_per_task: int,
+    cpus_per_run: int,
+    gpus: int,
+    time: str,
+    partition: str,
+    account: str,
+    max_concurrent: Optional[int],
+    submit: bool,
+) -> None:
+    """Create a hyperparameter sweep over a training config.
+
+    CONFIG_FILE is the name of the config file within the repo's training
+    config directory that the parameters are varied from.
+
+    SWEEP_NAME is a free text string that names the sweep. Each run trains a
+    model named after the sweep and the number of the run, with its own
+    output directory in the checkpoints directory.
+
+    Writes a config for each run, and a single Slurm array job script that
+    runs all of them, to a directory for the sweep in the project's sweeps
+    directory.
+
+    """
+    if not config_file.lower().endswith(".json"):
+        config_file += ".json"
+    with (locations.train_configs_dir / config_file).open("r") as jf:
+        base_config = json.load(jf)
+
+    param_specs = dict(_parse_param(p) for p in params)
+    try:
+        if n_random is not None:
+            runs = sample_random(param_specs, n_random, seed=seed)
+        else:
+            runs = expand_grid(param_specs)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    if len(runs) == 0:
+        raise click.ClickException(
+            "The parameters produce no runs. Give at least one value of each."
+        )
+
+    options = SlurmOptions(
+        partition=partition,
+        account=account,
+        cpus_per_run=cpus_per_run,
+        gpus=gpus,
+        time=time,
+        runs_per_task=runs_per_task,
+        max_concurrent=max_concurrent,
+    )
+    sweep_dir = locations.sweeps_dir / sweep_name
+    job_file = write_sweep(sweep_dir, sweep_name, base_config, runs, options)
+    n_tasks = -(-len(runs) // runs_per_task)
+    click.echo(
+        f"Wrote {len(runs)} run configs and an array job of {n_tasks} tasks "
+        f"to {sweep_dir}."
+    )
+
+    if submit:
+        subprocess.run(["sbatch", str(job_file)], check=True)
+    else:
+        click.echo(f"Submit it with: sbatch {job_file}")
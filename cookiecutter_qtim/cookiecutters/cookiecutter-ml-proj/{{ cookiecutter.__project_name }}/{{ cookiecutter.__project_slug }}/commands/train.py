@@ -7,6 +7,7 @@ import click
 from pycrumbs import tracked
 
 from {{ cookiecutter.__project_slug }} import locations
+from {{ cookiecutter.__project_slug }}.train.profiling import THROUGHPUT_FILE, StepTimer
 
 
 @click.command()
@@ -32,12 +33,15 @@ def train(
     model weights and any other files associated with model training.
 
     CONFIG_FILE is the name of the config file within the repo's training
-    config directory containing all parameters for the training job.
+    config directory containing all parameters for the training job, or an
+    absolute path to a config file elsewhere (e.g. one written by sweep).
 
     MODEL_NAME is a free text string that names the model. The output will be
     placed in a directory with this name.
 
     """
+    locations.check_locations()
+
     # Read in the config file
     if not config_file.lower().endswith(".json"):
         config_file += ".json"
@@ -50,5 +54,14 @@ def train(
     with config_copy.open("w") as jf:
         json.dump(config, jf, indent=4)
 
-    # Actual training code goes here...
-    pass
+    # Record the timings of each step, see the summarize-run command
+    timer = StepTimer(model_output_dir / THROUGHPUT_FILE)
+    try:
+        # Actual training code goes here, e.g.
+        # for batch in timer.wrap(loader):
+        #     with timer.compute():
+        #         ...
+        #     timer.end_step(len(batch["image"]))
+        pass
+    finally:
+        timer.close()
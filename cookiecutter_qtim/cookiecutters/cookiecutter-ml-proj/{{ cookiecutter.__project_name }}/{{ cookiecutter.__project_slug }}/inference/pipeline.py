@@ -0,0 +1,305 @@
+"""Pipelined inference over the cases of a dataset.
+
+Running inference one case at a time (read, then predict, then write) leaves
+the GPU idle while cases are read and written. :func:`run_inference`
+overlaps the three stages instead:
+
+1. Cases are loaded (read, decoded and preprocessed) in a pool of worker
+   processes, with a bounded number loaded ahead of the model.
+2. The model is called on batches of loaded cases in the main process, in
+   whatever order they finish loading.
+3. Outputs are written by a pool of threads, while the model continues with
+   the next batch.
+
+Each case is appended to a manifest in the output directory once its output
+is written. Cases already in the manifest are skipped, so a job that is
+stopped (e.g. a preempted Slurm job) continues where it stopped when run
+again.
+
+The project-specific steps are implemented by subclassing
+:class:`InferenceTask`, see inference/task.py.
+
+"""
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from {{ cookiecutter.__project_slug }}.enums import DatasetSplit
+
+# Name of the manifest of completed cases within the output directory
+MANIFEST_FILE = "manifest.jsonl"
+
+# Default number of threads writing outputs
+DEFAULT_WRITERS = 4
+
+
+class InferenceTask:
+    """Project-specific steps of inference.
+
+    The task is sent to the worker processes that load cases, so it should
+    hold only what is needed to load them (e.g. paths and parameters), and
+    not the model.
+
+    """
+
+    def list_cases(self, split: DatasetSplit) -> List[str]:
+        """List the IDs of the cases in a split of the dataset."""
+        raise NotImplementedError
+
+    def load_model(self) -> Any:
+        """Load the model. This is called once, in the main process."""
+        raise NotImplementedError
+
+    def load_case(self, case_id: str) -> Any:
+        """Load the inputs of the model for a case, in a worker process."""
+        raise NotImplementedError
+
+    def predict(self, model: Any, inputs: List[Any]) -> List[Any]:
+        """Run the model on a batch of inputs, returning an output for each."""
+        raise NotImplementedError
+
+    def write_output(self, case_id: str, output: Any, output_dir: Path) -> None:
+        """Write the output for a case, in a writer thread.
+
+        By default, the output is saved as a .npy file named after the case.
+        It is written to a temporary file and renamed, so that an incomplete
+        file is never left with the final name.
+
+        """
+        path = output_dir / f"{case_id}.npy"
+        tmp_path = output_dir / f".{case_id}.npy.tmp"
+        with tmp_path.open("wb") as f:
+            np.save(f, np.asarray(output))
+        os.replace(tmp_path, path)
+
+
+class InferenceSummary(NamedTuple):
+    """Summary of a run of inference."""
+
+    n_cases: int
+    n_skipped: int
+    n_completed: int
+    failed: Dict[str, str]
+    elapsed: float
+    predict_time: float
+
+
+def read_manifest(output_dir: Path) -> Set[str]:
+    """Read the IDs of the completed cases from the manifest.
+
+    Parameters
+    ----------
+    output_dir: pathlib.Path
+        Output directory of the inference.
+
+    Returns
+    -------
+    Set[str]:
+        IDs of the cases whose outputs have been written.
+
+    """
+    manifest_file = output_dir / MANIFEST_FILE
+    if not manifest_file.exists():
+        return set()
+    completed = set()
+    with manifest_file.open() as f:
+        for line in f:
+            try:
+                completed.add(json.loads(line)["case_id"])
+            except (json.JSONDecodeError, KeyError):
+                # Partially written final line
+                continue
+    return completed
+
+
+# Task of a worker process, set by the pool's initializer
+_worker_task: Optional[InferenceTask] = None
+
+
+def _init_worker(task: InferenceTask) -> None:
+    global _worker_task
+    _worker_task = task
+
+
+def _load_case(case_id: str) -> Tuple[str, Any, Optional[str]]:
+    """Load a case in a worker process, returning any error as a string."""
+    assert _worker_task is not None, "The worker was not initialized."
+    try:
+        return case_id, _worker_task.load_case(case_id), None
+    except Exception:
+        return case_id, None, traceback.format_exc()
+
+
+class _Writer:
+    """Writes outputs in a pool of threads and records them in the manifest."""
+
+    def __init__(self, task: InferenceTask, output_dir: Path, n_threads: int):
+        self.task = task
+        self.output_dir = output_dir
+        self.executor = ThreadPoolExecutor(max_workers=n_threads)
+        # Limit the outputs held in memory waiting to be written
+        self.slots = threading.BoundedSemaphore(2 * n_threads)
+        self.lock = threading.Lock()
+        self.manifest = (output_dir / MANIFEST_FILE).open("a")
+        self.n_completed = 0
+        self.failed: Dict[str, str] = {}
+
+    def submit(self, case_id: str, output: Any) -> None:
+        self.slots.acquire()
+        future = self.executor.submit(self._write, case_id, output)
+        future.add_done_callback(lambda _: self.slots.release())
+
+    def _write(self, case_id: str, output: Any) -> None:
+        start = time.perf_counter()
+        try:
+            self.task.write_output(case_id, output, self.output_dir)
+        except Exception:
+            with self.lock:
+                self.failed[case_id] = traceback.format_exc()
+            return
+        record = {
+            "case_id": case_id,
+            "write_s": time.perf_counter() - start,
+            "completed": time.time(),
+        }
+        with self.lock:
+            self.manifest.write(json.dumps(record) + "\n")
+            self.manifest.flush()
+            self.n_completed += 1
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        self.manifest.close()
+
+
+def run_inference(
+    task: InferenceTask,
+    case_ids: Sequence[str],
+    output_dir: Path,
+    batch_size: int = 1,
+    workers: Optional[int] = None,
+    writers: int = DEFAULT_WRITERS,
+    prefetch: Optional[int] = None,
+    verbose: bool = True,
+) -> InferenceSummary:
+    """Run inference on cases, skipping any already completed.
+
+    Parameters
+    ----------
+    task: InferenceTask
+        Project-specific steps of the inference.
+    case_ids: Sequence[str]
+        IDs of the cases to run inference on.
+    output_dir: pathlib.Path
+        Directory to write the outputs and the manifest to. It is created if
+        it does not exist.
+    batch_size: int
+        Maximum number of cases passed to the model at once.
+    workers: Optional[int]
+        Number of worker processes loading cases. By default, the number of
+        CPUs is used.
+    writers: int
+        Number of threads writing outputs.
+    prefetch: Optional[int]
+        Maximum number of cases loaded or being loaded ahead of the model.
+        By default, enough for two batches per worker.
+    verbose: bool
+        Print progress after each batch.
+
+    Returns
+    -------
+    InferenceSummary:
+        Numbers of cases, of cases skipped as already completed, and of cases
+        completed, errors of any failed cases, total time taken, and time
+        spent running the model.
+
+    """
+    start = time.perf_counter()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    completed = read_manifest(output_dir)
+    to_run = [c for c in case_ids if c not in completed]
+    n_skipped = len(case_ids) - len(to_run)
+    workers = workers or os.cpu_count() or 1
+    # At least a full batch must be loaded ahead for the model to run
+    prefetch = max(prefetch or 2 * batch_size * workers, batch_size)
+
+    model = task.load_model()
+    writer = _Writer(task, output_dir, writers)
+    failed: Dict[str, str] = {}
+    predict_time = 0.0
+    n_predicted = 0
+
+    def predict_batch(batch: List[Tuple[str, Any]]) -> None:
+        nonlocal predict_time, n_predicted
+        batch_start = time.perf_counter()
+        outputs = task.predict(model, [inputs for _, inputs in batch])
+        predict_time += time.perf_counter() - batch_start
+        if len(outputs) != len(batch):
+            raise RuntimeError(
+                f"The model returned {len(outputs)} outputs for {len(batch)} cases."
+            )
+        for (case_id, _), output in zip(batch, outputs):
+            writer.submit(case_id, output)
+        n_predicted += len(batch)
+        if verbose:
+            rate = n_predicted / (time.perf_counter() - start)
+            print(f"Predicted {n_predicted} of {len(to_run)} cases ({rate:.2f}/s)")
+
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(task,)
+        ) as executor:
+            remaining = iter(to_run)
+            loading: Set[Future] = set()
+            batch: List[Tuple[str, Any]] = []
+            exhausted = False
+            while True:
+                # Keep the workers busy, up to the limit on cases loaded ahead
+                while not exhausted and len(loading) + len(batch) < prefetch:
+                    case_id = next(remaining, None)
+                    if case_id is None:
+                        exhausted = True
+                    else:
+                        loading.add(executor.submit(_load_case, case_id))
+                if exhausted and len(loading) == 0 and len(batch) == 0:
+                    break
+
+                if len(loading) > 0:
+                    done, loading = wait(loading, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        case_id, inputs, error = future.result()
+                        if error is not None:
+                            failed[case_id] = error
+                        else:
+                            batch.append((case_id, inputs))
+
+                # Run the model on full batches, or on what is left at the end
+                finished = exhausted and len(loading) == 0
+                while len(batch) >= batch_size or (finished and len(batch) > 0):
+                    predict_batch(batch[:batch_size])
+                    batch = batch[batch_size:]
+    finally:
+        writer.close()
+
+    failed.update(writer.failed)
+    return InferenceSummary(
+        n_cases=len(case_ids),
+        n_skipped=n_skipped,
+        n_completed=writer.n_completed,
+        failed=failed,
+        elapsed=time.perf_counter() - start,
+        predict_time=predict_time,
+    )
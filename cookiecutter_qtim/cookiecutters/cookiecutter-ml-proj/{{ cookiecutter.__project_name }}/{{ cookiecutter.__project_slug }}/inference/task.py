@@ -0,0 +1,51 @@
+"""Project-specific steps of running the model on the dataset."""
+from pathlib import Path
+from typing import Any, List
+
+from {{ cookiecutter.__project_slug }}.enums import DatasetSplit
+from {{ cookiecutter.__project_slug }}.inference.pipeline import InferenceTask
+
+
+class ModelInferenceTask(InferenceTask):
+    """Run a trained model of the project on cases of the dataset.
+
+    Fill in the methods below for the project. Until then, no cases are
+    listed, so the infer command has nothing to run. See
+    inference/pipeline.py for where each method is called.
+
+    """
+
+    def __init__(self, model_dir: Path):
+        """Create the task.
+
+        Parameters
+        ----------
+        model_dir: pathlib.Path
+            Output directory of the training job of the model.
+
+        """
+        self.model_dir = model_dir
+
+    def list_cases(self, split: DatasetSplit) -> List[str]:
+        """List the IDs of the cases in a split of the dataset."""
+        # List the cases here...
+        case_ids: List[str] = []
+        return case_ids
+
+    def load_model(self) -> Any:
+        """Load the model from its output directory, e.g. onto the GPU."""
+        # Load the model here...
+        model = None
+        return model
+
+    def load_case(self, case_id: str) -> Any:
+        """Read and preprocess the inputs of a case."""
+        # Load and preprocess the case here, e.g. using the volume cache...
+        inputs = None
+        return inputs
+
+    def predict(self, model: Any, inputs: List[Any]) -> List[Any]:
+        """Run the model on a batch of inputs."""
+        # Run the model here...
+        outputs = inputs
+        return outputs
@@ -1,50 +1,205 @@
-"""Defines locations where project data are stored."""
+"""Defines locations where project data are stored.
+
+Locations are accessed as attributes of this module, e.g.
+``locations.checkpoints_dir``, but are only computed when first accessed.
+Importing this module never accesses the filesystem, since the project
+directories are typically on network filesystems (e.g. /autofs/cluster) that
+may be slow to mount or respond. Use :func:`exists` to check whether a
+location exists without blocking indefinitely.
+
+Any location may be overridden by setting an environment variable named
+{{ cookiecutter.__project_slug | upper }}_ followed by the name of the
+location in upper case, e.g. to point a job at a copy of the dataset on a
+node-local disk:
+
+$ export {{ cookiecutter.__project_slug | upper }}_PROJECT_DATASET_DIR=/scratch/dataset
+
+Locations defined in terms of another location follow any override of it.
+
+"""
+import os
 import sys
+import threading
+from functools import lru_cache
 from pathlib import Path
+from typing import Callable, Dict, List
 from warnings import warn
 
 from importlib_resources import files
 
+# Prefix of the environment variables that override locations
+ENV_VAR_PREFIX = "{{ cookiecutter.__project_slug | upper }}_"
+
+# Maximum time in seconds to wait for the filesystem when checking whether a
+# location exists
+EXISTS_TIMEOUT = 10.0
+
 # Standard location for share mounting
 # This will vary based on the platform
 if sys.platform == "darwin":
     # 'darwin' just means MacOS
-    # Linux servers and containers
-    project_dir = Path("{{ cookiecutter.__mac_project_path }}")
-    project_dataset_dir = Path("{{ cookiecutter.__mac_data_path }}")
+    _DEFAULT_PROJECT_DIR = "{{ cookiecutter.__mac_project_path }}"
+    _DEFAULT_PROJECT_DATASET_DIR = "{{ cookiecutter.__mac_data_path }}"
 else:
     # Linux servers and containers
-    project_dir = Path("{{ cookiecutter.__project_path }}")
-    project_dataset_dir = Path("{{ cookiecutter.__data_path }}")
-
-
-# Issue a warning here if the project locations don't exist
-if not project_dir.exists():
-    warn(
-        "The project directory is not found at the expected location: "
-        f"{project_dir}.",
-        UserWarning,
-    )
-if not project_dataset_dir.exists():
-    warn(
-        "The project dataset directory is not found at the expected location: "
-        f"{project_dataset_dir}.",
-        UserWarning,
-    )
-
-# Location to store checkpoints
-checkpoints_dir = project_dir / "checkpoints"
-
-# Location to store inferences on train/test/val data
-inferences_dir = project_dir / "inferences"
-
-# Location to store results of analyses
-analysis_dir = project_dir / "analysis"
-
-# Location to store visualizations
-vis_dir = project_dir / "vis"
-
-# Location where any resources within the package codebase are installed
-resources_dir = files("{{ cookiecutter.__project_slug }}") / "resources"
-# Location where train configs are kept
-train_configs_dir = resources_dir / "training_configs"
+    _DEFAULT_PROJECT_DIR = "{{ cookiecutter.__project_path }}"
+    _DEFAULT_PROJECT_DATASET_DIR = "{{ cookiecutter.__data_path }}"
+
+
+@lru_cache(maxsize=None)
+def get_location(name: str) -> Path:
+    """Get a location by name.
+
+    The location is computed on first access, from its environment variable
+    if set or otherwise from its default value, and is the same for the
+    rest of the process.
+
+    Parameters
+    ----------
+    name: str
+        Name of the location, e.g. 'checkpoints_dir'.
+
+    Returns
+    -------
+    pathlib.Path:
+        The location.
+
+    Raises
+    ------
+    KeyError:
+        If there is no location with this name.
+
+    """
+    if name not in _LOCATIONS:
+        raise KeyError(f"Unknown location '{name}'.")
+    override = os.environ.get(f"{ENV_VAR_PREFIX}{name.upper()}")
+    if override:
+        return Path(override)
+    return _LOCATIONS[name]()
+
+
+# Functions giving the default value of each location. Add new locations
+# here, using get_location() to refer to other locations.
+_LOCATIONS: Dict[str, Callable[[], Path]] = {
+    # Root of the project directory on the share
+    "project_dir": lambda: Path(_DEFAULT_PROJECT_DIR),
+    # Root of the project dataset on the share
+    "project_dataset_dir": lambda: Path(_DEFAULT_PROJECT_DATASET_DIR),
+    # Location to store checkpoints
+    "checkpoints_dir": lambda: get_location("project_dir") / "checkpoints",
+    # Location to store the configs and job scripts of hyperparameter sweeps
+    "sweeps_dir": lambda: get_location("project_dir") / "sweeps",
+    # Location to store inferences on train/test/val data
+    "inferences_dir": lambda: get_location("project_dir") / "inferences",
+    # Location to store results of analyses
+    "analysis_dir": lambda: get_location("project_dir") / "analysis",
+    # Location to store visualizations
+    "vis_dir": lambda: get_location("project_dir") / "vis",
+    # Index of the metadata of the files in the project dataset
+    "dataset_index_file": lambda: get_location("project_dir") / "dataset_index.sqlite",
+    # Location of the cache of preprocessed volumes
+    "volume_cache_dir": lambda: get_location("project_dir") / "volume_cache",
+    # Location where any resources within the package codebase are installed
+    "resources_dir": lambda: Path(str(files(__package__) / "resources")),
+    # Location where train configs are kept
+    "train_configs_dir": lambda: get_location("resources_dir") / "training_configs",
+}
+
+
+def all_locations() -> Dict[str, Path]:
+    """Get all locations.
+
+    Returns
+    -------
+    Dict[str, pathlib.Path]:
+        Mapping from the name of each location to the location.
+
+    """
+    return {name: get_location(name) for name in _LOCATIONS}
+
+
+# Results of existence checks, and the threads performing them
+_exists_results: Dict[Path, bool] = {}
+_exists_threads: Dict[Path, threading.Thread] = {}
+_exists_lock = threading.Lock()
+
+
+def _check_exists(path: Path) -> None:
+    _exists_results[path] = path.exists()
+
+
+def exists(path: Path, timeout: float = EXISTS_TIMEOUT) -> bool:
+    """Check whether a path exists, without blocking indefinitely.
+
+    The check is performed once per path in a background thread, and the
+    result is cached for the rest of the process. If the filesystem does not
+    respond within the timeout (e.g. because a network filesystem is hung),
+    the path is treated as not existing. Calling this with a timeout of 0
+    starts the check without waiting for it, so that its result is ready
+    when needed later.
+
+    Parameters
+    ----------
+    path: pathlib.Path
+        Path to check.
+    timeout: float
+        Maximum time in seconds to wait for the result.
+
+    Returns
+    -------
+    bool:
+        Whether the path exists.
+
+    """
+    path = Path(path)
+    with _exists_lock:
+        if path not in _exists_threads:
+            # A daemon thread does not prevent the process exiting if hung
+            thread = threading.Thread(target=_check_exists, args=(path,), daemon=True)
+            thread.start()
+            _exists_threads[path] = thread
+    _exists_threads[path].join(timeout)
+    if path not in _exists_results:
+        if timeout > 0:
+            warn(
+                f"Timed out after {timeout}s checking whether {path} exists.",
+                UserWarning,
+            )
+        return False
+    return _exists_results[path]
+
+
+@lru_cache(maxsize=None)
+def check_locations() -> None:
+    """Issue a warning if the project locations don't exist.
+
+    This should be called by commands that use the project locations, before
+    using them. The warnings are only issued once per process.
+
+    """
+    project_dir = get_location("project_dir")
+    if not exists(project_dir):
+        warn(
+            "The project directory is not found at the expected location: "
+            f"{project_dir}.",
+            UserWarning,
+        )
+    project_dataset_dir = get_location("project_dataset_dir")
+    if not exists(project_dataset_dir):
+        warn(
+            "The project dataset directory is not found at the expected location: "
+            f"{project_dataset_dir}.",
+            UserWarning,
+        )
+
+
+def __getattr__(name: str) -> Path:
+    """Compute locations when they are first accessed as attributes."""
+    if name in _LOCATIONS:
+        return get_location(name)
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+def __dir__() -> List[str]:
+    """List the attributes of the module, including the locations."""
+    return sorted(list(globals()) + list(_LOCATIONS))
@@ -0,0 +1,368 @@
+"""Index of the metadata of the DICOM files in a dataset.
+
+The index is a SQLite database with one row per file, holding selected
+header attributes of each DICOM instance, and views summarizing the series
+and studies. Headers are read in parallel in a pool of worker processes,
+without reading pixel data. The modification time and size of each file are
+stored along with its metadata, so that updating the index only reads the
+files that are new or have changed since it was last updated.
+
+Paths are stored relative to the dataset directory, so the same index can be
+used with a copy of the dataset in another location.
+
+"""
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+# Columns of the index holding header attributes, and the keyword of the
+# attribute stored in each. Add further attributes here as needed.
+HEADER_COLUMNS: Dict[str, str] = {
+    "patient_id": "PatientID",
+    "study_uid": "StudyInstanceUID",
+    "study_date": "StudyDate",
+    "study_description": "StudyDescription",
+    "series_uid": "SeriesInstanceUID",
+    "series_number": "SeriesNumber",
+    "series_description": "SeriesDescription",
+    "modality": "Modality",
+    "sop_uid": "SOPInstanceUID",
+    "instance_number": "InstanceNumber",
+    "rows": "Rows",
+    "columns": "Columns",
+}
+
+# Modalities of series that are not stacks of image slices, such as
+# segmentations, structure sets and reports, and so are not read as volumes
+NON_VOLUME_MODALITIES = ("SEG", "RTSTRUCT", "RTPLAN", "RTDOSE", "SR", "KO", "PR", "REG")
+
+# Number of files read by a worker process at a time
+DEFAULT_CHUNK_SIZE = 64
+
+# Number of rows written to the index between commits, so that an interrupted
+# run keeps most of its progress
+COMMIT_INTERVAL = 5000
+
+_FILE_COLUMNS = ["path", "mtime_ns", "size", "is_dicom", "error"]
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    is_dicom INTEGER NOT NULL,
+    error TEXT,
+    {', '.join(HEADER_COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS files_series_uid ON files (series_uid);
+CREATE VIEW IF NOT EXISTS series AS
+    SELECT
+        patient_id, study_uid, series_uid, series_number,
+        series_description, modality, COUNT(*) AS n_instances
+    FROM files
+    WHERE is_dicom
+    GROUP BY series_uid;
+CREATE VIEW IF NOT EXISTS studies AS
+    SELECT
+        patient_id, study_uid, study_date, study_description,
+        COUNT(DISTINCT series_uid) AS n_series, COUNT(*) AS n_instances
+    FROM files
+    WHERE is_dicom
+    GROUP BY study_uid;
+"""
+
+
+class IndexSummary(NamedTuple):
+    """Summary of an update of the index."""
+
+    n_files: int
+    n_read: int
+    n_removed: int
+    n_dicom: int
+    elapsed: float
+
+
+def _scan_dir(directory: str) -> List[Tuple[str, int, int]]:
+    """List all files below a directory with their modification time and size."""
+    files = []
+    stack = [directory]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files.append((entry.path, stat.st_mtime_ns, stat.st_size))
+    return files
+
+
+def scan_dataset(
+    dataset_dir: Path, max_workers: int = 16
+) -> Iterator[Tuple[str, int, int]]:
+    """Find all files in a dataset with their modification time and size.
+
+    Each top-level sub-directory is scanned in a separate thread, since on a
+    network filesystem most of the time is spent waiting for the server.
+
+    Parameters
+    ----------
+    dataset_dir: pathlib.Path
+        Root directory of the dataset.
+    max_workers: int
+        Maximum number of directories to scan concurrently.
+
+    Yields
+    ------
+    str:
+        Path of the file relative to the dataset directory.
+    int:
+        Modification time of the file in nanoseconds.
+    int:
+        Size of the file in bytes.
+
+    """
+    root = str(dataset_dir)
+    subdirs = []
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.is_file():
+                stat = entry.stat()
+                yield entry.name, stat.st_mtime_ns, stat.st_size
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for files in executor.map(_scan_dir, subdirs):
+            for path, mtime_ns, size in files:
+                yield os.path.relpath(path, root), mtime_ns, size
+
+
+def _convert_value(value: Any) -> Any:
+    """Convert a DICOM attribute value to a type that SQLite can store."""
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    return str(value)
+
+
+def read_header(args: Tuple[str, str, int, int]) -> Tuple[Any, ...]:
+    """Read the header attributes of a file for the index.
+
+    This runs within worker processes, so must not raise.
+
+    Parameters
+    ----------
+    args: Tuple[str, str, int, int]
+        Path to the dataset directory, path of the file relative to it, and
+        modification time and size of the file.
+
+    Returns
+    -------
+    Tuple[Any, ...]:
+        Row of the index for the file.
+
+    """
+    import pydicom
+    from pydicom.errors import InvalidDicomError
+
+    dataset_dir, path, mtime_ns, size = args
+    try:
+        dcm = pydicom.dcmread(
+            os.path.join(dataset_dir, path),
+            stop_before_pixels=True,
+            specific_tags=list(HEADER_COLUMNS.values()),
+        )
+    except InvalidDicomError:
+        return (path, mtime_ns, size, 0, None) + (None,) * len(HEADER_COLUMNS)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        return (path, mtime_ns, size, 0, error) + (None,) * len(HEADER_COLUMNS)
+    values = tuple(
+        _convert_value(dcm.get(keyword)) for keyword in HEADER_COLUMNS.values()
+    )
+    return (path, mtime_ns, size, 1, None) + values
+
+
+def connect_index(index_file: Path) -> sqlite3.Connection:
+    """Open the index, creating it if it does not exist.
+
+    Parameters
+    ----------
+    index_file: pathlib.Path
+        Path to the SQLite database file of the index.
+
+    Returns
+    -------
+    sqlite3.Connection:
+        Connection to the index.
+
+    """
+    index_file.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(str(index_file))
+    db.executescript(_SCHEMA)
+    return db
+
+
+def update_index(
+    dataset_dir: Path,
+    index_file: Path,
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    verbose: bool = True,
+) -> IndexSummary:
+    """Update the index of a dataset with any new, changed or removed files.
+
+    Parameters
+    ----------
+    dataset_dir: pathlib.Path
+        Root directory of the dataset.
+    index_file: pathlib.Path
+        Path to the SQLite database file of the index.
+    workers: Optional[int]
+        Number of worker processes reading headers. By default, the number
+        of CPUs is used.
+    chunk_size: int
+        Number of files read by a worker process at a time.
+    verbose: bool
+        Print progress while reading headers.
+
+    Returns
+    -------
+    IndexSummary:
+        Numbers of files found, read and removed from the index, number of
+        DICOM files in the index, and the time taken in seconds.
+
+    """
+    start = time.perf_counter()
+    db = connect_index(index_file)
+    try:
+        indexed = {
+            path: (mtime_ns, size)
+            for path, mtime_ns, size in db.execute(
+                "SELECT path, mtime_ns, size FROM files"
+            )
+        }
+
+        to_read = []
+        n_files = 0
+        for path, mtime_ns, size in scan_dataset(dataset_dir):
+            n_files += 1
+            if indexed.pop(path, None) != (mtime_ns, size):
+                to_read.append((str(dataset_dir), path, mtime_ns, size))
+
+        # Files still in the dict have been removed from the dataset
+        db.executemany("DELETE FROM files WHERE path = ?", ((p,) for p in indexed))
+        db.commit()
+
+        columns = _FILE_COLUMNS + list(HEADER_COLUMNS)
+        insert = (
+            f"INSERT OR REPLACE INTO files ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})"
+        )
+        if len(to_read) > 0:
+            with Pool(workers) as pool:
+                rows = []
+                results = pool.imap_unordered(
+                    read_header, to_read, chunksize=chunk_size
+                )
+                for i, row in enumerate(results, start=1):
+                    rows.append(row)
+                    if len(rows) >= COMMIT_INTERVAL:
+                        db.executemany(insert, rows)
+                        db.commit()
+                        rows = []
+                    if verbose and i % COMMIT_INTERVAL == 0:
+                        rate = i / (time.perf_counter() - start)
+                        print(f"Read {i} of {len(to_read)} files ({rate:.0f}/s)")
+                db.executemany(insert, rows)
+                db.commit()
+
+        n_dicom = db.execute("SELECT COUNT(*) FROM files WHERE is_dicom").fetchone()[0]
+    finally:
+        db.close()
+
+    return IndexSummary(
+        n_files=n_files,
+        n_read=len(to_read),
+        n_removed=len(indexed),
+        n_dicom=n_dicom,
+        elapsed=time.perf_counter() - start,
+    )
+
+
+def get_series_files(
+    index_file: Path,
+    dataset_dir: Path,
+    series_uids: Optional[List[str]] = None,
+) -> Dict[str, List[Path]]:
+    """Get the files of each series in the index.
+
+    Parameters
+    ----------
+    index_file: pathlib.Path
+        Path to the SQLite database file of the index.
+    dataset_dir: pathlib.Path
+        Root directory of the dataset, which the paths are made relative to.
+    series_uids: Optional[List[str]]
+        Series to get. By default, all series in the index are returned.
+
+    Returns
+    -------
+    Dict[str, List[pathlib.Path]]:
+        Mapping from the instance UID of each series to its files, in order of
+        instance number.
+
+    """
+    db = connect_index(index_file)
+    try:
+        rows = db.execute(
+            "SELECT series_uid, path FROM files WHERE is_dicom "
+            "ORDER BY series_uid, instance_number, path"
+        ).fetchall()
+    finally:
+        db.close()
+
+    wanted = set(series_uids) if series_uids is not None else None
+    series: Dict[str, List[Path]] = {}
+    for series_uid, path in rows:
+        if wanted is None or series_uid in wanted:
+            series.setdefault(series_uid, []).append(dataset_dir / path)
+    return series
+
+
+def get_non_volume_series(index_file: Path) -> Set[str]:
+    """Find the series in the index that are not volumes.
+
+    A series is not a volume if its modality is one of
+    NON_VOLUME_MODALITIES, or any of its files has no pixel data.
+
+    Parameters
+    ----------
+    index_file: pathlib.Path
+        Path to the SQLite database file of the index.
+
+    Returns
+    -------
+    Set[str]:
+        Instance UIDs of the series that are not volumes.
+
+    """
+    placeholders = ", ".join("?" * len(NON_VOLUME_MODALITIES))
+    db = connect_index(index_file)
+    try:
+        rows = db.execute(
+            "SELECT DISTINCT series_uid FROM files WHERE is_dicom AND "
+            f"(rows IS NULL OR modality IN ({placeholders}))",
+            NON_VOLUME_MODALITIES,
+        ).fetchall()
+    finally:
+        db.close()
+    return {series_uid for (series_uid,) in rows}
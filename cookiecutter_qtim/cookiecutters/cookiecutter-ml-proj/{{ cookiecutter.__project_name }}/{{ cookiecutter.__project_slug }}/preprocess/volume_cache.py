@@ -0,0 +1,439 @@
+"""Cache of preprocessed volumes stored as memory-mappable arrays.
+
+Decoding a DICOM series from a network filesystem is slow, and training
+typically needs the same volumes every epoch. This caches each volume after
+decoding and preprocessing as a .npy file, along with a small JSON header
+describing it (shape, dtype, spacing, orientation etc.). Cached volumes are
+opened as memory-mapped arrays, so loading one does not read or copy the
+whole array, and pages are shared between processes reading the same volume.
+
+Each volume is stored under a key that is a hash of its source files and the
+preprocessing parameters, so changing either gives a new entry rather than
+returning stale data. By default, the files are identified by their paths,
+sizes and modification times, which is fast. Optionally, their contents are
+hashed instead, so that copies of the files (e.g. at a new path, or with new
+modification times) share the cached volume. The least recently used volumes
+are evicted when the total size of the cache exceeds a limit.
+
+Example
+-------
+>>> cache = VolumeCache()
+>>> volume = cache.get_or_create(series_files, {"window": [-1000, 400]}, decode)
+>>> volume.array  # np.memmap
+
+"""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from {{ cookiecutter.__project_slug }} import locations
+
+# Default maximum total size of the cached arrays in bytes
+DEFAULT_MAX_BYTES = 100 * 1024**3
+
+# Fraction of the maximum size that the cache is reduced to when volumes are
+# evicted, so that it is not scanned again for every volume stored after it
+# becomes full
+EVICT_TARGET = 0.9
+
+# Maximum time in seconds to wait for another process creating the same
+# volume, after which it is assumed to have failed
+LOCK_TIMEOUT = 600.0
+
+# Type of the functions that create a volume from its source files and the
+# preprocessing parameters, returning the array and any header fields
+CreateFunction = Callable[[Sequence[Path], Dict[str, Any]], Tuple[np.ndarray, Dict]]
+
+
+class CachedVolume(NamedTuple):
+    """A volume from the cache."""
+
+    # Memory-mapped, read-only array
+    array: np.ndarray
+    # Description of the volume, including any fields from its creation
+    header: Dict[str, Any]
+
+
+def hash_sources(sources: Sequence[Path], content: bool = False) -> str:
+    """Compute a hash identifying the source files of a volume.
+
+    Parameters
+    ----------
+    sources: Sequence[pathlib.Path]
+        Source files of the volume. The order does not matter.
+    content: bool
+        Hash the contents of the files, regardless of their paths and
+        modification times, so that copies of the same files have the same
+        hash. Otherwise, the path, size and modification time of each file is
+        used, which is much faster (since the files do not need to be read)
+        and detects any change made by writing to the files.
+
+    Returns
+    -------
+    str:
+        Hexadecimal hash of the source files.
+
+    """
+    if content:
+        # Sort the hashes of the files rather than their paths, so that the
+        # result does not depend on the names of the files
+        digests = []
+        for source in sources:
+            file_sha = hashlib.sha256()
+            with open(source, "rb") as f:
+                for block in iter(lambda: f.read(1024**2), b""):
+                    file_sha.update(block)
+            digests.append(file_sha.hexdigest())
+        return hashlib.sha256("\n".join(sorted(digests)).encode()).hexdigest()
+
+    sha = hashlib.sha256()
+    for path in sorted(str(p) for p in sources):
+        stat = os.stat(path)
+        sha.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return sha.hexdigest()
+
+
+class VolumeCache:
+    """Cache of preprocessed volumes in the project directory.
+
+    Entries are stored in sub-directories of the cache directory named
+    after the first two characters of their key, as <key>.npy (the array)
+    and <key>.json (the header). An entry is only valid once its header has
+    been written, and files are written to temporary names and then renamed,
+    so readers never see partially written entries. The modification time of
+    the header records when the entry was last used.
+
+    The total size of the cache is only scanned when the first volume is
+    stored, and then tracked as volumes are stored, so that volumes are only
+    evicted (which requires scanning the cache again) when the tracked size
+    exceeds the limit. Volumes stored by other processes are not tracked, so
+    when several processes fill the cache, call :meth:`evict` once they have
+    finished to enforce the limit.
+
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        """Open a cache, creating its directory if necessary.
+
+        Parameters
+        ----------
+        cache_dir: Optional[pathlib.Path]
+            Directory of the cache. Defaults to the project's volume cache
+            directory.
+        max_bytes: int
+            Maximum total size of the cached arrays in bytes.
+
+        """
+        self.cache_dir = (
+            Path(cache_dir) if cache_dir is not None else locations.volume_cache_dir
+        )
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Total size of the cached arrays, scanned when first needed
+        self._size: Optional[int] = None
+
+    @staticmethod
+    def key(
+        sources: Sequence[Path],
+        params: Dict[str, Any],
+        content_hash: bool = False,
+    ) -> str:
+        """Compute the key of a volume.
+
+        Parameters
+        ----------
+        sources: Sequence[pathlib.Path]
+            Source files of the volume.
+        params: Dict[str, Any]
+            Preprocessing parameters, which must be JSON serializable.
+        content_hash: bool
+            Hash the contents of the source files, rather than their
+            metadata. See :func:`hash_sources`.
+
+        Returns
+        -------
+        str:
+            Key of the volume.
+
+        """
+        sha = hashlib.sha256()
+        sha.update(hash_sources(sources, content=content_hash).encode())
+        sha.update(json.dumps(params, sort_keys=True).encode())
+        return sha.hexdigest()
+
+    def _paths(self, key: str) -> Tuple[Path, Path]:
+        directory = self.cache_dir / key[:2]
+        return directory / f"{key}.npy", directory / f"{key}.json"
+
+    def get(self, key: str) -> Optional[CachedVolume]:
+        """Get a volume from the cache.
+
+        Parameters
+        ----------
+        key: str
+            Key of the volume.
+
+        Returns
+        -------
+        Optional[CachedVolume]:
+            The volume, or None if it is not in the cache.
+
+        """
+        array_path, header_path = self._paths(key)
+        try:
+            with header_path.open() as f:
+                header = json.load(f)
+            array = np.load(array_path, mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None
+        # Record the use of the entry for eviction
+        try:
+            os.utime(header_path)
+        except OSError:
+            pass
+        return CachedVolume(array, header)
+
+    def put(
+        self,
+        key: str,
+        array: np.ndarray,
+        header: Optional[Dict[str, Any]] = None,
+    ) -> CachedVolume:
+        """Store a volume in the cache.
+
+        Parameters
+        ----------
+        key: str
+            Key of the volume.
+        array: np.ndarray
+            The volume. It is stored as a contiguous array.
+        header: Optional[Dict[str, Any]]
+            JSON serializable description of the volume, e.g. its spacing and
+            orientation. The shape and dtype of the array are added to it.
+
+        Returns
+        -------
+        CachedVolume:
+            The stored volume, memory-mapped from the cache.
+
+        """
+        array_path, header_path = self._paths(key)
+        array_path.parent.mkdir(exist_ok=True)
+        header = dict(header or {})
+        header.update(
+            shape=list(array.shape),
+            dtype=str(array.dtype),
+            created=time.time(),
+        )
+
+        suffix = f".{os.getpid()}.tmp"
+        tmp_array_path = array_path.with_name(array_path.name + suffix)
+        tmp_header_path = header_path.with_name(header_path.name + suffix)
+        with tmp_array_path.open("wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+        with tmp_header_path.open("w") as f:
+            json.dump(header, f, indent=2)
+        os.replace(tmp_array_path, array_path)
+        os.replace(tmp_header_path, header_path)
+
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += array_path.stat().st_size
+        if self._size > self.max_bytes:
+            self.evict(keep=key)
+        return CachedVolume(np.load(array_path, mmap_mode="r"), header)
+
+    def get_or_create(
+        self,
+        sources: Sequence[Path],
+        params: Dict[str, Any],
+        create: CreateFunction,
+        content_hash: bool = False,
+    ) -> CachedVolume:
+        """Get a volume from the cache, creating it if it is not cached.
+
+        If another process is already creating the same volume, this waits
+        for it rather than creating the volume again.
+
+        Parameters
+        ----------
+        sources: Sequence[pathlib.Path]
+            Source files of the volume.
+        params: Dict[str, Any]
+            Preprocessing parameters, which must be JSON serializable.
+        create: Callable[[Sequence[Path], Dict[str, Any]], Tuple[np.ndarray, Dict]]
+            Function that creates the volume from the source files and
+            parameters, returning the array and fields to add to its header.
+            See :func:`read_dicom_series` for an example.
+        content_hash: bool
+            Hash the contents of the source files, rather than their
+            metadata. See :func:`hash_sources`.
+
+        Returns
+        -------
+        CachedVolume:
+            The volume, memory-mapped from the cache.
+
+        """
+        key = self.key(sources, params, content_hash=content_hash)
+        volume = self.get(key)
+        if volume is not None:
+            return volume
+
+        array_path, _ = self._paths(key)
+        array_path.parent.mkdir(exist_ok=True)
+        lock_path = array_path.with_suffix(".lock")
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if time.monotonic() > deadline:
+                    # Assume the other process failed
+                    break
+                time.sleep(0.5)
+                volume = self.get(key)
+                if volume is not None:
+                    return volume
+                continue
+            os.close(fd)
+            break
+
+        try:
+            array, header = create(sources, params)
+            header = dict(header, params=params, n_sources=len(sources))
+            return self.put(key, array, header)
+        finally:
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        """List the last use time, size and key of each cache entry."""
+        entries = []
+        for header_path in self.cache_dir.glob("*/*.json"):
+            key = header_path.stem
+            array_path, _ = self._paths(key)
+            try:
+                used = header_path.stat().st_mtime
+                size = array_path.stat().st_size
+            except FileNotFoundError:
+                continue
+            entries.append((used, size, key))
+        return entries
+
+    def size(self) -> int:
+        """Total size of the cached arrays in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Remove the least recently used volumes if the cache exceeds its limit.
+
+        Volumes are removed until the cache is reduced to a fraction
+        (EVICT_TARGET) of its limit.
+
+        Parameters
+        ----------
+        keep: Optional[str]
+            Key of a volume that should not be removed, e.g. one that was just
+            added.
+
+        Returns
+        -------
+        int:
+            Number of bytes freed.
+
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        target = self.max_bytes * EVICT_TARGET if total > self.max_bytes else total
+        for _, size, key in entries:
+            if total - freed <= target:
+                break
+            if key == keep:
+                continue
+            array_path, header_path = self._paths(key)
+            # Remove the header first, so the entry is invalid before the
+            # array is removed. Processes that already have the array
+            # memory-mapped can continue to use it.
+            for path in (header_path, array_path):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            freed += size
+        self._size = total - freed
+        return freed
+
+
+def read_dicom_series(
+    sources: Sequence[Path], params: Dict[str, Any]
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Read a DICOM series as a volume, for use with the cache.
+
+    The slices are sorted along the normal of the image plane and stacked
+    into an array of shape (slices, rows, columns), with the rescale slope
+    and intercept of each slice applied.
+
+    Parameters
+    ----------
+    sources: Sequence[pathlib.Path]
+        Files of the instances of the series.
+    params: Dict[str, Any]
+        Preprocessing parameters. If it contains 'window', a pair of values,
+        the intensities are clipped to this range.
+
+    Returns
+    -------
+    np.ndarray:
+        The volume.
+    Dict[str, Any]:
+        Spacing (between slices, rows and columns), orientation (cosines of
+        the row and column directions), and origin (position of the first
+        voxel) of the volume in patient coordinates (mm).
+
+    """
+    import pydicom
+
+    slices = [pydicom.dcmread(p) for p in sources]
+    orientation = np.array(slices[0].ImageOrientationPatient, dtype=float)
+    normal = np.cross(orientation[:3], orientation[3:])
+    positions = np.array([s.ImagePositionPatient for s in slices], dtype=float)
+    order = np.argsort(positions @ normal)
+    slices = [slices[i] for i in order]
+    positions = positions[order]
+
+    # The rescale slope and intercept may differ between slices
+    slopes = np.array([float(getattr(s, "RescaleSlope", 1.0)) for s in slices])
+    intercepts = np.array([float(getattr(s, "RescaleIntercept", 0.0)) for s in slices])
+    array = np.stack([s.pixel_array for s in slices])
+    if np.any(slopes != 1.0) or np.any(intercepts != 0.0):
+        array = (
+            array.astype(np.float32) * slopes[:, np.newaxis, np.newaxis]
+            + intercepts[:, np.newaxis, np.newaxis]
+        ).astype(np.float32)
+    if "window" in params:
+        array = np.clip(array, *params["window"])
+
+    if len(slices) > 1:
+        slice_spacing = float(np.median(np.diff(positions @ normal)))
+    else:
+        slice_spacing = float(getattr(slices[0], "SliceThickness", 1.0))
+    header = {
+        "spacing": [slice_spacing] + [float(v) for v in slices[0].PixelSpacing],
+        "orientation": orientation.tolist(),
+        "origin": positions[0].tolist(),
+    }
+    return array, header
@@ -0,0 +1,365 @@
+"""Multi-process data loading into shared memory.
+
+:class:`PrefetchLoader` decodes and augments samples in a pool of worker
+processes, which write batches directly into a ring buffer of slots in shared
+memory. Only indices and slot numbers are passed between processes, so large
+arrays are never pickled. At most ``prefetch_depth`` batches are prepared
+ahead of the training loop: once every slot is in use, no further batches are
+requested until the training loop has consumed one, so memory use is bounded
+however far the workers get ahead.
+
+A dataset is any object with ``__len__`` and ``__getitem__``, where
+``__getitem__`` returns a dictionary of arrays with fixed shapes (e.g. the
+image and label of a sample). The shapes and dtypes of the arrays are given
+to the loader in advance, to lay out the shared memory. A dataset may also
+define ``read_into(index, out)``, which writes a sample into the given
+dictionary of arrays, to avoid copying it into the buffer.
+
+Example
+-------
+>>> fields = {"image": ((1, 128, 128, 128), np.float32)}
+>>> loader = PrefetchLoader(dataset, fields, batch_size=4, num_workers=8)
+>>> for epoch in range(n_epochs):
+...     for batch in loader:
+...         train_step(batch["image"])
+>>> loader.close()
+
+This does not depend on torch, but with ``as_torch=True`` batches are
+returned as torch tensors sharing memory with the buffer.
+
+"""
+import ctypes
+import multiprocessing
+import os
+import queue
+import random
+import traceback
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Shape (of a single sample) and dtype of each array in a sample
+FieldSpec = Mapping[str, Tuple[Sequence[int], Any]]
+
+# Alignment of each array in the shared memory buffer in bytes
+_ALIGNMENT = 64
+
+# Time in seconds between checks that the workers are still running while
+# waiting for a batch
+_POLL_INTERVAL = 1.0
+
+
+def _slot_layout(
+    fields: FieldSpec, batch_size: int
+) -> Tuple[Dict[str, Tuple[int, Tuple[int, ...], np.dtype]], int]:
+    """Compute the offset, shape and dtype of each array within a slot.
+
+    Returns the layout and the size of a slot in bytes.
+
+    """
+    layout = {}
+    offset = 0
+    for name, (shape, dtype) in fields.items():
+        dtype = np.dtype(dtype)
+        batch_shape = (batch_size,) + tuple(shape)
+        layout[name] = (offset, batch_shape, dtype)
+        nbytes = int(np.prod(batch_shape)) * dtype.itemsize
+        offset += -(-nbytes // _ALIGNMENT) * _ALIGNMENT
+    return layout, offset
+
+
+def _slot_views(
+    buffer: Any, fields: FieldSpec, batch_size: int, n_slots: int
+) -> List[Dict[str, np.ndarray]]:
+    """Create arrays viewing each slot of the shared buffer."""
+    layout, slot_size = _slot_layout(fields, batch_size)
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    return [
+        {
+            name: np.ndarray(
+                shape, dtype=dtype, buffer=data, offset=slot * slot_size + offset
+            )
+            for name, (offset, shape, dtype) in layout.items()
+        }
+        for slot in range(n_slots)
+    ]
+
+
+def _worker_loop(
+    dataset: Any,
+    fields: FieldSpec,
+    batch_size: int,
+    n_slots: int,
+    buffer: Any,
+    task_queue: multiprocessing.Queue,
+    result_queue: multiprocessing.Queue,
+    seed: int,
+) -> None:
+    """Main function of the worker processes.
+
+    Each task is a batch number, a slot and the indices of the samples in the
+    batch. The samples are written to the slot and the batch number, slot,
+    number of samples and any error are put in the result queue.
+
+    """
+    np.random.seed(seed % 2**32)
+    random.seed(seed)
+    slots = _slot_views(buffer, fields, batch_size, n_slots)
+    read_into = getattr(dataset, "read_into", None)
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        batch_id, slot, indices = task
+        try:
+            for i, index in enumerate(indices):
+                out = {name: array[i] for name, array in slots[slot].items()}
+                if read_into is not None:
+                    read_into(index, out)
+                else:
+                    sample = dataset[index]
+                    for name, array in out.items():
+                        array[...] = sample[name]
+        except Exception:
+            result_queue.put((batch_id, slot, 0, traceback.format_exc()))
+        else:
+            result_queue.put((batch_id, slot, len(indices), None))
+
+
+class PrefetchLoader:
+    """Iterate over batches of a dataset prepared by worker processes.
+
+    Each iteration over the loader is one epoch. The worker processes are
+    started on the first iteration and kept for later epochs, until
+    :meth:`close` is called or the loader is used as a context manager.
+
+    The arrays of each batch are views of the shared buffer, which are only
+    valid until the next batch is requested. Copy them (e.g. by moving them
+    to the GPU) if they are needed for longer.
+
+    """
+
+    def __init__(
+        self,
+        dataset: Any,
+        fields: FieldSpec,
+        batch_size: int,
+        num_workers: Optional[int] = None,
+        prefetch_depth: Optional[int] = None,
+        shuffle: bool = True,
+        drop_last: bool = False,
+        seed: Optional[int] = None,
+        as_torch: bool = False,
+    ):
+        """Create a loader.
+
+        Parameters
+        ----------
+        dataset: Any
+            Dataset with ``__len__`` and ``__getitem__`` methods, which must
+            be picklable to send it to the worker processes.
+        fields: Dict[str, Tuple[Sequence[int], Any]]
+            Shape and dtype of each array in a sample.
+        batch_size: int
+            Number of samples in a batch.
+        num_workers: Optional[int]
+            Number of worker processes. By default, the number of CPUs is
+            used.
+        prefetch_depth: Optional[int]
+            Maximum number of batches prepared ahead of the training loop,
+            i.e. the number of slots in the ring buffer. By default, twice the
+            number of workers.
+        shuffle: bool
+            Shuffle the samples each epoch.
+        drop_last: bool
+            Skip the final batch of each epoch if it is incomplete.
+        seed: Optional[int]
+            Seed for the order of samples and for the random number generators
+            of the workers (as used for augmentation).
+        as_torch: bool
+            Return torch tensors instead of numpy arrays.
+
+        """
+        self.dataset = dataset
+        self.fields = fields
+        self.batch_size = batch_size
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.prefetch_depth = prefetch_depth or 2 * self.num_workers
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.as_torch = as_torch
+
+        self._seed = seed if seed is not None else random.randrange(2**32)
+        self._rng = np.random.default_rng(self._seed)
+        self._workers: List[multiprocessing.Process] = []
+        self._in_flight = 0
+        self._slots: List[Dict[str, np.ndarray]] = []
+
+    def __len__(self) -> int:
+        """Number of batches in an epoch."""
+        if self.drop_last:
+            return len(self.dataset) // self.batch_size
+        return -(-len(self.dataset) // self.batch_size)
+
+    def _start(self) -> None:
+        """Allocate the shared buffer and start the worker processes."""
+        if len(self._workers) > 0:
+            return
+        context = multiprocessing.get_context()
+        _, slot_size = _slot_layout(self.fields, self.batch_size)
+        buffer = context.RawArray(ctypes.c_uint8, slot_size * self.prefetch_depth)
+        self._slots = _slot_views(
+            buffer, self.fields, self.batch_size, self.prefetch_depth
+        )
+        self._task_queue = context.Queue()
+        self._result_queue = context.Queue()
+        for i in range(self.num_workers):
+            worker = context.Process(
+                target=_worker_loop,
+                args=(
+                    self.dataset,
+                    self.fields,
+                    self.batch_size,
+                    self.prefetch_depth,
+                    buffer,
+                    self._task_queue,
+                    self._result_queue,
+                    self._seed + i + 1,
+                ),
+                daemon=True,
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def _get_result(self) -> Tuple[int, int, int, Optional[str]]:
+        """Wait for a worker to finish a batch."""
+        while True:
+            try:
+                result = self._result_queue.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                if not all(w.is_alive() for w in self._workers):
+                    self.close()
+                    raise RuntimeError("A data loader worker exited unexpectedly.")
+                continue
+            self._in_flight -= 1
+            return result
+
+    def _drain(self) -> None:
+        """Wait for batches of an abandoned epoch, so their slots are free."""
+        while self._in_flight > 0:
+            self._get_result()
+
+    def _batch(self, slot: int, n_samples: int) -> Dict[str, Any]:
+        batch = {name: array[:n_samples] for name, array in self._slots[slot].items()}
+        if self.as_torch:
+            import torch
+
+            batch = {name: torch.from_numpy(array) for name, array in batch.items()}
+        return batch
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over the batches of an epoch."""
+        self._start()
+        self._drain()
+
+        n_samples = len(self.dataset)
+        if self.shuffle:
+            order = self._rng.permutation(n_samples)
+        else:
+            order = np.arange(n_samples)
+        batches = [
+            order[i : i + self.batch_size].tolist()
+            for i in range(0, n_samples, self.batch_size)
+        ][: len(self)]
+
+        free_slots = list(range(self.prefetch_depth))
+        ready: Dict[int, Tuple[int, int]] = {}
+        next_batch = 0
+        for batch_id in range(len(batches)):
+            # Request batches until all slots are in use
+            while len(free_slots) > 0 and next_batch < len(batches):
+                slot = free_slots.pop()
+                self._task_queue.put((next_batch, slot, batches[next_batch]))
+                self._in_flight += 1
+                next_batch += 1
+
+            # Batches are finished out of order, but returned in order
+            while batch_id not in ready:
+                finished_id, slot, n, error = self._get_result()
+                if error is not None:
+                    raise RuntimeError(
+                        f"Error in data loader worker loading batch "
+                        f"{finished_id}:\n{error}"
+                    )
+                ready[finished_id] = (slot, n)
+
+            slot, n = ready.pop(batch_id)
+            yield self._batch(slot, n)
+            free_slots.append(slot)
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        if len(self._workers) == 0:
+            return
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=_POLL_INTERVAL)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = []
+        self._slots = []
+        self._in_flight = 0
+
+    def __enter__(self) -> "PrefetchLoader":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        self.close()
+
+
+def iterate_batches(
+    dataset: Any,
+    batch_size: int,
+    shuffle: bool = True,
+    drop_last: bool = False,
+    seed: Optional[int] = None,
+) -> Iterator[Dict[str, np.ndarray]]:
+    """Iterate over batches of a dataset in the current process.
+
+    This is the simplest way to load data, and is useful for debugging
+    datasets and as a baseline for :class:`PrefetchLoader`.
+
+    Parameters
+    ----------
+    dataset: Any
+        Dataset with ``__len__`` and ``__getitem__`` methods.
+    batch_size: int
+        Number of samples in a batch.
+    shuffle: bool
+        Shuffle the samples.
+    drop_last: bool
+        Skip the final batch if it is incomplete.
+    seed: Optional[int]
+        Seed for the order of samples.
+
+    Yields
+    ------
+    Dict[str, np.ndarray]:
+        Batch, with the samples stacked along the first axis of each array.
+
+    """
+    n_samples = len(dataset)
+    if shuffle:
+        order = np.random.default_rng(seed).permutation(n_samples)
+    else:
+        order = np.arange(n_samples)
+    for i in range(0, n_samples, batch_size):
+        indices = order[i : i + batch_size]
+        if drop_last and len(indices) < batch_size:
+            break
+        samples = [dataset[index] for index in indices]
+        yield {name: np.stack([s[name] for s in samples]) for name in samples[0]}
@@ -0,0 +1,267 @@
+"""Per-step timing of training loops.
+
+:class:`StepTimer` measures, for every training step, the time spent waiting
+for data and the time spent computing, along with the throughput and peak
+memory use. Records are written as JSON lines by a background thread, so
+timing adds very little to each step. Use the summarize-run command to
+summarize the records of a run, e.g. to find out whether it is limited by
+data loading or by computation.
+
+Example
+-------
+>>> with StepTimer(model_output_dir / THROUGHPUT_FILE) as timer:
+...     for batch in timer.wrap(loader):
+...         with timer.compute():
+...             loss = train_step(batch)
+...         timer.end_step(len(batch["image"]), loss=float(loss))
+
+"""
+import json
+import multiprocessing
+import queue
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, TypeVar
+
+# Name of the file within the model output directory holding the records
+THROUGHPUT_FILE = "throughput.jsonl"
+
+# Maximum time in seconds between writes of the records to the file
+FLUSH_INTERVAL = 10.0
+
+# ru_maxrss is in bytes on MacOS and kilobytes on Linux
+_RSS_UNITS = 1 if sys.platform == "darwin" else 1024
+
+T = TypeVar("T")
+
+
+def _live_child_peak_rss_mb() -> float:
+    """Get the largest peak resident set size of any running child in MiB.
+
+    Only child processes started with multiprocessing (e.g. data loading
+    workers) are included. The peaks are read from /proc, so this is always 0
+    on platforms without it, such as MacOS.
+
+    """
+    peak = 0.0
+    for child in multiprocessing.active_children():
+        try:
+            with open(f"/proc/{child.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        # The value is given in kB
+                        peak = max(peak, int(line.split()[1]) / 1024)
+                        break
+        except (OSError, ValueError):
+            # The process has exited, or /proc is not available
+            continue
+    return peak
+
+
+def peak_rss_mb(children: bool = False) -> float:
+    """Get the peak resident set size of this process in MiB.
+
+    Parameters
+    ----------
+    children: bool
+        Get the largest peak of any child process (e.g. data loading workers)
+        instead. This includes both terminated children and running children
+        started with multiprocessing, whose peaks are read from /proc on
+        Linux.
+
+    Returns
+    -------
+    float:
+        Peak resident set size in MiB.
+
+    """
+    if not children:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_maxrss * _RSS_UNITS / 1024**2
+    # Terminated children are only included by getrusage once they have been
+    # waited for, so running children are sampled separately
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return max(usage.ru_maxrss * _RSS_UNITS / 1024**2, _live_child_peak_rss_mb())
+
+
+class _RecordWriter(threading.Thread):
+    """Thread appending records to a JSON lines file."""
+
+    def __init__(self, output_file: Path, flush_interval: float):
+        super().__init__(daemon=True)
+        self.output_file = output_file
+        self.flush_interval = flush_interval
+        self.records: queue.Queue = queue.Queue()
+
+    def run(self) -> None:
+        with self.output_file.open("a") as f:
+            last_flush = time.monotonic()
+            while True:
+                try:
+                    record = self.records.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    record = {}
+                if record is None:
+                    break
+                if record:
+                    f.write(json.dumps(record) + "\n")
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    f.flush()
+                    last_flush = time.monotonic()
+
+
+class StepTimer:
+    """Measure and record the time taken by each step of a training loop.
+
+    Each step is divided into waiting for data, which is measured by
+    :meth:`wrap` or :meth:`data`, and computation, which is measured by
+    :meth:`compute`. :meth:`end_step` records the step. Anything else, e.g.
+    logging, counts towards the total time of the step but neither part.
+
+    """
+
+    def __init__(
+        self,
+        output_file: Path,
+        synchronize: Optional[Callable[[], Any]] = None,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        """Create a timer and start writing records.
+
+        Parameters
+        ----------
+        output_file: pathlib.Path
+            JSON lines file to append the records to.
+        synchronize: Optional[Callable[[], Any]]
+            Function called at the end of each computation to wait for it to
+            finish, e.g. ``torch.cuda.synchronize``. Without this, time spent
+            by asynchronous GPU operations is attributed to whichever part of
+            the step waits for them.
+        flush_interval: float
+            Maximum time in seconds between writes of the records to the file.
+
+        """
+        self.output_file = Path(output_file)
+        self.synchronize = synchronize
+        self.step = 0
+        self._data_time = 0.0
+        self._compute_time = 0.0
+        self._start = time.perf_counter()
+        self._step_start = self._start
+        self._total_samples = 0
+        self._writer = _RecordWriter(self.output_file, flush_interval)
+        self._writer.start()
+
+    @contextmanager
+    def data(self) -> Iterator[None]:
+        """Measure time spent waiting for data within the current step."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._data_time += time.perf_counter() - start
+
+    @contextmanager
+    def compute(self) -> Iterator[None]:
+        """Measure time spent computing within the current step."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.synchronize is not None:
+                self.synchronize()
+            self._compute_time += time.perf_counter() - start
+
+    def wrap(self, batches: Iterable[T]) -> Iterator[T]:
+        """Iterate over batches, measuring the time waiting for each.
+
+        Parameters
+        ----------
+        batches: Iterable[T]
+            Batches of data, e.g. a data loader.
+
+        Yields
+        ------
+        T:
+            Each batch.
+
+        """
+        iterator = iter(batches)
+        while True:
+            with self.data():
+                try:
+                    batch = next(iterator)
+                except StopIteration:
+                    return
+            yield batch
+
+    def end_step(self, n_samples: int, **extra: Any) -> None:
+        """Record the current step and start the next.
+
+        Parameters
+        ----------
+        n_samples: int
+            Number of samples processed in the step.
+        **extra: Any
+            Further JSON serializable values to record, e.g. the loss.
+
+        """
+        now = time.perf_counter()
+        step_time = now - self._step_start
+        self._total_samples += n_samples
+        record = {
+            "step": self.step,
+            "time": now - self._start,
+            "step_s": step_time,
+            "data_s": self._data_time,
+            "compute_s": self._compute_time,
+            "samples": n_samples,
+            "samples_per_s": n_samples / step_time if step_time > 0 else None,
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_child_rss_mb": peak_rss_mb(children=True),
+        }
+        record.update(extra)
+        self._writer.records.put(record)
+
+        self.step += 1
+        self._data_time = 0.0
+        self._compute_time = 0.0
+        self._step_start = time.perf_counter()
+
+    def close(self) -> None:
+        """Write any remaining records and stop the writer."""
+        if self._writer.is_alive():
+            self._writer.records.put(None)
+            self._writer.join()
+
+    def __enter__(self) -> "StepTimer":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+def read_records(output_file: Path) -> Iterator[Dict[str, Any]]:
+    """Read the records written by a :class:`StepTimer`.
+
+    Parameters
+    ----------
+    output_file: pathlib.Path
+        JSON lines file of the records.
+
+    Yields
+    ------
+    Dict[str, Any]:
+        Record of each step. A partially written final line is skipped.
+
+    """
+    with Path(output_file).open() as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
@@ -0,0 +1,262 @@
+"""Hyperparameter sweeps over training configs run as Slurm array jobs.
+
+A sweep takes a base training config and a set of parameters to vary, and
+expands them into one config per run, either as a grid (every combination of
+the given values) or as a random search (a number of randomly sampled
+combinations). The configs are written to the sweep's directory, along with
+a single Slurm array job script that runs all of them. Several small runs
+may be packed into each task of the array job, to run concurrently within a
+single allocation.
+
+"""
+import itertools
+import json
+import math
+import random
+from copy import deepcopy
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+# Specification of the values of a parameter: either a list of values, or a
+# dictionary with "min" and "max" (and optionally "log" and "int") for a
+# range to sample from in a random search
+ParamSpec = Any
+
+# Location of the CUDA libraries on the cluster nodes
+CUDA_LIB_DIR = "/usr/pubsw/packages/CUDA/11.2/targets/x86_64-linux/lib/"
+
+
+class SlurmOptions(NamedTuple):
+    """Resources requested for each task of a sweep's array job."""
+
+    partition: str = "rtx6000"
+    account: str = "defq"
+    cpus_per_run: int = 8
+    gpus: int = 1
+    time: str = "72:00:00"
+    runs_per_task: int = 1
+    max_concurrent: Optional[int] = None
+
+
+def set_nested(config: Dict[str, Any], key: str, value: Any) -> None:
+    """Set a value in a nested config, where key is a dot-separated path."""
+    *parents, name = key.split(".")
+    for parent in parents:
+        config = config.setdefault(parent, {})
+    config[name] = value
+
+
+def expand_grid(params: Dict[str, ParamSpec]) -> List[Dict[str, Any]]:
+    """List every combination of the values of the parameters.
+
+    Parameters
+    ----------
+    params: Dict[str, Any]
+        List of values of each parameter.
+
+    Returns
+    -------
+    List[Dict[str, Any]]:
+        Value of each parameter for each run.
+
+    Raises
+    ------
+    ValueError:
+        If the values of a parameter are not a list, or the list is empty.
+
+    """
+    for key, spec in params.items():
+        if not isinstance(spec, list):
+            raise ValueError(
+                f"Values of '{key}' must be a list for a grid search, got {spec!r}."
+            )
+        if len(spec) == 0:
+            raise ValueError(f"No values given for '{key}'.")
+    keys = list(params)
+    return [
+        dict(zip(keys, values))
+        for values in itertools.product(*(params[k] for k in keys))
+    ]
+
+
+def _sample(key: str, spec: ParamSpec, rng: random.Random) -> Any:
+    """Sample a value of a parameter."""
+    if isinstance(spec, list):
+        if len(spec) == 0:
+            raise ValueError(f"No values given for '{key}'.")
+        return rng.choice(spec)
+    if isinstance(spec, dict) and "min" in spec and "max" in spec:
+        low, high = spec["min"], spec["max"]
+        if spec.get("log", False):
+            value = math.exp(rng.uniform(math.log(low), math.log(high)))
+        else:
+            value = rng.uniform(low, high)
+        return round(value) if spec.get("int", False) else value
+    raise ValueError(
+        f"Values of '{key}' must be a list or a dictionary with 'min' and "
+        f"'max', got {spec!r}."
+    )
+
+
+def sample_random(
+    params: Dict[str, ParamSpec], n_runs: int, seed: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Randomly sample combinations of values of the parameters.
+
+    Parameters
+    ----------
+    params: Dict[str, Any]
+        Values of each parameter, as a list of values to choose from or a
+        dictionary with 'min' and 'max', and optionally 'log' (sample
+        uniformly on a log scale) and 'int' (round to an integer), for a
+        range to sample from.
+    n_runs: int
+        Number of combinations to sample.
+    seed: Optional[int]
+        Seed for the random number generator.
+
+    Returns
+    -------
+    List[Dict[str, Any]]:
+        Value of each parameter for each run.
+
+    """
+    rng = random.Random(seed)
+    return [
+        {key: _sample(key, spec, rng) for key, spec in params.items()}
+        for _ in range(n_runs)
+    ]
+
+
+def run_name(sweep_name: str, index: int) -> str:
+    """Name of the model trained by a run of a sweep."""
+    return f"{sweep_name}_run{index:03d}"
+
+
+def _job_script(
+    sweep_name: str, sweep_dir: Path, n_runs: int, options: SlurmOptions
+) -> str:
+    """Create the Slurm array job script of a sweep."""
+    n_tasks = math.ceil(n_runs / options.runs_per_task)
+    array = f"0-{n_tasks - 1}"
+    if options.max_concurrent is not None:
+        array += f"%{options.max_concurrent}"
+    header = [
+        "#!/usr/bin/env bash",
+        "",
+        f"#SBATCH -J {{ cookiecutter.__project_name }}-sweep-{sweep_name}",
+        f"#SBATCH -p {options.partition}",
+        f"#SBATCH -A {options.account}",
+        "#SBATCH -n 1",
+        f"#SBATCH --cpus-per-task={options.cpus_per_run * options.runs_per_task}",
+        f"#SBATCH --gres=gpu:{options.gpus}",
+        f"#SBATCH -t {options.time}",
+        f"#SBATCH --array={array}",
+        f"#SBATCH -o {sweep_dir}/logs/%A_%a.out",
+        "",
+        f'export LD_LIBRARY_PATH="{CUDA_LIB_DIR}"',
+        "",
+        f"SWEEP_DIR={sweep_dir}",
+        f"SWEEP_NAME={sweep_name}",
+        f"N_RUNS={n_runs}",
+        f"RUNS_PER_TASK={options.runs_per_task}",
+        f"N_GPUS={options.gpus}",
+        "",
+    ]
+    return "\n".join(header) + _JOB_BODY
+
+
+# Body of the job script, which runs the task's share of the runs
+# concurrently, each on one of the task's GPUs in turn
+_JOB_BODY = """
+first=$((SLURM_ARRAY_TASK_ID * RUNS_PER_TASK))
+pids=()
+for ((i = first; i < first + RUNS_PER_TASK && i < N_RUNS; i++)); do
+    run=$(printf "run%03d" "$i")
+    if ((N_GPUS > 0)); then
+        export CUDA_VISIBLE_DEVICES=$(((i - first) % N_GPUS))
+    fi
+    {{ cookiecutter.__project_name }} train \\
+        "$SWEEP_DIR/configs/$run.json" "${SWEEP_NAME}_$run" \\
+        > "$SWEEP_DIR/logs/$run.log" 2>&1 &
+    pids+=($!)
+done
+
+status=0
+for pid in "${pids[@]}"; do
+    wait "$pid" || status=1
+done
+exit $status
+"""
+
+
+def write_sweep(
+    sweep_dir: Path,
+    sweep_name: str,
+    base_config: Dict[str, Any],
+    runs: List[Dict[str, Any]],
+    options: SlurmOptions,
+) -> Path:
+    """Write the configs and job script of a sweep.
+
+    Parameters
+    ----------
+    sweep_dir: pathlib.Path
+        Directory to write the sweep to. It is created if needed.
+    sweep_name: str
+        Name of the sweep. Each run trains a model named after the sweep and
+        the number of the run.
+    base_config: Dict[str, Any]
+        Training config that the parameters of each run are applied to.
+    runs: List[Dict[str, Any]]
+        Value of each parameter for each run, where parameters are
+        dot-separated paths in the config.
+    options: SlurmOptions
+        Resources requested for each task of the array job.
+
+    Returns
+    -------
+    pathlib.Path:
+        Path of the job script.
+
+    Raises
+    ------
+    ValueError:
+        If there are no runs, or the number of runs per task is less than 1.
+
+    """
+    if len(runs) == 0:
+        raise ValueError("The sweep has no runs.")
+    if options.runs_per_task < 1:
+        raise ValueError(
+            f"Runs per task must be at least 1, got {options.runs_per_task}."
+        )
+    (sweep_dir / "configs").mkdir(parents=True, exist_ok=True)
+    (sweep_dir / "logs").mkdir(exist_ok=True)
+
+    manifest = []
+    for i, params in enumerate(runs):
+        config = deepcopy(base_config)
+        for key, value in params.items():
+            set_nested(config, key, value)
+        config_file = sweep_dir / "configs" / f"run{i:03d}.json"
+        with config_file.open("w") as jf:
+            json.dump(config, jf, indent=4)
+        manifest.append(
+            {
+                "run": i,
+                "model_name": run_name(sweep_name, i),
+                "config_file": str(config_file),
+                "params": params,
+            }
+        )
+    with (sweep_dir / "sweep.json").open("w") as jf:
+        json.dump(
+            {"name": sweep_name, "options": options._asdict(), "runs": manifest},
+            jf,
+            indent=4,
+        )
+
+    job_file = sweep_dir / "sweep.job"
+    job_file.write_text(_job_script(sweep_name, sweep_dir, len(runs), options))
+    return job_file
@@ -0,0 +1,372 @@
+"""Rendering of quality control images of volumes and segmentations.
+
+For each volume, a small thumbnail of its central slice and a montage of
+evenly spaced slices are rendered, optionally with a label map (e.g. ground
+truth or a model's inference) overlaid in colour. Only the slices shown are
+read from the volume, and they are downsampled before rendering, so
+rendering is fast even for large volumes.
+
+Rendered images are cached under a key that is a hash of the input files and
+the render parameters, so only images whose inputs or parameters have
+changed are rendered again. The input files are identified by their paths,
+sizes and modification times, or optionally by their contents. A static HTML index page shows the thumbnails of
+all cases, each linking to its montages.
+
+Images are written as PNG files with zlib, without needing an imaging
+library.
+
+"""
+import hashlib
+import html
+import json
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from {{ cookiecutter.__project_slug }}.preprocess.volume_cache import hash_sources
+
+# Version of the rendering code, included in cache keys so that changing the
+# rendering invalidates cached images. Increment this when changing it.
+RENDER_VERSION = 1
+
+# Colours (RGB) of labels 1, 2, ... in overlays, repeating for more labels
+LABEL_COLOURS = np.array(
+    [
+        [230, 25, 75],
+        [60, 180, 75],
+        [255, 225, 25],
+        [0, 130, 200],
+        [245, 130, 48],
+        [145, 30, 180],
+        [70, 240, 240],
+        [240, 50, 230],
+    ],
+    dtype=float,
+)
+
+
+class RenderParams(NamedTuple):
+    """Parameters of the rendered images."""
+
+    # Axis of the volume that slices are taken along
+    axis: int = 0
+    # Number of slices in a montage
+    n_slices: int = 12
+    # Number of columns of slices in a montage
+    columns: int = 4
+    # Maximum height and width of each slice of a montage in pixels
+    slice_size: int = 192
+    # Maximum height and width of a thumbnail in pixels
+    thumbnail_size: int = 128
+    # Intensity range mapped to black and white, or None to use the 1st and
+    # 99th percentiles of the slices shown
+    window: Optional[Tuple[float, float]] = None
+    # Opacity of label overlays
+    alpha: float = 0.4
+
+
+class RenderJob(NamedTuple):
+    """Images to render for a volume, with an optional overlay."""
+
+    case_id: str
+    source: str
+    image_file: Path
+    label_file: Optional[Path]
+    key: str
+
+
+def write_png(path: Path, image: np.ndarray) -> None:
+    """Write an 8-bit greyscale or RGB image as a PNG file.
+
+    Parameters
+    ----------
+    path: pathlib.Path
+        Path of the file to write.
+    image: np.ndarray
+        Image of shape (height, width) or (height, width, 3), with dtype
+        uint8.
+
+    """
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    height, width = image.shape[:2]
+    colour_type = 2 if image.ndim == 3 else 0
+    # Each row is preceded by a byte giving its filter type (0, none)
+    rows = image.reshape(height, -1)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), rows]).tobytes()
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        crc = zlib.crc32(kind + data) & 0xFFFFFFFF
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, colour_type, 0, 0, 0)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with tmp_path.open("wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", header))
+        f.write(chunk(b"IDAT", zlib.compress(raw, 6)))
+        f.write(chunk(b"IEND", b""))
+    os.replace(tmp_path, path)
+
+
+def slice_indices(length: int, n_slices: int) -> np.ndarray:
+    """Choose evenly spaced slices, avoiding the first and last."""
+    n_slices = min(n_slices, length)
+    return np.linspace(0, length - 1, n_slices + 2)[1:-1].round().astype(int)
+
+
+def downsample(image: np.ndarray, size: int, nearest: bool = False) -> np.ndarray:
+    """Downsample a 2D image by an integer factor to fit within a size.
+
+    Parameters
+    ----------
+    image: np.ndarray
+        Image to downsample.
+    size: int
+        Maximum height and width of the result.
+    nearest: bool
+        Take every n-th pixel, rather than the mean of each block of pixels.
+        Use this for label maps.
+
+    Returns
+    -------
+    np.ndarray:
+        Downsampled image.
+
+    """
+    factor = -(-max(image.shape) // size)
+    if factor <= 1:
+        return image
+    # Crop to a multiple of the factor, so that images and label maps of the
+    # same shape are downsampled to the same shape either way
+    height = image.shape[0] // factor * factor
+    width = image.shape[1] // factor * factor
+    if nearest:
+        return image[:height:factor, :width:factor]
+    blocks = image[:height, :width].reshape(
+        height // factor, factor, width // factor, factor
+    )
+    return blocks.mean(axis=(1, 3))
+
+
+def _to_rgb(
+    image: np.ndarray,
+    labels: Optional[np.ndarray],
+    window: Tuple[float, float],
+    alpha: float,
+) -> np.ndarray:
+    """Map an image to RGB with the window, and overlay labels."""
+    low, high = window
+    grey = np.clip((image - low) / max(high - low, 1e-6), 0, 1) * 255
+    rgb = np.repeat(grey[..., np.newaxis], 3, axis=-1)
+    if labels is not None:
+        mask = labels > 0
+        colours = LABEL_COLOURS[(labels[mask].astype(int) - 1) % len(LABEL_COLOURS)]
+        rgb[mask] = (1 - alpha) * rgb[mask] + alpha * colours
+    return rgb.round().astype(np.uint8)
+
+
+def _read_slices(path: Path, axis: int, indices: Sequence[int]) -> List[np.ndarray]:
+    """Read slices of a volume, only reading those slices from the file."""
+    volume = np.load(path, mmap_mode="r")
+    return [np.asarray(np.take(volume, i, axis=axis), dtype=float) for i in indices]
+
+
+def render_images(
+    image_file: Path,
+    label_file: Optional[Path],
+    params: RenderParams,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Render the thumbnail and montage of a volume.
+
+    Parameters
+    ----------
+    image_file: pathlib.Path
+        .npy file of the volume.
+    label_file: Optional[pathlib.Path]
+        .npy file of a label map of the volume, to overlay.
+    params: RenderParams
+        Parameters of the images.
+
+    Returns
+    -------
+    np.ndarray:
+        Thumbnail of the central slice.
+    np.ndarray:
+        Montage of evenly spaced slices.
+
+    """
+    length = np.load(image_file, mmap_mode="r").shape[params.axis]
+    indices = slice_indices(length, params.n_slices)
+    central = length // 2
+    image_slices = _read_slices(image_file, params.axis, [central, *indices])
+    label_slices: Sequence[Optional[np.ndarray]]
+    if label_file is not None:
+        label_slices = _read_slices(label_file, params.axis, [central, *indices])
+    else:
+        label_slices = [None] * len(image_slices)
+
+    thumbnail_image = downsample(image_slices[0], params.thumbnail_size)
+    montage_images = [downsample(s, params.slice_size) for s in image_slices[1:]]
+    if params.window is not None:
+        window = params.window
+    else:
+        pixels = np.concatenate([s.ravel() for s in montage_images])
+        window = tuple(np.percentile(pixels, [1, 99]))
+
+    def labels(i: int, size: int) -> Optional[np.ndarray]:
+        label_slice = label_slices[i]
+        if label_slice is None:
+            return None
+        return downsample(label_slice, size, nearest=True)
+
+    thumbnail = _to_rgb(
+        thumbnail_image, labels(0, params.thumbnail_size), window, params.alpha
+    )
+    tiles = [
+        _to_rgb(s, labels(i + 1, params.slice_size), window, params.alpha)
+        for i, s in enumerate(montage_images)
+    ]
+    rows = -(-len(tiles) // params.columns)
+    height, width = tiles[0].shape[:2]
+    montage = np.zeros((rows * height, params.columns * width, 3), dtype=np.uint8)
+    for i, tile in enumerate(tiles):
+        row, column = divmod(i, params.columns)
+        montage[
+            row * height : (row + 1) * height, column * width : (column + 1) * width
+        ] = tile
+    return thumbnail, montage
+
+
+def render_key(
+    image_file: Path,
+    label_file: Optional[Path],
+    params: RenderParams,
+    content_hash: bool = False,
+) -> str:
+    """Compute the cache key of the images of a volume.
+
+    The key is a hash of the input files, the render parameters and the
+    version of the rendering code.
+
+    Parameters
+    ----------
+    image_file: pathlib.Path
+        .npy file of the volume.
+    label_file: Optional[pathlib.Path]
+        .npy file of a label map of the volume, to overlay.
+    params: RenderParams
+        Parameters of the images.
+    content_hash: bool
+        Hash the contents of the input files, rather than their paths, sizes
+        and modification times. See
+        :func:`{{ cookiecutter.__project_slug }}.preprocess.volume_cache.hash_sources`.
+
+    Returns
+    -------
+    str:
+        Key of the images.
+
+    """
+    description = json.dumps(
+        {
+            "image": hash_sources([image_file], content=content_hash),
+            "label": (
+                hash_sources([label_file], content=content_hash)
+                if label_file is not None
+                else None
+            ),
+            "params": params._asdict(),
+            "version": RENDER_VERSION,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def image_paths(cache_dir: Path, key: str) -> Tuple[Path, Path]:
+    """Paths of the cached thumbnail and montage with a key."""
+    return cache_dir / f"{key}_thumb.png", cache_dir / f"{key}_montage.png"
+
+
+def render_job(
+    job: RenderJob, cache_dir: Path, params: RenderParams
+) -> Tuple[RenderJob, Optional[str]]:
+    """Render and cache the images of a job, returning any error.
+
+    This runs in worker processes, so must not raise.
+
+    """
+    try:
+        thumbnail, montage = render_images(job.image_file, job.label_file, params)
+        thumbnail_path, montage_path = image_paths(cache_dir, job.key)
+        write_png(montage_path, montage)
+        write_png(thumbnail_path, thumbnail)
+    except Exception as e:
+        return job, f"{type(e).__name__}: {e}"
+    return job, None
+
+
+def write_index(
+    index_file: Path,
+    cache_dir: Path,
+    jobs: Sequence[RenderJob],
+    sources: Sequence[str],
+    failed: Dict[str, Any],
+) -> None:
+    """Write a static HTML page showing the thumbnails of all cases.
+
+    Parameters
+    ----------
+    index_file: pathlib.Path
+        Path of the page.
+    cache_dir: pathlib.Path
+        Directory of the cached images.
+    jobs: Sequence[RenderJob]
+        Rendered images, each shown in the row of its case and the column of
+        its source.
+    sources: Sequence[str]
+        Names of the sources, in the order of the columns.
+    failed: Dict[str, Any]
+        Keys of the jobs that failed to render, which are marked as missing.
+
+    """
+    cells: Dict[str, Dict[str, RenderJob]] = {}
+    for job in jobs:
+        cells.setdefault(job.case_id, {})[job.source] = job
+    relative_dir = os.path.relpath(cache_dir, index_file.parent)
+
+    lines = [
+        "<!DOCTYPE html>",
+        '<html><head><meta charset="utf-8"><title>QC</title>',
+        "<style>body{font-family:sans-serif}td{padding:2px;text-align:center}"
+        "img{image-rendering:pixelated}</style></head><body>",
+        f"<p>{len(cells)} cases. Click a thumbnail to show its montage.</p>",
+        "<table><tr><th>case</th>",
+    ]
+    lines += [f"<th>{html.escape(source)}</th>" for source in sources]
+    lines.append("</tr>")
+    for case_id in sorted(cells):
+        lines.append(f"<tr><td>{html.escape(case_id)}</td>")
+        for source in sources:
+            cell = cells[case_id].get(source)
+            if cell is None:
+                lines.append("<td></td>")
+            elif cell.key in failed:
+                lines.append("<td>failed</td>")
+            else:
+                thumbnail, montage = (
+                    f"{relative_dir}/{p.name}" for p in image_paths(cache_dir, cell.key)
+                )
+                lines.append(
+                    f'<td><a href="{montage}"><img src="{thumbnail}" '
+                    f'loading="lazy"></a></td>'
+                )
+        lines.append("</tr>")
+    lines.append("</table></body></html>")
+    tmp_file = index_file.with_name(f".{index_file.name}.tmp")
+    tmp_file.write_text("\n".join(lines) + "\n")
+    os.replace(tmp_file, index_file)
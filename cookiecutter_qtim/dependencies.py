@@ -1,5 +1,18 @@
-from typing import Dict, Sequence
-import requests
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+import re
+import time
+from typing import Any, Dict, Optional, Sequence, TYPE_CHECKING
+
+from cookiecutter_qtim.cache import (
+    get_cache_dir,
+    read_json_cache,
+    write_json_cache,
+)
+
+if TYPE_CHECKING:
+    # requests is slow to import, so is only imported when first needed
+    import requests
 
 
 PACKAGES_REQUIRED = [
@@ -49,16 +62,113 @@ PACKAGES_DEV_OPTIONAL = [
 
 PYPI_URL = 'https://pypi.org/pypi/{package}/json'
 
+# Timeout (connect, read) in seconds for each request to the PyPI API
+PYPI_TIMEOUT = (5, 15)
+
+# Number of times a failed request to the PyPI API is retried
+PYPI_RETRIES = 3
+
+# Maximum number of concurrent requests to the PyPI API
+PYPI_MAX_WORKERS = 16
+
+# Time in seconds for which cached package versions are used without
+# revalidating them against the PyPI API
+PYPI_CACHE_TTL = 24 * 60 * 60
+
+
+def create_pypi_session(
+    pool_size: int = PYPI_MAX_WORKERS,
+) -> 'requests.Session':
+    """Create a session for querying the PyPI API.
+
+    The session keeps connections to PyPI alive between requests and retries
+    failed requests (connection errors and server errors) with a backoff.
+
+    Parameters
+    ----------
+    pool_size: int
+        Maximum number of connections to keep in the connection pool. This
+        should be at least the number of threads sharing the session.
+
+    Returns
+    -------
+    requests.Session:
+        Session object to pass to other functions in this module.
+
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=PYPI_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    return session
+
+
+def _get_cache_path(package: str) -> Path:
+    """Get the path of the cache entry for a package."""
+    # Normalize the name according to PEP 503 so that equivalent spellings of
+    # a package name share a cache entry
+    normalized_name = re.sub(r"[-_.]+", "-", package).lower()
+    return get_cache_dir("pypi") / f"{normalized_name}.json"
 
-def get_package_version(package: str) -> str:
+
+def _read_cache_entry(cache_path: Path) -> Optional[Dict[str, Any]]:
+    """Read the cache entry for a package, or None if it is not valid."""
+    entry = read_json_cache(cache_path)
+    if entry is None:
+        return None
+    # Treat entries that are incomplete (e.g. edited by hand) as missing
+    if not isinstance(entry.get('version'), str):
+        return None
+    if not isinstance(entry.get('fetched'), (int, float)):
+        return None
+    return entry
+
+
+def get_package_version(
+    package: str,
+    session: Optional['requests.Session'] = None,
+    use_cache: bool = True,
+    cache_ttl: float = PYPI_CACHE_TTL,
+    offline: bool = False,
+) -> str:
     """Find latest versions of a package on PyPI.
 
     Uses the PyPI API to find the latest version tag of a package.
 
+    Results are cached in the user's cache directory. A cached version younger
+    than ``cache_ttl`` seconds is used directly. An older cached version is
+    revalidated with a conditional request to PyPI (using the ETag and
+    Last-Modified headers of the original response), so that the full
+    response only needs to be downloaded if it has changed.
+
     Parameters
     ----------
     package: str
         Name of package as it appears listed on PyPI.
+    session: Optional[requests.Session]
+        Session to use for the request. If not provided, a new session is
+        created for this request only.
+    use_cache: bool
+        Whether to read and write cached versions.
+    cache_ttl: float
+        Time in seconds for which a cached version is used without
+        revalidating it.
+    offline: bool
+        If True, the version is found from the cache only, regardless of its
+        age, and no requests are made to PyPI.
 
     Returns
     -------
@@ -66,29 +176,229 @@ def get_package_version(package: str) -> str:
         Version tag of most recent published version of the package.
 
     """
-    response = requests.get(PYPI_URL.format(package=package))
+    cache_path = _get_cache_path(package)
+    entry = _read_cache_entry(cache_path) if (use_cache or offline) else None
+
+    if offline:
+        if entry is None:
+            raise RuntimeError(
+                f"Package {package} is not in the cache and cannot be "
+                "found in offline mode."
+            )
+        return entry['version']
+
+    if entry is not None and time.time() - entry['fetched'] < cache_ttl:
+        return entry['version']
+
+    if session is None:
+        with create_pypi_session(pool_size=1) as session:
+            return get_package_version(
+                package,
+                session=session,
+                use_cache=use_cache,
+                cache_ttl=cache_ttl,
+            )
+
+    headers = {}
+    if entry is not None:
+        if entry.get('etag') is not None:
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified') is not None:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    response = session.get(
+        PYPI_URL.format(package=package),
+        headers=headers,
+        timeout=PYPI_TIMEOUT,
+    )
+    if response.status_code == 304 and entry is not None:
+        # Cached version is still current
+        entry['fetched'] = time.time()
+        write_json_cache(cache_path, entry)
+        return entry['version']
+    if response.status_code == 404:
+        raise RuntimeError(f"Package {package} was not found on PyPI.")
+    response.raise_for_status()
     obj = response.json()
     if 'info' not in obj:
         raise RuntimeError(
             f"Error finding information for package: {package}."
         )
-    return obj['info']['version']
+    version = obj['info']['version']
+
+    if use_cache:
+        write_json_cache(
+            cache_path,
+            {
+                'version': version,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched': time.time(),
+            }
+        )
 
+    return version
 
-def get_package_versions(packages: Sequence[str]) -> Dict[str, str]:
+
+def get_package_versions(
+    packages: Sequence[str],
+    max_workers: int = PYPI_MAX_WORKERS,
+    use_cache: bool = True,
+    cache_ttl: float = PYPI_CACHE_TTL,
+    offline: bool = False,
+) -> Dict[str, str]:
     """Find latest versions of listed packages on PyPI.
 
-    Uses the PyPI API to find the latest version tag of listed packages.
+    Uses the PyPI API to find the latest version tag of listed packages. All
+    packages are queried concurrently over a single pool of connections.
 
     Parameters
     ----------
     packages: Sequence[str]
         List of packages as they appear listed on PyPI.
+    max_workers: int
+        Maximum number of concurrent requests.
+    use_cache: bool
+        Whether to read and write cached versions.
+    cache_ttl: float
+        Time in seconds for which a cached version is used without
+        revalidating it.
+    offline: bool
+        If True, versions are found from the cache only and no requests are
+        made to PyPI.
 
     Returns
     -------
     Dict[str, str]:
         Dictionary mapping package name to most recent version tag.
 
+    Raises
+    ------
+    RuntimeError:
+        If the version of any of the packages could not be found. The message
+        lists all packages that failed.
+
+    """
+    # Remove duplicates while preserving order
+    packages = list(dict.fromkeys(packages))
+    if len(packages) == 0:
+        return {}
+
+    n_workers = max(1, min(max_workers, len(packages)))
+    with create_pypi_session(pool_size=n_workers) as session:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            futures = {
+                package: executor.submit(
+                    get_package_version,
+                    package,
+                    session=session,
+                    use_cache=use_cache,
+                    cache_ttl=cache_ttl,
+                    offline=offline,
+                )
+                for package in packages
+            }
+
+            versions = {}
+            errors = {}
+            for package, future in futures.items():
+                try:
+                    versions[package] = future.result()
+                except Exception as e:
+                    errors[package] = e
+
+    if len(errors) > 0:
+        details = "\n".join(
+            f"  {package}: {error}" for package, error in errors.items()
+        )
+        raise RuntimeError(
+            f"Error finding information for {len(errors)} package(s):\n"
+            f"{details}"
+        )
+
+    return versions
+
+
+class PackageVersionPrefetcher:
+    """Find versions of packages in the background before they are needed.
+
+    Packages passed to :meth:`prefetch` are looked up in a background thread
+    straight away, so that the lookups overlap with other work (such as
+    waiting for the user to answer prompts). :meth:`get` then waits only for
+    lookups that are still outstanding.
+
+    Parameters
+    ----------
+    max_workers: int
+        Maximum number of batches of packages looked up concurrently.
+    **kwargs: Any
+        Further keyword arguments passed to :func:`get_package_versions`.
+
     """
-    return {package: get_package_version(package) for package in packages}
+
+    def __init__(self, max_workers: int = 4, **kwargs: Any):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._kwargs = kwargs
+        self._futures: Dict[str, Future] = {}
+
+    def prefetch(self, packages: Sequence[str]) -> None:
+        """Start looking up the versions of packages in the background.
+
+        Parameters
+        ----------
+        packages: Sequence[str]
+            List of packages as they appear listed on PyPI. Packages that have
+            already been requested are ignored.
+
+        """
+        new_packages = [
+            p for p in dict.fromkeys(packages) if p not in self._futures
+        ]
+        if len(new_packages) == 0:
+            return
+        future = self._executor.submit(
+            get_package_versions,
+            new_packages,
+            **self._kwargs,
+        )
+        for package in new_packages:
+            self._futures[package] = future
+
+    def get(self, packages: Sequence[str]) -> Dict[str, str]:
+        """Get the versions of packages, waiting for any outstanding lookups.
+
+        Packages that were not prefetched, or whose lookup failed, are looked
+        up again before returning.
+
+        Parameters
+        ----------
+        packages: Sequence[str]
+            List of packages as they appear listed on PyPI.
+
+        Returns
+        -------
+        Dict[str, str]:
+            Dictionary mapping package name to most recent version tag.
+
+        Raises
+        ------
+        RuntimeError:
+            If the version of any of the packages could not be found. The
+            message lists all packages that failed.
+
+        """
+        versions = {}
+        for package in dict.fromkeys(packages):
+            future = self._futures.get(package)
+            if future is None or future.exception() is not None:
+                continue
+            versions[package] = future.result()[package]
+
+        missing = [p for p in packages if p not in versions]
+        if len(missing) > 0:
+            versions.update(get_package_versions(missing, **self._kwargs))
+        return {p: versions[p] for p in packages}
+
+    def shutdown(self) -> None:
+        """Stop the background thread, abandoning outstanding lookups."""
+        self._executor.shutdown(wait=False)
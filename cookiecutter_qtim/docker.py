@@ -1,33 +1,193 @@
 """Utilities for finding suitable docker images."""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import json
+import math
+from pathlib import Path
 import re
 from textwrap import dedent, fill
-from typing import Iterable, Optional
+import threading
+import time
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+from cookiecutter_qtim.cache import (
+    get_cache_dir,
+    read_json_cache,
+    write_json_cache,
+)
 
-import requests
+try:
+    from importlib.resources import files
+except ImportError:
+    # Python < 3.9
+    from importlib_resources import files
+
+if TYPE_CHECKING:
+    # requests is slow to import, so is only imported when first needed
+    import requests
 
 
 NVIDIA_TAG_RE = re.compile(
     r"(?P<cuda_major>\d+)\.(?P<cuda_minor>\d+)(?:\.(?P<cuda_patch>\d+))?"
-    r"-cudnn(?P<cudnn>\d+)-runtime-"
-    r"ubuntu(?P<ubuntu_major>\d+)\.(?P<ubuntu_minor>\d)+"
+    r"-cudnn(?P<cudnn>\d*)-runtime-"
+    r"ubuntu(?P<ubuntu_major>\d+)\.(?P<ubuntu_minor>\d+)"
 )
 
+UBUNTU_VERSION_RE = re.compile(r'ubuntu(\d\d\.\d\d)')
+
+DOCKERHUB_TAGS_URL = (
+    "https://hub.docker.com/v2/repositories/{user}/{repository}/tags"
+)
+
+# Largest page size accepted by the dockerhub API
+DOCKERHUB_PAGE_SIZE = 100
+
+# Timeout in seconds for each request to the dockerhub API
+DOCKERHUB_TIMEOUT = 10
+
+# Maximum number of pages of tags requested concurrently
+DOCKERHUB_MAX_WORKERS = 8
+
+# Oldest Ubuntu release considered when searching for the latest image
+MIN_UBUNTU_MAJOR_VERSION = 16
+
+# Time in seconds after which the cached catalog of nvidia/cuda tags is
+# refreshed in the background
+CATALOG_TTL = 24 * 60 * 60
+
+# Version of the catalog file format. Catalogs with a different version are
+# discarded
+CATALOG_FORMAT_VERSION = 1
+
+# Default table of the Python version of each Ubuntu release, shipped with
+# the package. Further releases are looked up on Launchpad when needed
+UBUNTU_PYTHON_VERSIONS_FILE = "data/ubuntu_python_versions.json"
+
+LAUNCHPAD_API_URL = "https://api.launchpad.net/1.0/ubuntu"
+
+LAUNCHPAD_TIMEOUT = 10
+
+# Serializes updates of the cached catalog between threads, such as the
+# background refresh and lookups of Python versions
+_CATALOG_LOCK = threading.Lock()
+
+
+def create_dockerhub_session() -> 'requests.Session':
+    """Create a session for querying the dockerhub API.
+
+    Returns
+    -------
+    requests.Session:
+        Session whose connection pool is large enough to request pages
+        concurrently.
+
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(pool_maxsize=DOCKERHUB_MAX_WORKERS),
+    )
+    return session
+
+
+def _iter_tag_results(
+    user: str,
+    repository: str,
+    session: 'requests.Session',
+    max_pages: Optional[int] = None,
+    name_filter: Optional[str] = None,
+    page_size: int = DOCKERHUB_PAGE_SIZE,
+    ordering: Optional[str] = None,
+    concurrent: bool = True,
+) -> Iterable[Dict[str, Any]]:
+    """Iterate over the raw results of listing a repository's tags.
+
+    If ``concurrent`` is True, the first page is requested alone in order to
+    find the total number of tags, then all remaining pages are requested
+    concurrently. Otherwise, pages are requested one at a time as they are
+    consumed, so that the caller may stop early without requesting further
+    pages.
+
+    """
+    url = DOCKERHUB_TAGS_URL.format(user=user, repository=repository)
+
+    def get_page(page_number: int) -> dict:
+        params = {"page": page_number, "page_size": page_size}
+        if name_filter is not None:
+            params["name"] = name_filter
+        if ordering is not None:
+            params["ordering"] = ordering
+        response = session.get(url, params=params, timeout=DOCKERHUB_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    info = get_page(1)
+    yield from info["results"]
+
+    if info["next"] is None:
+        return
+
+    n_pages = math.ceil(info["count"] / page_size)
+    if max_pages is not None:
+        n_pages = min(n_pages, max_pages)
+    if n_pages < 2:
+        return
+
+    if not concurrent:
+        for page_number in range(2, n_pages + 1):
+            info = get_page(page_number)
+            yield from info["results"]
+            if info["next"] is None:
+                return
+        return
+
+    n_workers = min(DOCKERHUB_MAX_WORKERS, n_pages - 1)
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        for info in executor.map(get_page, range(2, n_pages + 1)):
+            yield from info["results"]
+
 
 def get_image_tags(
     user: str,
     repository: str,
-    max_pages: Optional[int] = None
+    max_pages: Optional[int] = None,
+    name_filter: Optional[str] = None,
+    page_size: int = DOCKERHUB_PAGE_SIZE,
+    session: Optional['requests.Session'] = None,
 ) -> Iterable[str]:
     """Get available tags for a given docker image on dockerhub.
 
     This uses an undocumented API for dockerhub, so should not be relied upon.
 
+    The first page is requested alone in order to find the total number of
+    tags, then all remaining pages are requested concurrently.
+
     Parameters
     ----------
     user: str
         Username of the repository (first part of the image name).
     repository: str
         Repository name of the repository (second part of the image name).
+    max_pages: Optional[int]
+        Maximum number of pages of tags to request. If None, all are requested.
+    name_filter: Optional[str]
+        If specified, only tags containing this string are requested. The
+        filtering is performed by dockerhub.
+    page_size: int
+        Number of tags requested per page.
+    session: Optional[requests.Session]
+        Session to use for requests. If not provided, a new session is created.
 
     Returns
     -------
@@ -35,68 +195,377 @@ def get_image_tags(
         Yields tags for the given image as strings.
 
     """
-    url = f"https://hub.docker.com/v2/repositories/{user}/{repository}/tags"
-    page_number = 1
-    while True:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        info = response.json()
-        for image in info["results"]:
-            yield image["name"]
-        if info["next"] is not None:
-            if max_pages is None or page_number < max_pages:
-                url = info["next"]
-                page_number += 1
-                continue
-        break
-
-
-def get_latest_nvidia_cuda_image():
+    if session is None:
+        with create_dockerhub_session() as session:
+            yield from get_image_tags(
+                user=user,
+                repository=repository,
+                max_pages=max_pages,
+                name_filter=name_filter,
+                page_size=page_size,
+                session=session,
+            )
+        return
+
+    for result in _iter_tag_results(
+        user=user,
+        repository=repository,
+        session=session,
+        max_pages=max_pages,
+        name_filter=name_filter,
+        page_size=page_size,
+    ):
+        yield result["name"]
+
+
+def _nvidia_tag_sort_key(match) -> Tuple[int, ...]:
+    """Key used to order matches of NVIDIA_TAG_RE from oldest to latest."""
+    return (
+        int(match.group('ubuntu_major')),
+        int(match.group('ubuntu_minor')),
+        int(match.group('cuda_major')),
+        int(match.group('cuda_minor')),
+        int(match.group('cuda_patch') or 0),
+        int(match.group('cudnn') or 0),
+    )
+
+
+def _get_catalog_path() -> Path:
+    """Get the path of the cached catalog of nvidia/cuda tags."""
+    return get_cache_dir("docker") / "nvidia_cuda.json"
+
+
+def load_nvidia_cuda_catalog() -> Optional[Dict[str, Any]]:
+    """Load the cached catalog of nvidia/cuda tags.
+
+    The catalog is a dictionary containing the following items:
+
+    * ``"tags"``: mapping of each suitable tag (matching NVIDIA_TAG_RE) to
+      its parsed version numbers, as used to order the tags.
+    * ``"last_updated"``: most recent update time of any tag seen on
+      dockerhub, used to request only tags updated since the last refresh.
+    * ``"latest"``: the full name of the latest suitable image.
+    * ``"fetched"``: time (seconds since the epoch) of the last refresh.
+    * ``"python_versions"``: mapping of Ubuntu versions to the Python version
+      they provide, for releases not in the table shipped with the package.
+
+    Returns
+    -------
+    Optional[Dict[str, Any]]:
+        The catalog, or None if no valid catalog has been cached.
+
+    """
+    catalog = read_json_cache(_get_catalog_path())
+    if catalog is None or catalog.get("format") != CATALOG_FORMAT_VERSION:
+        return None
+    return catalog
+
+
+def _write_catalog(catalog: Dict[str, Any]) -> None:
+    """Write the catalog to the cache, keeping concurrent updates.
+
+    The catalog is re-read just before writing, and any Python versions added
+    to it since it was loaded are kept.
+
+    """
+    with _CATALOG_LOCK:
+        current = load_nvidia_cuda_catalog()
+        if current is not None:
+            catalog["python_versions"] = {
+                **current["python_versions"],
+                **catalog["python_versions"],
+            }
+        write_json_cache(_get_catalog_path(), catalog)
+
+
+def _scan_nvidia_cuda_tags(
+    session: 'requests.Session',
+) -> Tuple[Dict[str, List[int]], Optional[str]]:
+    """Scan dockerhub for the most recent Ubuntu release with suitable images.
+
+    Since the Ubuntu version is the most significant part of the ordering,
+    dockerhub is searched for runtime images of one Ubuntu major version at a
+    time, newest first, and the search stops at the first Ubuntu version for
+    which a suitable image exists.
+
+    Returns
+    -------
+    Dict[str, List[int]]:
+        Mapping of each suitable tag found to its parsed version numbers.
+    Optional[str]:
+        Most recent update time of any of the tags listed.
+
+    """
+    # Ubuntu versions are named by year of release
+    latest_ubuntu_major = date.today().year % 100
+    for ubuntu_major in range(
+        latest_ubuntu_major,
+        MIN_UBUNTU_MAJOR_VERSION - 1,
+        -1
+    ):
+        tags = {}
+        last_updated = None
+        for result in _iter_tag_results(
+            user='nvidia',
+            repository='cuda',
+            session=session,
+            name_filter=f'-runtime-ubuntu{ubuntu_major}.',
+        ):
+            updated = result.get("last_updated") or ""
+            if last_updated is None or updated > last_updated:
+                last_updated = updated
+            match = NVIDIA_TAG_RE.fullmatch(result["name"])
+            if match is not None:
+                tags[result["name"]] = list(_nvidia_tag_sort_key(match))
+        if len(tags) > 0:
+            return tags, last_updated
+
+    raise RuntimeError(
+        "No suitable nvidia/cuda image was found on dockerhub."
+    )
+
+
+def _update_nvidia_cuda_tags(
+    session: 'requests.Session',
+    since: str,
+) -> Tuple[Dict[str, List[int]], str]:
+    """Find suitable nvidia/cuda tags updated since a given time.
+
+    Tags are listed in order of most recent update, and listing stops at the
+    first tag that has not been updated since the given time. Usually only a
+    single page is requested.
+
+    Returns
+    -------
+    Dict[str, List[int]]:
+        Mapping of each new or updated suitable tag to its parsed version
+        numbers.
+    str:
+        Most recent update time of any of the tags listed.
+
+    """
+    tags = {}
+    last_updated = since
+    for result in _iter_tag_results(
+        user='nvidia',
+        repository='cuda',
+        session=session,
+        name_filter='-runtime-ubuntu',
+        ordering='last_updated',
+        concurrent=False,
+    ):
+        updated = result.get("last_updated") or ""
+        if updated <= since:
+            break
+        last_updated = max(last_updated, updated)
+        match = NVIDIA_TAG_RE.fullmatch(result["name"])
+        if match is not None:
+            tags[result["name"]] = list(_nvidia_tag_sort_key(match))
+    return tags, last_updated
+
+
+def refresh_nvidia_cuda_catalog(full: bool = False) -> Dict[str, Any]:
+    """Refresh the cached catalog of nvidia/cuda tags from dockerhub.
+
+    If a catalog already exists, only tags updated on dockerhub since the last
+    refresh are requested. Otherwise (or if ``full`` is True), the catalog is
+    built from scratch. The refreshed catalog is saved to the cache.
+
+    Parameters
+    ----------
+    full: bool
+        Rebuild the catalog from scratch even if one exists.
+
+    Returns
+    -------
+    Dict[str, Any]:
+        The refreshed catalog. See :func:`load_nvidia_cuda_catalog`.
+
+    """
+    catalog = None if full else load_nvidia_cuda_catalog()
+
+    with create_dockerhub_session() as session:
+        if catalog is None or catalog.get("last_updated") is None:
+            tags, last_updated = _scan_nvidia_cuda_tags(session)
+            catalog = {
+                "format": CATALOG_FORMAT_VERSION,
+                "tags": tags,
+                "python_versions": (
+                    catalog["python_versions"] if catalog is not None else {}
+                ),
+            }
+        else:
+            tags, last_updated = _update_nvidia_cuda_tags(
+                session,
+                since=catalog["last_updated"],
+            )
+            catalog["tags"].update(tags)
+
+    latest_tag = max(catalog["tags"], key=lambda t: catalog["tags"][t])
+    catalog["latest"] = f'nvidia/cuda:{latest_tag}'
+    catalog["last_updated"] = last_updated
+    catalog["fetched"] = time.time()
+
+    # Make sure the Python version of the latest image is known in advance
+    ubuntu_version = UBUNTU_VERSION_RE.search(latest_tag).group(1)
+    if ubuntu_version not in _load_default_python_versions():
+        if ubuntu_version not in catalog["python_versions"]:
+            try:
+                catalog["python_versions"][ubuntu_version] = (
+                    get_ubuntu_python_version(ubuntu_version)
+                )
+            except Exception:
+                # Will be retried on demand
+                pass
+
+    _write_catalog(catalog)
+    return catalog
+
+
+def _refresh_catalog_quietly() -> None:
+    """Refresh the catalog, ignoring any errors."""
+    try:
+        refresh_nvidia_cuda_catalog()
+    except Exception:
+        pass
+
+
+def get_latest_nvidia_cuda_image(
+    refresh: bool = False,
+    max_age: float = CATALOG_TTL,
+    offline: bool = False,
+) -> str:
     """Gets the latest nvidia/cuda image that meets our criteria.
 
     Criteria are that the image should be Ubuntu based, be a basic runtime
     image and include CUDNN.
 
+    The answer is taken from a catalog of tags cached on the local disk. If
+    the catalog is older than ``max_age`` seconds, the cached answer is
+    returned immediately and the catalog is refreshed in a background thread
+    for next time. If there is no catalog, or ``refresh`` is True, the catalog
+    is refreshed before returning.
+
     Note that Nvidia may change their tag format in the future and break this
     function, and dockerhub may change their API.
 
+    Parameters
+    ----------
+    refresh: bool
+        Refresh the catalog from dockerhub before returning.
+    max_age: float
+        Age in seconds after which the catalog is refreshed in the background.
+    offline: bool
+        Use the cached catalog only and do not make any network requests.
+
+    Returns
+    -------
+    str:
+        Full name of the image, including the tag.
+
     """
-    # Get a list of all available tags from dockerhub
-    tags = get_image_tags(user='nvidia', repository='cuda', max_pages=10)
-
-    # This regex both filters for the Ubuntu-based runtime image with CUDNN
-    # and extracts the versions of the relevant pieces for sorted
-    matches = []
-    for t in tags:
-        match = NVIDIA_TAG_RE.fullmatch(t)
-        if match is not None:
-            matches.append(match)
-
-    def sort_fun(match):
-        return (
-            int(match.group('ubuntu_major')),
-            int(match.group('ubuntu_minor')),
-            int(match.group('cuda_major')),
-            int(match.group('cuda_minor')),
-            int(match.group('cuda_patch') or 0),
-            int(match.group('cudnn')),
+    catalog = load_nvidia_cuda_catalog()
+
+    if offline:
+        if catalog is None:
+            raise RuntimeError(
+                "No catalog of nvidia/cuda images is cached, cannot find the "
+                "latest image in offline mode."
+            )
+        return catalog["latest"]
+
+    if catalog is None or refresh:
+        catalog = refresh_nvidia_cuda_catalog()
+    elif time.time() - catalog["fetched"] >= max_age:
+        threading.Thread(target=_refresh_catalog_quietly, daemon=True).start()
+
+    return catalog["latest"]
+
+
+def _load_default_python_versions() -> Dict[str, str]:
+    """Load the table of Python versions shipped with the package."""
+    resource = files("cookiecutter_qtim").joinpath(UBUNTU_PYTHON_VERSIONS_FILE)
+    return json.loads(resource.read_text())
+
+
+def get_ubuntu_python_version(ubuntu_version: str) -> str:
+    """Look up the default Python version of an Ubuntu release on Launchpad.
+
+    Parameters
+    ----------
+    ubuntu_version: str
+        Ubuntu version string, e.g. '22.04'.
+
+    Returns
+    -------
+    str:
+        Python version string, e.g. '3.10'.
+
+    """
+    import requests
+
+    with requests.Session() as session:
+        response = session.get(
+            f"{LAUNCHPAD_API_URL}/series",
+            timeout=LAUNCHPAD_TIMEOUT,
+        )
+        response.raise_for_status()
+        for series in response.json()["entries"]:
+            if series["version"] == ubuntu_version:
+                break
+        else:
+            raise RuntimeError(
+                f"Ubuntu version {ubuntu_version} was not found on Launchpad."
+            )
+
+        # The python3-defaults source package determines the version of
+        # python3 in the release
+        response = session.get(
+            f"{LAUNCHPAD_API_URL}/+archive/primary",
+            params={
+                "ws.op": "getPublishedSources",
+                "source_name": "python3-defaults",
+                "exact_match": "true",
+                "distro_series": series["self_link"],
+                "pocket": "Release",
+            },
+            timeout=LAUNCHPAD_TIMEOUT,
         )
-    sorted_matches = sorted(matches, key=sort_fun)
-    latest_tag = sorted_matches[-1].string
+        response.raise_for_status()
+        entries = response.json()["entries"]
+        if len(entries) == 0:
+            raise RuntimeError(
+                "No python3-defaults package was found for Ubuntu version "
+                f"{ubuntu_version}."
+            )
 
-    return f'nvidia/cuda:{latest_tag}'
+    # Package versions look like '3.10.6-1~22.04'
+    match = re.match(r'(\d+\.\d+)', entries[0]["source_package_version"])
+    if match is None:
+        raise RuntimeError(
+            "Unable to parse python3-defaults version for Ubuntu version "
+            f"{ubuntu_version}."
+        )
+    return match.group(1)
 
 
-def find_docker_image_python_version(docker_image: str) -> Optional[str]:
+def find_docker_image_python_version(
+    docker_image: str,
+    offline: bool = False,
+) -> Optional[str]:
     """Find Python version for a given Docker image name.
 
-    This looks for an Ubuntu version tag in the image name and uses a hard
-    coded lookup table to deduce the Python version.
+    This looks for an Ubuntu version tag in the image name and uses a lookup
+    table to deduce the Python version. The table shipped with the package is
+    extended by versions stored in the catalog of nvidia/cuda tags. Versions
+    not found in either are looked up on Launchpad and added to the catalog.
 
     Parameters
     ----------
     docker_image: str
         Name of a docker image, with optional tag.
+    offline: bool
+        Do not look up unknown Ubuntu versions on Launchpad.
 
     Returns
     -------
@@ -104,28 +573,40 @@ def find_docker_image_python_version(docker_image: str) -> Optional[str]:
        Python version string (e.g. '3.9') if it can be deduced, else None
 
     """
-    exp = re.compile(r'ubuntu(\d\d\.\d\d)')
-    match = exp.search(docker_image)
+    match = UBUNTU_VERSION_RE.search(docker_image)
     if match is None:
         return None
 
     ubuntu_version = match.groups()[0]
 
-    # Use https://packages.ubuntu.com to look this up
-    lookup_table = {
-        "18.04": "3.6",
-        "20.04": "3.8",
-        "22.04": "3.10",
-    }
+    lookup_table = _load_default_python_versions()
+    catalog = load_nvidia_cuda_catalog()
+    if catalog is not None:
+        lookup_table.update(catalog["python_versions"])
 
-    try:
-        python_version = lookup_table[ubuntu_version]
-    except KeyError:
-        msg = f"""\
-            WARNING: Ubuntu version {ubuntu_version} not included in the
-            Python version lookup table in source code of the
-            cookiecutter-qtim package. The source code may need to be updated.
-        """
-        print(fill(dedent(msg)))
-        return None
-    return python_version
+    if ubuntu_version in lookup_table:
+        return lookup_table[ubuntu_version]
+
+    if not offline:
+        try:
+            python_version = get_ubuntu_python_version(ubuntu_version)
+        except Exception:
+            pass
+        else:
+            # Add the version to the catalog as it is now, rather than as it
+            # was loaded, in case it has been refreshed in the meantime
+            with _CATALOG_LOCK:
+                catalog = load_nvidia_cuda_catalog()
+                if catalog is not None:
+                    catalog["python_versions"][ubuntu_version] = python_version
+                    write_json_cache(_get_catalog_path(), catalog)
+            return python_version
+
+    msg = f"""\
+        WARNING: Ubuntu version {ubuntu_version} is not included in the
+        Python version lookup table of the cookiecutter-qtim package and
+        could not be looked up automatically. The table may need to be
+        updated.
+    """
+    print(fill(dedent(msg)))
+    return None
@@ -0,0 +1,216 @@
+"""Building the pre-commit hook environments of new projects.
+
+By default, pre-commit builds the environment of each hook the first time it
+runs, i.e. on the first commit in a new project, which can take several
+minutes. The functions here build them up front instead, in parallel, in the
+pre-commit store. The store is shared by all projects of the user (it is
+found in the same way as by pre-commit itself, so the PRE_COMMIT_HOME
+environment variable may be used to share one between users), and holds one
+environment for each hook repository, revision and set of additional
+dependencies, so projects using the same hook revisions reuse the same
+environments.
+
+"""
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pre_commit.hook import Hook
+    from pre_commit.store import Store
+
+
+def seed_store(store: 'Store', seed_dir: Path) -> int:
+    """Copy hook repositories missing from a pre-commit store from another.
+
+    This allows hooks to be installed without network access, for example
+    on a cluster, by seeding from a store that was populated elsewhere.
+    Repositories are copied along with any environments built within them.
+    Environments that do not work at their new location fail pre-commit's
+    health check and are rebuilt when the hooks are installed.
+
+    Parameters
+    ----------
+    store: pre_commit.store.Store
+        Store to copy repositories into.
+    seed_dir: pathlib.Path
+        Directory of the pre-commit store to copy repositories from.
+
+    Returns
+    -------
+    int:
+        Number of repositories copied.
+
+    Raises
+    ------
+    ValueError:
+        If the seed directory is not a pre-commit store.
+
+    """
+    from contextlib import closing
+    import sqlite3
+
+    seed_db = Path(seed_dir) / "db.db"
+    if not seed_db.exists():
+        raise ValueError(f"{seed_dir} is not a pre-commit store directory.")
+    with closing(sqlite3.connect(str(seed_db))) as db:
+        seed_repos = db.execute("SELECT repo, ref, path FROM repos").fetchall()
+
+    n_copied = 0
+    with store.exclusive_lock():
+        with store.connect() as db:
+            existing = set(db.execute("SELECT repo, ref FROM repos"))
+            for repo, ref, path in seed_repos:
+                if (repo, ref) in existing or not os.path.isdir(path):
+                    continue
+                # Same naming scheme as pre-commit itself
+                directory = tempfile.mkdtemp(
+                    prefix="repo", dir=store.directory
+                )
+                os.rmdir(directory)
+                shutil.copytree(path, directory, symlinks=True)
+                db.execute(
+                    "INSERT INTO repos (repo, ref, path) VALUES (?, ?, ?)",
+                    (repo, ref, directory),
+                )
+                n_copied += 1
+    return n_copied
+
+
+def _install_hook_env(hook: 'Hook') -> Optional[str]:
+    """Build the environment of a single hook.
+
+    This runs within worker processes, while the parent process holds the
+    lock on the store, so must not take the lock itself or raise.
+
+    Returns
+    -------
+    Optional[str]:
+        Description of the error that occurred, if any.
+
+    """
+    from pre_commit.repository import _hook_install, _hook_installed
+
+    try:
+        if not _hook_installed(hook):
+            _hook_install(hook)
+    except Exception as e:
+        return f"{hook.src}: {type(e).__name__}: {e}"
+    return None
+
+
+def _environment_key(hook: 'Hook') -> Tuple[str, str, str]:
+    """Key identifying the directory of a hook's environment.
+
+    pre-commit builds the environments of hooks from the same repository and
+    revision with the same language and language version in the same
+    directory, even if their additional dependencies differ.
+
+    """
+    return (hook.prefix.prefix_dir, hook.language, hook.language_version)
+
+
+def _find_hooks_to_install(
+    config_files: Sequence[Path],
+    store: 'Store',
+) -> List['Hook']:
+    """List the hooks whose environments have not yet been built.
+
+    Hooks that share an environment are only listed once. Any hook
+    repositories missing from the store are cloned.
+
+    """
+    from pre_commit.clientlib import load_config
+    from pre_commit.repository import _hook_installed, all_hooks
+
+    seen = set()
+    hooks = []
+    for config_file in config_files:
+        for hook in all_hooks(load_config(str(config_file)), store):
+            if hook.install_key in seen:
+                continue
+            seen.add(hook.install_key)
+            if not _hook_installed(hook):
+                hooks.append(hook)
+    return hooks
+
+
+def install_hook_environments(
+    config_files: Sequence[Path],
+    seed_dir: Optional[Path] = None,
+    max_workers: Optional[int] = None,
+) -> Tuple[int, float]:
+    """Build the environments of all hooks used by some projects.
+
+    Environments that already exist in the store are reused, and the rest
+    are built in parallel, one per process. Environments that pre-commit
+    builds in the same directory are built one after another.
+
+    Parameters
+    ----------
+    config_files: Sequence[pathlib.Path]
+        Pre-commit configuration files of the projects.
+    seed_dir: Optional[pathlib.Path]
+        Directory of a pre-commit store to seed the store from before
+        installing. See :func:`seed_store`.
+    max_workers: Optional[int]
+        Maximum number of environments to build in parallel. By default, the
+        number of CPUs is used.
+
+    Returns
+    -------
+    int:
+        Number of environments built.
+    float:
+        Time taken in seconds.
+
+    Raises
+    ------
+    RuntimeError:
+        If any of the environments could not be built.
+
+    """
+    # These are slow to import, so are only imported when needed
+    from concurrent.futures import ProcessPoolExecutor
+    from pre_commit.store import Store
+
+    start = time.perf_counter()
+    store = Store()
+    if seed_dir is not None:
+        seed_store(store, seed_dir)
+
+    hooks = _find_hooks_to_install(config_files, store)
+    if len(hooks) == 0:
+        return 0, time.perf_counter() - start
+
+    # Environments sharing a directory cannot be built at the same time, so
+    # the first environment in each directory is built in parallel, and any
+    # others are built one at a time afterwards
+    groups: Dict[Tuple[str, str, str], List['Hook']] = {}
+    for hook in hooks:
+        groups.setdefault(_environment_key(hook), []).append(hook)
+    parallel_hooks = [group[0] for group in groups.values()]
+    serial_hooks = [hook for group in groups.values() for hook in group[1:]]
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(parallel_hooks)))
+
+    # Environments are built in separate processes rather than threads since
+    # pre-commit modifies the environment variables while building them.
+    # Building an environment normally takes the lock on the store, so it is
+    # taken once here for all of them instead.
+    with store.exclusive_lock():
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_install_hook_env, parallel_hooks))
+        results += [_install_hook_env(hook) for hook in serial_hooks]
+    errors = [e for e in results if e is not None]
+    if len(errors) > 0:
+        raise RuntimeError(
+            f"Error building {len(errors)} pre-commit hook environment(s):\n"
+            + "\n".join(f"  {e}" for e in errors)
+        )
+    return len(hooks), time.perf_counter() - start
@@ -0,0 +1,305 @@
+"""Validation of user answers and creation of project repositories."""
+from pathlib import Path
+import re
+from typing import Any, Dict, Optional, Tuple, TYPE_CHECKING
+
+from cookiecutter_qtim.update import record_template_state
+
+if TYPE_CHECKING:
+    from pre_commit.store import Store
+
+
+GIT_URL = "https://github.com"
+
+FALLBACK_DOCKER_IMAGE = 'nvidia/cuda:11.7.1-cudnn8-runtime-ubuntu22.04'
+
+PROJECT_NAME_RE = re.compile(r"[a-z][a-z0-9\-]*[a-z0-9]")
+
+PATH_RE = re.compile(r"[a-zA-Z0-9_.\-/]+")
+
+GIT_PATH_RE = re.compile(r"[a-zA-Z0-9_.\-/]+")
+
+DOCKER_IMAGE_RE = re.compile(r'[a-zA-Z0-9-_:\./]+')
+
+PYTHON_VERSION_RE = re.compile(r'3\.[1-9][0-9]*')
+
+
+def validate_project_name(project_name: str) -> str:
+    """Check that a project name is valid.
+
+    Parameters
+    ----------
+    project_name: str
+        Name of the project, consisting of lower case letters, numbers and
+        hyphens.
+
+    Returns
+    -------
+    str:
+        The project name.
+
+    Raises
+    ------
+    ValueError:
+        If the project name is invalid.
+
+    """
+    if PROJECT_NAME_RE.fullmatch(project_name) is None:
+        raise ValueError("Invalid name.")
+    return project_name
+
+
+def validate_directory(path: str) -> str:
+    """Check that the path to a directory is valid.
+
+    Parameters
+    ----------
+    path: str
+        Absolute path to the directory.
+
+    Returns
+    -------
+    str:
+        The normalized path.
+
+    Raises
+    ------
+    ValueError:
+        If the path contains invalid characters or is not absolute.
+
+    """
+    if PATH_RE.fullmatch(path) is None:
+        raise ValueError("Invalid characters found in path.")
+    if not Path(path).is_absolute():
+        raise ValueError("Path must be an absolute path")
+    return str(Path(path))
+
+
+def validate_github_path(github_path: str) -> Tuple[str, str]:
+    """Check that the path of a repository on github is valid.
+
+    Parameters
+    ----------
+    github_path: str
+        Path of the repository relative to the github URL, e.g.
+        'QTIM-Lab/project'. The full URL of the repository is also accepted.
+
+    Returns
+    -------
+    str:
+        The path of the repository relative to the github URL.
+    str:
+        The full URL of the repository, without any '.git' suffix.
+
+    Raises
+    ------
+    ValueError:
+        If the path is invalid.
+
+    """
+    if github_path.startswith(f"{GIT_URL}/"):
+        github_path = github_path[len(GIT_URL) + 1:]
+    if GIT_PATH_RE.fullmatch(github_path) is None:
+        raise ValueError("Invalid URL.")
+    git_url = f"{GIT_URL}/{github_path}"
+    if git_url.endswith('.git'):
+        git_url = git_url[:-4]
+    return github_path, git_url
+
+
+def validate_docker_image(docker_image: str) -> str:
+    """Check that a docker image name is valid.
+
+    Parameters
+    ----------
+    docker_image: str
+        Name of the docker image, including a full tag.
+
+    Returns
+    -------
+    str:
+        The docker image name.
+
+    Raises
+    ------
+    ValueError:
+        If the image name is invalid or does not include a full tag.
+
+    """
+    if DOCKER_IMAGE_RE.fullmatch(docker_image) is None:
+        raise ValueError(
+            f"'{docker_image}' is not a valid docker image name."
+        )
+    if ':' not in docker_image or ':latest' in docker_image:
+        raise ValueError(
+            "The selected docker image must include a full tag (not just "
+            "':latest')."
+        )
+    return docker_image
+
+
+def validate_python_version(python_version: str) -> str:
+    """Check that a Python version is valid.
+
+    Parameters
+    ----------
+    python_version: str
+        Python version string, e.g. '3.10'.
+
+    Returns
+    -------
+    str:
+        The Python version string.
+
+    Raises
+    ------
+    ValueError:
+        If the string is not a valid Python 3 version.
+
+    """
+    if PYTHON_VERSION_RE.fullmatch(python_version) is None:
+        raise ValueError(
+            f"{python_version} is not a valid Python 3 version."
+        )
+    return python_version
+
+
+def get_mac_mountpoint(path: str):
+    """Get the directory on a Mac where a Martinos path will be mounted."""
+    return (
+        path
+        .replace("/autofs/cluster", "/Volumes")
+        .replace("/autofs/vast", "/Volumes")
+    )
+
+
+def build_extra_context(
+    project_name: str,
+    project_dir: str,
+    project_dataset_dir: str,
+    github_path: str,
+    git_url: str,
+    docker_image: str,
+    python_version: str,
+    package_versions: Dict[str, str],
+    package_versions_dev: Dict[str, str],
+    pip_version: str,
+    setuptools_version: str,
+) -> Dict[str, Any]:
+    """Build the context used to render the project template.
+
+    Parameters
+    ----------
+    project_name: str
+        Name of the project.
+    project_dir: str
+        Absolute path to the directory containing the project files.
+    project_dataset_dir: str
+        Absolute path to the directory containing the project dataset.
+    github_path: str
+        Path of the repository relative to the github URL.
+    git_url: str
+        Full URL of the repository.
+    docker_image: str
+        Base image for the project's docker image.
+    python_version: str
+        Python version used in the project.
+    package_versions: Dict[str, str]
+        Runtime dependencies of the project and their versions.
+    package_versions_dev: Dict[str, str]
+        Development dependencies of the project and their versions.
+    pip_version: str
+        Version of pip to install in the project's docker image.
+    setuptools_version: str
+        Version of setuptools to install in the project's docker image.
+
+    Returns
+    -------
+    Dict[str, Any]:
+        Extra context to pass to cookiecutter.
+
+    """
+    project_slug = project_name.replace('-', '_')
+    return {
+        "__project_name": project_name,
+        "__project_slug": project_slug,
+        "__repository_url": git_url,
+        "__package_versions": package_versions,
+        "__package_versions_dev": package_versions_dev,
+        "__pip_version": pip_version,
+        "__setuptools_version": setuptools_version,
+        "__docker_base_image": docker_image,
+        "__python_version": python_version,
+        "__github_project_path": github_path,
+        "__project_path": project_dir,
+        "__data_path": project_dataset_dir,
+        "__container_path": str(Path(project_dir) / "containers"),
+        "__mac_project_path": get_mac_mountpoint(project_dir),
+        "__mac_data_path": get_mac_mountpoint(project_dataset_dir),
+        "__container_tag": project_name,
+    }
+
+
+def create_project(
+    template_dir: str,
+    output_dir: Path,
+    extra_context: Dict[str, Any],
+    no_input: bool = False,
+    store: Optional['Store'] = None,
+) -> str:
+    """Render the project template and set up its git repository.
+
+    The template is rendered with cookiecutter, a git repository is
+    initialized in the result with the remote 'origin', the state needed to
+    update the project from the template later is recorded, all files are
+    added (but not committed), and the pre-commit hooks are installed.
+
+    Parameters
+    ----------
+    template_dir: str
+        Path to the cookiecutter template.
+    output_dir: pathlib.Path
+        Parent of the output project directory.
+    extra_context: Dict[str, Any]
+        Context to render the template with. See
+        :func:`build_extra_context`.
+    no_input: bool
+        Do not prompt for template variables missing from the context.
+    store: Optional[pre_commit.store.Store]
+        Pre-commit store to use when installing the hooks.
+
+    Returns
+    -------
+    str:
+        Path to the created project repository.
+
+    """
+    # These are slow to import, so are only imported when needed
+    from cookiecutter.main import cookiecutter
+    from git import Repo
+    from pre_commit.commands.install_uninstall import install
+    from pre_commit.constants import HOOK_TYPES
+    from pre_commit.store import Store
+
+    repo_dir = cookiecutter(
+        template_dir,
+        output_dir=str(output_dir),
+        extra_context=extra_context,
+        no_input=no_input,
+    )
+
+    # Initialize git in repository and add all files
+    git_url = extra_context["__repository_url"]
+    repo = Repo.init(repo_dir, initial_branch="main")
+    repo.create_remote("origin", git_url)
+    record_template_state(repo, template_dir)
+    repo.git.add(all=True)
+
+    install(
+        config_file=Path(repo_dir) / ".pre-commit-config.yaml",
+        store=store if store is not None else Store(),
+        hook_types=HOOK_TYPES,
+        git_dir=Path(repo_dir) / '.git',
+    )
+
+    return repo_dir
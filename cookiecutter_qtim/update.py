@@ -0,0 +1,510 @@
+"""Re-application of the project template to existing projects.
+
+When a project is created, the context used to render the template and a
+hash of every rendered file are stored in the project's state file. The
+contents of the rendered files are also kept in the project's git object
+database, under a reference that is not a branch, so that they can be used
+as the common ancestor of a three-way merge.
+
+To update a project, only the template files whose source or context has
+changed since the project was last rendered are rendered again. Files that
+the user has not edited are simply replaced by the new version, while
+changes to edited files are merged into them with 'git merge-file'.
+
+"""
+from io import BytesIO
+import hashlib
+import json
+from pathlib import Path
+import shutil
+from tempfile import TemporaryDirectory
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+if TYPE_CHECKING:
+    from git import Repo
+    from jinja2 import Environment
+
+
+# Name of the file in the project root that stores the context and hashes
+STATE_FILE = ".cookiecutter-qtim.json"
+
+# Version of the format of the state file
+STATE_FORMAT_VERSION = 1
+
+# Git reference to a tree holding the files as last rendered from the
+# template, which keeps them available as the base of three-way merges
+BASE_REF = "refs/cookiecutter-qtim/base"
+
+# Name of the template directory that contains the project files
+TEMPLATE_ROOT = "{{ cookiecutter.__project_name }}"
+
+# Possible results of updating a file
+ADDED = "added"
+UPDATED = "updated"
+MERGED = "merged"
+CONFLICT = "conflict"
+REMOVED = "removed"
+SKIPPED = "skipped"
+
+
+class FileUpdate(NamedTuple):
+    """Result of updating a single file of a project."""
+
+    path: str
+    action: str
+    message: str = ""
+
+
+def _hash_blob(data: bytes) -> str:
+    """Hash the contents of a file in the same way as a git blob."""
+    header = f"blob {len(data)}\0".encode()
+    return hashlib.sha1(header + data).hexdigest()
+
+
+def _hash_context(context: Dict[str, Any]) -> str:
+    """Hash the context used to render the template."""
+    data = json.dumps(context, sort_keys=True).encode()
+    return hashlib.sha1(data).hexdigest()
+
+
+def _public_context(context: Dict[str, Any]) -> Dict[str, Any]:
+    """Remove variables that cookiecutter adds about the current run.
+
+    These (such as '_template' and '_output_dir') are specific to the
+    machine the project was rendered on and are not used by the template.
+
+    """
+    return {
+        key: value for key, value in context.items()
+        if not key.startswith('_') or key.startswith('__')
+    }
+
+
+def _iter_template_files(template_root: Path) -> Iterator[str]:
+    """List the paths of the project files in the template.
+
+    Paths are relative to the template root and use forward slashes. The
+    state file is excluded.
+
+    """
+    for path in sorted(template_root.rglob('*')):
+        if path.is_file() and '__pycache__' not in path.parts:
+            rel_path = path.relative_to(template_root).as_posix()
+            if rel_path != STATE_FILE:
+                yield rel_path
+
+
+def _create_env(context: Dict[str, Any]) -> 'Environment':
+    """Create the jinja environment used by cookiecutter for the template.
+
+    The environment loads templates relative to the current directory, which
+    must be the template root when rendering files.
+
+    """
+    from cookiecutter.generate import create_env_with_context
+    from jinja2 import FileSystemLoader
+
+    env = create_env_with_context({"cookiecutter": context})
+    env.loader = FileSystemLoader('.')
+    return env
+
+
+def _render_path(env: 'Environment', context: Dict[str, Any], path: str):
+    """Render the path of a project file from its path in the template."""
+    return env.from_string(path).render(cookiecutter=context)
+
+
+def _store_blobs(repo: 'Repo', contents: Dict[str, bytes]) -> None:
+    """Write file contents to the git object database."""
+    from gitdb import IStream
+
+    for data in contents.values():
+        repo.odb.store(IStream("blob", len(data), BytesIO(data)))
+
+
+def _read_blob(repo: 'Repo', hexsha: str) -> Optional[bytes]:
+    """Read a blob from the git object database, if it is present."""
+    from gitdb.util import hex_to_bin
+
+    binsha = hex_to_bin(hexsha)
+    if not repo.odb.has_object(binsha):
+        return None
+    return repo.odb.stream(binsha).read()
+
+
+def _update_base_ref(repo: 'Repo', files: Dict[str, Dict[str, str]]) -> None:
+    """Point the base reference at a tree of the rendered files.
+
+    The tree is built in a temporary index, so the project's own index is
+    not affected. Files whose contents are not in the object database (for
+    example, in a fresh clone of the project) are left out.
+
+    """
+    from gitdb.util import hex_to_bin
+
+    lines = [
+        f"100644 {entry['rendered']}\t{path}\n"
+        for path, entry in sorted(files.items())
+        if repo.odb.has_object(hex_to_bin(entry['rendered']))
+    ]
+    with TemporaryDirectory() as tmp_dir:
+        index_info = Path(tmp_dir) / "index_info"
+        index_info.write_text(''.join(lines), encoding="utf-8")
+        with repo.git.custom_environment(
+            GIT_INDEX_FILE=str(Path(tmp_dir) / "index")
+        ):
+            with index_info.open('rb') as f:
+                repo.git.update_index("--index-info", istream=f)
+            tree = repo.git.write_tree()
+    repo.git.update_ref(BASE_REF, tree)
+
+
+def _write_state(
+    project_dir: Path,
+    context: Dict[str, Any],
+    files: Dict[str, Dict[str, str]],
+) -> None:
+    """Write the state file of a project."""
+    state = {
+        "version": STATE_FORMAT_VERSION,
+        "context": context,
+        "context_hash": _hash_context(context),
+        "files": files,
+    }
+    with (project_dir / STATE_FILE).open('w', encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load_state(project_dir: Path) -> Dict[str, Any]:
+    """Load the state file of a project.
+
+    Parameters
+    ----------
+    project_dir: pathlib.Path
+        Root directory of the project.
+
+    Returns
+    -------
+    Dict[str, Any]:
+        The stored context ('context') and its hash ('context_hash'), and the
+        hashes of the template source and the rendered contents of each
+        project file ('files').
+
+    Raises
+    ------
+    ValueError:
+        If the project has no valid state file.
+
+    """
+    state_path = project_dir / STATE_FILE
+    try:
+        with state_path.open(encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(
+            f"{state_path} not found. Only projects created by a version of "
+            "cookiecutter-qtim that supports updates can be updated."
+        )
+    except ValueError:
+        raise ValueError(f"{state_path} is not a valid JSON file.")
+    if state.get("version") != STATE_FORMAT_VERSION:
+        raise ValueError(
+            f"{state_path} has an unsupported format version "
+            f"({state.get('version')})."
+        )
+    return state
+
+
+def record_template_state(repo: 'Repo', template_dir: str) -> None:
+    """Store the state of a newly rendered project.
+
+    The template renders the state file containing just its context. This
+    is replaced by the full state, including the hashes of each template
+    file and the file rendered from it, and the rendered files are stored as
+    the base for future updates.
+
+    Parameters
+    ----------
+    repo: git.Repo
+        Git repository of the newly rendered project.
+    template_dir: str
+        Path to the cookiecutter template the project was rendered from.
+
+    """
+    project_dir = Path(repo.working_tree_dir)
+    with (project_dir / STATE_FILE).open(encoding="utf-8") as f:
+        context = _public_context(json.load(f))
+
+    template_root = Path(template_dir) / TEMPLATE_ROOT
+    env = _create_env(context)
+    files = {}
+    contents = {}
+    for source_path in _iter_template_files(template_root):
+        path = _render_path(env, context, source_path)
+        data = (project_dir / path).read_bytes()
+        files[path] = {
+            "source": _hash_blob((template_root / source_path).read_bytes()),
+            "rendered": _hash_blob(data),
+        }
+        contents[path] = data
+
+    _store_blobs(repo, contents)
+    _update_base_ref(repo, files)
+    _write_state(project_dir, context, files)
+
+
+def _build_context(
+    template_dir: str,
+    stored_context: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Build the context to render the current template for a project.
+
+    The stored context is applied over the template's own context, so that
+    any variables added to the template since the project was created take
+    their default values.
+
+    """
+    from cookiecutter.generate import generate_context
+    from cookiecutter.prompt import prompt_for_config
+
+    context = generate_context(
+        context_file=str(Path(template_dir) / "cookiecutter.json"),
+        extra_context=stored_context,
+    )
+    return _public_context(prompt_for_config(context, no_input=True))
+
+
+def _merge(
+    repo: 'Repo',
+    current: bytes,
+    base: bytes,
+    new: bytes,
+) -> Tuple[bytes, int]:
+    """Merge template changes into a file the user has edited.
+
+    Parameters
+    ----------
+    repo: git.Repo
+        Git repository of the project.
+    current: bytes
+        Current contents of the file in the project.
+    base: bytes
+        Contents of the file as last rendered from the template.
+    new: bytes
+        Contents of the file rendered from the current template.
+
+    Returns
+    -------
+    bytes:
+        The merged contents, including conflict markers if necessary.
+    int:
+        The number of conflicts.
+
+    """
+    with TemporaryDirectory() as tmp_dir:
+        paths = []
+        for name, data in [("current", current), ("base", base), ("new", new)]:
+            path = Path(tmp_dir) / name
+            path.write_bytes(data)
+            paths.append(str(path))
+        status, _, stderr = repo.git.merge_file(
+            "-L", "project",
+            "-L", "previous template",
+            "-L", "updated template",
+            *paths,
+            with_extended_output=True,
+            with_exceptions=False,
+        )
+        # Errors give a negative status, the number of conflicts is capped
+        if status < 0 or status > 127:
+            raise RuntimeError(f"Failed to merge: {stderr}")
+        return Path(paths[0]).read_bytes(), status
+
+
+def update_project(
+    project_dir: Path,
+    template_dir: str,
+    dry_run: bool = False,
+) -> List[FileUpdate]:
+    """Apply the current version of the template to an existing project.
+
+    Only template files whose source or context have changed since the
+    project was last rendered are rendered again. For each, if the user has
+    not edited the project file, it is replaced by the new version, and
+    otherwise the changes to the template are merged into it. Files that the
+    user has deleted are not recreated, and files removed from the template
+    are deleted only if the user has not edited them. Changes are not staged,
+    so they can be reviewed with git before committing.
+
+    Parameters
+    ----------
+    project_dir: pathlib.Path
+        Root directory of the project.
+    template_dir: str
+        Path to the cookiecutter template.
+    dry_run: bool
+        Only report the changes that would be made, without changing any
+        files.
+
+    Returns
+    -------
+    List[FileUpdate]:
+        The changes made to the files of the project. Unchanged files are
+        not included.
+
+    Raises
+    ------
+    ValueError:
+        If the directory is not a project that can be updated.
+
+    """
+    from cookiecutter.generate import generate_file
+    from cookiecutter.utils import work_in
+    from git import InvalidGitRepositoryError, NoSuchPathError, Repo
+
+    project_dir = Path(project_dir).resolve()
+    state = load_state(project_dir)
+    try:
+        repo = Repo(project_dir)
+    except (InvalidGitRepositoryError, NoSuchPathError):
+        raise ValueError(f"{project_dir} is not a git repository.")
+
+    context = _build_context(template_dir, state["context"])
+    context_changed = _hash_context(context) != state["context_hash"]
+    old_files = state["files"]
+    files = {}
+    rendered = {}
+    results = []
+
+    template_root = Path(template_dir) / TEMPLATE_ROOT
+    env = _create_env(context)
+    with TemporaryDirectory() as render_dir, work_in(template_root):
+        for source_path in _iter_template_files(Path('.')):
+            path = _render_path(env, context, source_path)
+            source_hash = _hash_blob(Path(source_path).read_bytes())
+            old_entry = old_files.get(path)
+            if (
+                old_entry is not None and
+                not context_changed and
+                old_entry["source"] == source_hash
+            ):
+                # Neither the template nor the context has changed, so the
+                # file would render exactly as before
+                files[path] = old_entry
+                continue
+
+            rendered_path = Path(render_dir) / path
+            rendered_path.parent.mkdir(parents=True, exist_ok=True)
+            generate_file(
+                render_dir, source_path, {"cookiecutter": context}, env
+            )
+            data = rendered_path.read_bytes()
+            files[path] = {"source": source_hash, "rendered": _hash_blob(data)}
+            rendered[path] = data
+
+            if (
+                old_entry is not None and
+                old_entry["rendered"] == files[path]["rendered"]
+            ):
+                continue
+
+            result = _update_file(
+                repo, project_dir, path, rendered_path, old_entry, dry_run
+            )
+            if result is not None:
+                results.append(result)
+
+    for path in sorted(set(old_files) - set(files)):
+        target = project_dir / path
+        if not target.exists():
+            continue
+        if _hash_blob(target.read_bytes()) == old_files[path]["rendered"]:
+            if not dry_run:
+                target.unlink()
+            results.append(FileUpdate(path, REMOVED))
+        else:
+            results.append(
+                FileUpdate(
+                    path,
+                    SKIPPED,
+                    "removed from the template but edited, so kept",
+                )
+            )
+
+    if not dry_run:
+        _store_blobs(repo, rendered)
+        _update_base_ref(repo, files)
+        _write_state(project_dir, context, files)
+
+    return results
+
+
+def _update_file(
+    repo: 'Repo',
+    project_dir: Path,
+    path: str,
+    rendered_path: Path,
+    old_entry: Optional[Dict[str, str]],
+    dry_run: bool,
+) -> Optional[FileUpdate]:
+    """Apply a newly rendered template file to the project."""
+    target = project_dir / path
+    new = rendered_path.read_bytes()
+
+    if not target.exists():
+        if old_entry is not None:
+            return FileUpdate(path, SKIPPED, "deleted from the project")
+        if not dry_run:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(rendered_path, target)
+            shutil.copymode(rendered_path, target)
+        return FileUpdate(path, ADDED)
+
+    current = target.read_bytes()
+    current_hash = _hash_blob(current)
+    if current_hash == _hash_blob(new):
+        return None
+
+    if old_entry is not None and current_hash == old_entry["rendered"]:
+        # The user has not edited the file
+        if not dry_run:
+            target.write_bytes(new)
+            shutil.copymode(rendered_path, target)
+        return FileUpdate(path, UPDATED)
+
+    base = None
+    if old_entry is not None:
+        base = _read_blob(repo, old_entry["rendered"])
+    merged, n_conflicts = _merge(repo, current, base or b"", new)
+    if not dry_run:
+        target.write_bytes(merged)
+    if n_conflicts > 0:
+        message = f"{n_conflicts} conflict(s)"
+        if base is None:
+            message += ", previous template version not available"
+        return FileUpdate(path, CONFLICT, message)
+    return FileUpdate(path, MERGED)
+
+
+def format_update_results(results: List[FileUpdate]) -> str:
+    """Format the results of updating a project as one line per file."""
+    if len(results) == 0:
+        return "Already up to date with the template."
+    width = max(len(result.action) for result in results)
+    lines = []
+    for result in results:
+        line = f"{result.action:<{width}}  {result.path}"
+        if result.message:
+            line += f" ({result.message})"
+        lines.append(line)
+    return '\n'.join(lines)
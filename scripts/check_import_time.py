@@ -0,0 +1,118 @@
+"""Check that the cookiecutter-qtim entry point stays fast to import.
+
+Run this from the repository root after making changes to the package:
+
+    python scripts/check_import_time.py
+
+Importing the entry point module should not import any of the heavy
+dependencies of the package, which are imported only in the phases that
+use them, and should take less than IMPORT_TIME_BUDGET_MS. The import is
+measured in a fresh interpreter using python's -X importtime option, and the
+fastest of several runs is used to reduce noise.
+
+"""
+import re
+import subprocess
+import sys
+
+
+# Maximum cumulative time in milliseconds to import the entry point module
+IMPORT_TIME_BUDGET_MS = 100
+
+# Number of times the import is measured
+N_RUNS = 5
+
+ENTRY_POINT_MODULE = "cookiecutter_qtim.__main__"
+
+# Modules that must not be imported when the entry point module is imported
+DEFERRED_MODULES = [
+    "cookiecutter",
+    "git",
+    "pkg_resources",
+    "pre_commit",
+    "requests",
+    "urllib3",
+    "yaml",
+]
+
+
+def measure_import_time() -> float:
+    """Measure the time to import the entry point in a fresh interpreter.
+
+    Returns
+    -------
+    float:
+        Cumulative import time of the entry point module in milliseconds.
+
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"import {ENTRY_POINT_MODULE}",
+        ],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    exp = re.compile(
+        r"import time:\s*\d+\s*\|\s*(\d+)\s*\|\s*" +
+        re.escape(ENTRY_POINT_MODULE) + r"$"
+    )
+    for line in result.stderr.splitlines():
+        match = exp.match(line)
+        if match is not None:
+            return int(match.group(1)) / 1000
+    raise RuntimeError(f"Import time of {ENTRY_POINT_MODULE} not found.")
+
+
+def find_imported_deferred_modules() -> list:
+    """List deferred modules that are imported along with the entry point."""
+    code = (
+        "import sys\n"
+        f"import {ENTRY_POINT_MODULE}\n"
+        f"for m in {DEFERRED_MODULES!r}:\n"
+        "    if m in sys.modules:\n"
+        "        print(m)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return result.stdout.split()
+
+
+def main() -> None:
+    success = True
+
+    imported = find_imported_deferred_modules()
+    if len(imported) > 0:
+        print(
+            f"FAIL: importing {ENTRY_POINT_MODULE} also imports "
+            f"{', '.join(imported)}."
+        )
+        success = False
+
+    import_time = min(measure_import_time() for _ in range(N_RUNS))
+    if import_time > IMPORT_TIME_BUDGET_MS:
+        print(
+            f"FAIL: importing {ENTRY_POINT_MODULE} took {import_time:.1f} ms, "
+            f"the budget is {IMPORT_TIME_BUDGET_MS} ms."
+        )
+        success = False
+    else:
+        print(
+            f"Importing {ENTRY_POINT_MODULE} took {import_time:.1f} ms "
+            f"(budget {IMPORT_TIME_BUDGET_MS} ms)."
+        )
+
+    if not success:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""Tests for the validation of answers files."""
+import pytest
+
+from cookiecutter_qtim.batch import load_answers, resolve_projects
+
+
+ANSWERS = """\
+project_name: demo-proj
+dataset_dir: /tmp/dataset
+project_dir: /tmp/project
+repository: QTIM-Lab/demo-proj
+short_description: A demo project
+author: Someone
+author_email: someone@example.com
+docker_image: nvidia/cuda:12.2.0-cudnn8-runtime-ubuntu22.04
+"""
+
+
+def test_unquoted_python_version_is_rejected(tmp_path):
+    """Python versions that YAML parses as numbers are not converted."""
+    answers_file = tmp_path / "answers.yaml"
+    answers_file.write_text(ANSWERS + "python_version: 3.10\n")
+
+    with pytest.raises(ValueError, match="python_version.*quote"):
+        resolve_projects(load_answers(answers_file), offline=True)